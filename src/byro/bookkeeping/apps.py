@@ -11,3 +11,6 @@ class BookkeepingConfig(AppConfig):
             "byro.bookkeeping.invoice": _("Invoice"),
             "byro.bookkeeping.account.statement": _("Statement"),
         }
+
+    def ready(self):
+        from . import special_accounts  # noqa
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-15 05:17
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def compute_totals(apps, schema_editor):
+    Transaction = apps.get_model("bookkeeping", "Transaction")
+    Booking = apps.get_model("bookkeeping", "Booking")
+    decimal = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def total(bookings):
+        return Coalesce(
+            Subquery(
+                bookings.filter(transaction=OuterRef("pk"))
+                .order_by()
+                .values("transaction")
+                .annotate(total=Sum("amount"))
+                .values("total"),
+                output_field=decimal,
+            ),
+            Decimal("0.00"),
+            output_field=decimal,
+        )
+
+    Transaction.objects.update(
+        debit_total=total(Booking.objects.exclude(debit_account=None)),
+        credit_total=total(Booking.objects.exclude(credit_account=None)),
+    )
+    Transaction.objects.update(
+        is_balanced=models.ExpressionWrapper(
+            Q(debit_total=F("credit_total")), output_field=models.BooleanField()
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookkeeping", "0017_auto_20200818_2002"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="credit_total",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="debit_total",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="is_balanced",
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.RunPython(compute_totals, migrations.RunPython.noop),
+    ]
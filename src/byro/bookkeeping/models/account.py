@@ -1,7 +1,7 @@
 from decimal import Decimal
 
 from django.db import models
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.urls import reverse
 from django.utils.functional import classproperty
 from django.utils.safestring import mark_safe
@@ -71,37 +71,42 @@ class Account(Auditable, models.Model, LogTargetMixin):
 
     @property
     def transactions(self):
-        from byro.bookkeeping.models import Transaction
+        from byro.bookkeeping.models import Booking, Transaction
 
         return Transaction.objects.filter(
-            Q(bookings__debit_account=self) | Q(bookings__credit_account=self)
+            Exists(
+                Booking.objects.filter(
+                    Q(debit_account=self) | Q(credit_account=self),
+                    transaction=OuterRef("pk"),
+                )
+            )
         )
 
     @property
     def unbalanced_transactions(self):
-        from byro.bookkeeping.models import Transaction
+        return self.transactions.unbalanced_transactions()
 
-        return Transaction.objects.unbalanced_transactions().filter(
-            Q(bookings__debit_account=self) | Q(bookings__credit_account=self)
-        )
-
-    def _filter_by_date(self, qs, start, end):
+    def _filter_by_date(self, qs, start, end, prefix=""):
         if start:
-            qs = qs.filter(value_datetime__gte=start)
+            qs = qs.filter(**{prefix + "value_datetime__gte": start})
         if end:
-            qs = qs.filter(value_datetime__lte=end)
+            qs = qs.filter(**{prefix + "value_datetime__lte": end})
         return qs
 
     def balances(self, start=None, end=None):
         end = end or now()
-        qs = self._filter_by_date(self.transactions, start, end)
+        qs = self._filter_by_date(self.bookings, start, end, prefix="transaction__")
 
-        result = qs.with_balances().aggregate(
+        result = qs.aggregate(
             debit=models.functions.Coalesce(
-                models.Sum("balances_debit"), 0, output_field=models.DecimalField()
+                models.Sum("amount", filter=Q(debit_account=self)),
+                0,
+                output_field=models.DecimalField(),
             ),
             credit=models.functions.Coalesce(
-                models.Sum("balances_credit"), 0, output_field=models.DecimalField()
+                models.Sum("amount", filter=Q(credit_account=self)),
+                0,
+                output_field=models.DecimalField(),
             ),
         )
 
@@ -1,42 +1,59 @@
-from collections import Counter
+from collections import Counter, defaultdict
+from decimal import Decimal
 
 from django.contrib.auth import get_user_model
-from django.db import models, transaction
+from django.db import connections, models, transaction
 from django.db.models import Prefetch
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 
-from byro.common.models import LogTargetMixin, log_call
+from byro.common.models import LogTargetMixin, log_batch, log_call
 from byro.documents.models import Document
 
 
 class TransactionQuerySet(models.QuerySet):
     def with_balances(self):
-        qs = self.annotate(
-            balances_debit=models.Sum(
-                models.Case(
-                    models.When(
-                        ~models.Q(bookings__debit_account=None), then="bookings__amount"
-                    ),
-                    default=0,
-                    output_field=models.DecimalField(max_digits=8, decimal_places=2),
-                )
-            ),
-            balances_credit=models.Sum(
-                models.Case(
-                    models.When(
-                        ~models.Q(bookings__credit_account=None),
-                        then="bookings__amount",
-                    ),
-                    default=0,
-                    output_field=models.DecimalField(max_digits=8, decimal_places=2),
-                )
-            ),
+        """Annotates the debit and credit totals as ``balances_debit`` and
+        ``balances_credit``."""
+        return self.annotate(
+            balances_debit=models.F("debit_total"),
+            balances_credit=models.F("credit_total"),
         )
-        return qs
 
     def unbalanced_transactions(self):
-        return self.with_balances().exclude(balances_debit=models.F("balances_credit"))
+        return self.filter(is_balanced=False)
+
+    def update_totals(self):
+        """Recomputes the stored debit and credit totals of these transactions
+        from their bookings."""
+        bookings = Booking.objects.filter(transaction=models.OuterRef("pk"))
+        decimal = models.DecimalField(max_digits=12, decimal_places=2)
+
+        def total(bookings):
+            return Coalesce(
+                models.Subquery(
+                    bookings.values("transaction")
+                    .annotate(total=models.Sum("amount"))
+                    .values("total"),
+                    output_field=decimal,
+                ),
+                Decimal("0.00"),
+                output_field=decimal,
+            )
+
+        self.update(
+            debit_total=total(bookings.exclude(debit_account=None)),
+            credit_total=total(bookings.exclude(credit_account=None)),
+        )
+        return self.update(
+            is_balanced=models.ExpressionWrapper(
+                models.Q(debit_total=models.F("credit_total")),
+                output_field=models.BooleanField(),
+            )
+        )
 
 
 class TransactionManager(models.Manager):
@@ -49,10 +66,100 @@ class TransactionManager(models.Manager):
     def unbalanced_transactions(self):
         return self.get_queryset().unbalanced_transactions()
 
+    def update_totals(self):
+        return self.get_queryset().update_totals()
+
     @log_call(".created")
     def create(self, *args, **kwargs):
         return super().create(*args, **kwargs)
 
+    def bulk_create_with_pks(self, objs):
+        """Like ``bulk_create``, but guarantees that the primary keys are set
+        afterwards, falling back to single inserts on database backends that
+        cannot return them."""
+        if connections[self.db].features.can_return_rows_from_bulk_insert:
+            return self.bulk_create(objs)
+        for obj in objs:
+            obj.save(using=self.db)
+        return objs
+
+    @transaction.atomic
+    def bulk_reverse(self, transactions, memo=None, user=None, *, user_or_context):
+        """Reverses many transactions at once, see ``Transaction.reverse``.
+
+        Writes the same log entries, but creates the reversing transactions and
+        their bookings in bulk, so no ``post_save`` signals are sent for them,
+        and their totals are set directly. Returns the new transactions.
+        """
+        originals = list({t.pk: t for t in transactions}.values())
+        if not originals:
+            return []
+
+        bookings = defaultdict(list)
+        for b in (
+            Booking.objects.filter(transaction__in=originals)
+            .select_related("debit_account", "credit_account", "member")
+            .order_by("pk")
+        ):
+            bookings[b.transaction_id].append(b)
+
+        reversals = []
+        for t in originals:
+            debit_total = sum(
+                (b.amount for b in bookings[t.pk] if b.credit_account_id),
+                Decimal("0.00"),
+            )
+            credit_total = sum(
+                (b.amount for b in bookings[t.pk] if b.debit_account_id),
+                Decimal("0.00"),
+            )
+            reversals.append(
+                Transaction(
+                    value_datetime=t.value_datetime,
+                    reverses=t,
+                    memo=memo,
+                    debit_total=debit_total,
+                    credit_total=credit_total,
+                    is_balanced=debit_total == credit_total,
+                )
+            )
+        reversals = self.bulk_create_with_pks(reversals)
+        reversal_bookings = []
+        for original, t in zip(originals, reversals):
+            for b in bookings[original.pk]:
+                reversal_bookings.append(
+                    Booking(
+                        transaction=t,
+                        debit_account=b.credit_account,
+                        credit_account=b.debit_account,
+                        amount=b.amount,
+                        member=b.member,
+                    )
+                )
+        Booking.objects.bulk_create(reversal_bookings)
+
+        with log_batch():
+            for original, t in zip(originals, reversals):
+                t.log(
+                    user_or_context,
+                    ".created",
+                    user=user,
+                    value_datetime=t.value_datetime,
+                    reverses=original,
+                    **({"memo": memo} if memo else {}),
+                )
+                for b in bookings[original.pk]:
+                    t.log(
+                        user_or_context,
+                        ".debit.created" if b.credit_account else ".credit.created",
+                        user=user,
+                        account=b.credit_account or b.debit_account,
+                        amount=b.amount,
+                        **({"member": b.member} if b.member else {}),
+                    )
+                original.log(user_or_context, ".reversed", user=user, reversed_by=t)
+        return reversals
+
 
 class Transaction(models.Model, LogTargetMixin):
     objects = TransactionManager()
@@ -81,6 +188,36 @@ class Transaction(models.Model, LogTargetMixin):
 
     documents = models.ManyToManyField(Document, through="DocumentTransactionLink")
 
+    # Denormalized sums of the bookings, maintained when bookings are saved or
+    # deleted. Code that creates bookings in bulk has to set them itself, or
+    # call TransactionQuerySet.update_totals().
+    debit_total = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+    credit_total = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+    is_balanced = models.BooleanField(default=True, db_index=True)
+
+    TOTALS_FIELDS = ("debit_total", "credit_total", "is_balanced")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets signal handlers tell whether a save changes these values
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # Don't overwrite the totals with values that may be stale
+            kwargs["update_fields"] = [
+                f.name
+                for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.TOTALS_FIELDS
+            ]
+        return super().save(*args, **kwargs)
+
     @log_call(".debit.created", log_on="self")
     def debit(self, account, *args, **kwargs):
         if self.credits.count() > 1 and self.debits.count() > 0:
@@ -152,11 +289,7 @@ class Transaction(models.Model, LogTargetMixin):
 
     @property
     def balances(self):
-        balances = {
-            "debit": self.debits.aggregate(total=models.Sum("amount"))["total"] or 0,
-            "credit": self.credits.aggregate(total=models.Sum("amount"))["total"] or 0,
-        }
-        return balances
+        return {"debit": self.debit_total, "credit": self.credit_total}
 
     @property
     def is_read_only(self):
@@ -164,14 +297,6 @@ class Transaction(models.Model, LogTargetMixin):
         # Future proof: For now, don't modify balanced transactions
         return self.is_balanced
 
-    @property
-    def is_balanced(self):
-        if hasattr(self, "balances_debit"):
-            return self.balances_debit == self.balances_credit
-        else:
-            balances = self.balances
-            return balances["debit"] == balances["credit"]
-
     def find_memo(self):
         if self.memo:
             return self.memo
@@ -241,29 +366,10 @@ class DocumentTransactionLink(models.Model):
 
 class BookingsQuerySet(models.QuerySet):
     def with_transaction_balances(self):
-        qs = self.annotate(
-            transaction_balances_debit=models.Sum(
-                models.Case(
-                    models.When(
-                        ~models.Q(transaction__bookings__debit_account=None),
-                        then="transaction__bookings__amount",
-                    ),
-                    default=0,
-                    output_field=models.DecimalField(max_digits=8, decimal_places=2),
-                )
-            ),
-            transaction_balances_credit=models.Sum(
-                models.Case(
-                    models.When(
-                        ~models.Q(transaction__bookings__credit_account=None),
-                        then="transaction__bookings__amount",
-                    ),
-                    default=0,
-                    output_field=models.DecimalField(max_digits=8, decimal_places=2),
-                )
-            ),
+        return self.annotate(
+            transaction_balances_debit=models.F("transaction__debit_total"),
+            transaction_balances_credit=models.F("transaction__credit_total"),
         )
-        return qs
 
     def with_transaction_data(self):
         qs = self.with_transaction_balances()
@@ -333,12 +439,21 @@ class Booking(models.Model):
             memo=self.memo,
         )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets signal handlers tell whether a save changes these values
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def save(self, *args, **kwargs):
         if self.debit_account_id and self.credit_account_id:
             raise Exception("Must be either credit or debit transaction, not both!")
         if not self.debit_account_id and not self.credit_account_id:
             raise Exception("Must be either credit or debit transaction, not neither!")
-        return super().save(*args, **kwargs)
+        # The transaction totals are updated by a post_save handler
+        with transaction.atomic():
+            return super().save(*args, **kwargs)
 
     def find_memo(self):
         if self.memo:
@@ -359,3 +474,13 @@ class Booking(models.Model):
             elif self.credit_account:
                 return self.transaction.debits
         return None
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_update_transaction_totals(sender, instance, **kwargs):
+    Transaction.objects.filter(pk=instance.transaction_id).update_totals()
+    if Booking.transaction.is_cached(instance):
+        instance.transaction.refresh_from_db(
+            fields=["debit_total", "credit_total", "is_balanced"]
+        )
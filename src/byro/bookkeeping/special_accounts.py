@@ -1,16 +1,50 @@
 from contextlib import suppress
+from copy import copy
 
 import django.db.utils
 from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
 from django.utils.functional import classproperty
 from django.utils.translation import gettext_lazy as _
 
+from byro.common.cache import ProcessCache
+
 from .models import Account, AccountCategory, AccountTag
 
 
 class SpecialAccounts:
+    """Resolves the accounts byro needs for its own bookkeeping by their tag.
+
+    Resolved accounts are cached per process, see ``ProcessCache``, and handed
+    out as copies. The cache is cleared whenever an Account or AccountTag
+    changes.
+    """
+
+    _cache = ProcessCache("byro.bookkeeping.special_accounts.version")
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache.clear()
+
+    @classmethod
+    def validate_cache(cls):
+        cls._cache.validate()
+
     @classmethod
     def special_account(cls, tag, category, name=None):
+        key = (str(tag).lower(), category)
+        account = cls._cache.get(key)
+        if account is None:
+            account = cls._resolve_special_account(tag, category, name)
+            # Only cache accounts once they are committed, so that we never hand
+            # out an account that has been rolled back.
+            cls._cache.set_on_commit(key, account)
+        # Callers may change the instance they get
+        return copy(account)
+
+    @classmethod
+    def _resolve_special_account(cls, tag, category, name=None):
         tag, _ignore = AccountTag.objects.get_or_create(name=str(tag).lower())
         accounts = list(
             Account.objects.filter(account_category=category, tags=tag).all()
@@ -69,3 +103,13 @@ class SpecialAccounts:
         return cls.special_account(
             "lost_income", AccountCategory.EXPENSE, _("Lost income")
         )
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+@receiver(post_save, sender=AccountTag)
+@receiver(post_delete, sender=AccountTag)
+@receiver(m2m_changed, sender=Account.tags.through)
+@receiver(post_migrate)
+def clear_special_accounts_cache(sender, **kwargs):
+    SpecialAccounts.clear_cache()
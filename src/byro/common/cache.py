@@ -0,0 +1,84 @@
+import time
+from uuid import uuid4
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signals import request_started
+from django.db import transaction
+
+
+class ProcessCache:
+    """Values that are expensive to look up, such as resolved model instances,
+    cached within the process.
+
+    ``clear()`` empties the cache in all processes once the current
+    transaction is committed: the others notice through a version key in the
+    Django cache, which they check at the start of each request, and at most
+    ``local_timeout`` seconds after the last check otherwise, such as in
+    background tasks. This needs a Django cache that is shared between the
+    processes, see the ``[cache] location`` setting. Without one, values are
+    only kept for ``local_timeout`` seconds.
+    """
+
+    def __init__(self, version_key, local_timeout=60):
+        self.version_key = version_key
+        self.local_timeout = local_timeout
+        self.values = {}
+        self.version = None
+        self.expires = None
+        self.checked = None
+        request_started.connect(self._validate, weak=False, dispatch_uid=version_key)
+
+    @staticmethod
+    def is_shared():
+        return not isinstance(caches["default"], (DummyCache, LocMemCache))
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        if self.checked is None or self.checked + self.local_timeout <= now:
+            self.validate()
+        if self.expires is not None and self.expires <= now and not self.is_shared():
+            self.values.clear()
+            self.expires = None
+        return self.values.get(key, default)
+
+    def set_on_commit(self, key, value):
+        """Caches the value once the current transaction is committed, so that
+        values read from rolled back changes are never handed out. The value
+        is dropped if the cache is cleared in the meantime."""
+        version = self.version
+
+        def set_value():
+            if self.version == version:
+                self.values.setdefault(key, value)
+                if self.expires is None:
+                    self.expires = time.monotonic() + self.local_timeout
+
+        transaction.on_commit(set_value)
+
+    def clear(self):
+        """Empties the cache of this process now, and the caches of all
+        processes once the current transaction is committed. Until then,
+        other processes still read the old rows, and must not cache them
+        under the new version."""
+        self.values.clear()
+        self.expires = None
+        transaction.on_commit(self._publish)
+
+    def _publish(self):
+        self.values.clear()
+        self.expires = None
+        self.version = uuid4().hex
+        cache.set(self.version_key, self.version, None)
+
+    def validate(self):
+        version = cache.get(self.version_key)
+        self.checked = time.monotonic()
+        if version != self.version:
+            self.values.clear()
+            self.expires = None
+            self.version = version
+
+    def _validate(self, sender, **kwargs):
+        self.validate()
@@ -1,23 +1,94 @@
 import collections.abc
+from functools import cache as memoize
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.http import Http404
 from django.urls import resolve
 from django.utils import formats, translation
 
-from byro.bookkeeping.models import Transaction
+from byro.bookkeeping.models import Booking, Transaction
+from byro.common.cache import ProcessCache
 from byro.common.models import Configuration, LogEntry
+from byro.common.signals import log_entries_appended
 from byro.common.utils import get_version
 from byro.mails.models import EMail
 from byro.office.signals import nav_event
 
+PENDING_MAILS_KEY = "byro.common.pending_mails"
+PENDING_TRANSACTIONS_KEY = "byro.common.pending_transactions"
+LOG_END_KEY = "byro.common.log_end"
+# Writes that bypass the model signals (bulk inserts and updates) are only
+# picked up when the cached value expires
+COUNTER_TIMEOUT = 300
+
+
+def cached_value(key, compute):
+    """Returns a callable that returns the value of ``key`` from the cache,
+    computing and caching it when missing. Without a cache that is shared
+    between the processes, the value is computed for each request: the other
+    processes would not notice when it is invalidated.
+
+    Templates only call it when they display the value, and the result is
+    kept for the rest of the request."""
+
+    @memoize
+    def get():
+        if not ProcessCache.is_shared():
+            return compute()
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.set(key, value, COUNTER_TIMEOUT)
+        return value
+
+    return get
+
+
+def invalidate(*keys):
+    if not ProcessCache.is_shared():
+        return
+    cache.delete_many(keys)
+    # Until the change is committed, other requests still compute the old
+    # value, and may cache it again
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=EMail)
+@receiver(post_delete, sender=EMail)
+def invalidate_pending_mails(sender, **kwargs):
+    invalidate(PENDING_MAILS_KEY)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_pending_transactions(sender, **kwargs):
+    invalidate(PENDING_TRANSACTIONS_KEY)
+
+
+@receiver(post_save, sender=LogEntry)
+@receiver(log_entries_appended, sender=LogEntry)
+def invalidate_log_end(sender, **kwargs):
+    invalidate(LOG_END_KEY)
+
 
 def byro_information(request):
     ctx = {
         "config": Configuration.get_solo(),
-        "pending_mails": EMail.objects.filter(sent__isnull=True).count(),
-        "pending_transactions": Transaction.objects.unbalanced_transactions().count(),
-        "log_end": LogEntry.objects.get_chain_end(),
+        "pending_mails": cached_value(
+            PENDING_MAILS_KEY,
+            lambda: EMail.objects.filter(sent__isnull=True).count(),
+        ),
+        "pending_transactions": cached_value(
+            PENDING_TRANSACTIONS_KEY,
+            lambda: Transaction.objects.unbalanced_transactions().count(),
+        ),
+        "log_end": cached_value(LOG_END_KEY, LogEntry.objects.get_chain_end),
         "effective_date_format": formats.get_format(
             "SHORT_DATE_FORMAT", lang=translation.get_language()
         ),
@@ -1,8 +1,10 @@
+import gzip
+import io
 import re
 import sys
 
 import canonicaljson
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 from byro.common.models.log import LogEntry
 
@@ -25,6 +27,50 @@ class Command(BaseCommand):
             type=str,
             help="action_types for which to exclude the log 'data' member (Regex)",
         )
+        parser.add_argument(
+            "--format",
+            choices=["json", "ndjson"],
+            default="json",
+            help="json: a list, newest entry first. ndjson: one entry per line, "
+            "oldest entry first, so that exports can be appended to each other",
+        )
+        parser.add_argument(
+            "--since",
+            default=None,
+            type=str,
+            metavar="AUTH_HASH",
+            help="Only export the entries appended after the entry with this hash, "
+            "e.g. the last hash of a previous export",
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            default=None,
+            type=str,
+            help="Write to this file instead of stdout",
+        )
+        parser.add_argument(
+            "-z",
+            "--compress",
+            action="store_true",
+            help="Compress the output with gzip",
+        )
+        parser.add_argument(
+            "--batch-size",
+            default=2000,
+            type=int,
+            help="Number of entries that are read at once",
+        )
+
+    def open_output(self, options):
+        if options["output"]:
+            opener = gzip.open if options["compress"] else open
+            stream = opener(options["output"], "wb")
+        elif options["compress"]:
+            stream = gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb")
+        else:
+            stream = sys.stdout.buffer
+        return io.TextIOWrapper(stream, encoding="utf-8", write_through=True)
 
     def handle(self, *args, **options):
         include_re = re.compile(options["data_include_actions"])
@@ -33,36 +79,75 @@ class Command(BaseCommand):
             if options["data_exclude_actions"]
             else None
         )
+        since = options["since"]
+        if since and not LogEntry.objects.filter(auth_hash=since).exists():
+            raise CommandError(f"No log entry with hash {since}.")
 
-        outstream = sys.stdout
-
-        outstream.write("[")
-        is_first = True
-        last = None
-        current = LogEntry.objects.get_chain_end()
-
-        while current and current != last:
+        def export(entry):
             data = {
-                "hash": current.auth_hash,
-                "entry": current.get_authenticated_dict(),
+                "hash": entry.auth_hash,
+                "entry": entry.get_authenticated_dict(),
             }
-
-            if include_re.search(current.action_type) and (
-                exclude_re is None or not exclude_re.search(current.action_type)
+            if include_re.search(entry.action_type) and (
+                exclude_re is None or not exclude_re.search(entry.action_type)
             ):
-                data["data"] = current.data
+                data["data"] = entry.data
+            return data
 
-            data_pretty = canonicaljson.encode_pretty_printed_json(data).decode("utf-8")
-
-            if not is_first:
-                outstream.write(",\n    ")
-            else:
-                outstream.write("\n    ")
-
-            outstream.write("\n    ".join(data_pretty.split("\n")))
+        ndjson = options["format"] == "ndjson"
+        batch_size = options["batch_size"]
+        # The chain is walked from its end through auth_prev, which only
+        # needs the hashes. The entries are then read in the export order.
+        pks = []
+        last = None
+        end = LogEntry.objects.get_chain_end()
+        if end is not None:
+            walk = LogEntry.objects.only("pk", "auth_hash", "auth_prev").chain(
+                end, stop=since, batch_size=batch_size
+            )
+            for batch in walk:
+                pks += [entry.pk for entry in batch]
+                last = batch[-1]
+        if since and last is not None and last.auth_prev_id != since:
+            raise CommandError(f"The log entry {since} is not part of the chain.")
+        if ndjson:
+            pks.reverse()
 
-            is_first = False
-            last = current
-            current = current.auth_prev
+        def batches():
+            qs = LogEntry.objects.defer("content_type", "user")
+            for start in range(0, len(pks), batch_size):
+                chunk = pks[start : start + batch_size]
+                entries = qs.in_bulk(chunk)
+                yield [entries[pk] for pk in chunk]
 
-        outstream.write("\n]\n")
+        outstream = self.open_output(options)
+        try:
+            if ndjson:
+                for batch in batches():
+                    outstream.write(
+                        "".join(
+                            canonicaljson.encode_canonical_json(export(entry)).decode()
+                            + "\n"
+                            for entry in batch
+                        )
+                    )
+            else:
+                outstream.write("[")
+                separator = "\n    "
+                for batch in batches():
+                    chunk = []
+                    for entry in batch:
+                        data_pretty = canonicaljson.encode_pretty_printed_json(
+                            export(entry)
+                        ).decode("utf-8")
+                        chunk.append(separator)
+                        chunk.append("\n    ".join(data_pretty.split("\n")))
+                        separator = ",\n    "
+                    outstream.write("".join(chunk))
+                outstream.write("\n]\n")
+        finally:
+            outstream.flush()
+            if options["output"] or options["compress"]:
+                outstream.close()
+            else:
+                outstream.detach()
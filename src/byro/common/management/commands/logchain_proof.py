@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from byro.common import merkle
+from byro.common.models.log import LogChainSegment, LogEntry
+
+
+class Command(BaseCommand):
+    help = "Print the Merkle inclusion proof of a log entry in JSON format"
+
+    def add_arguments(self, parser):
+        parser.add_argument("auth_hash", type=str, help="Hash of the log entry")
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Also check the proof, and recompute the root of its segment",
+        )
+
+    def handle(self, *args, **options):
+        entry = LogEntry.objects.filter(auth_hash=options["auth_hash"]).first()
+        if entry is None:
+            raise CommandError(f"No log entry with hash {options['auth_hash']}.")
+
+        proof = entry.get_inclusion_proof()
+        if proof is None:
+            raise CommandError(
+                "The entry is not part of a closed segment yet. Segments are "
+                f"closed once {LogChainSegment.objects.SEGMENT_SIZE} entries "
+                "have been appended."
+            )
+        self.stdout.write(json.dumps(proof, indent=2, sort_keys=True))
+
+        if options["verify"]:
+            segment = LogChainSegment.objects.filter(
+                root=proof["segment"]["root"],
+                signature=proof["segment"]["signature"],
+            ).first()
+            if segment is None:
+                raise CommandError("The proof does not belong to a segment.")
+            if not merkle.verify_proof(proof) or not segment.verify():
+                raise CommandError("The proof does not match the segment root.")
+            self.stderr.write("The proof matches the segment root.")
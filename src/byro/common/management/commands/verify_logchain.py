@@ -0,0 +1,152 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from byro.common.models.log import LogChainCheckpoint, LogEntry
+
+
+def verify_entries(entries):
+    """Returns the hashes of the entries whose data MAC or hash does not
+    match. Runs in the worker processes."""
+    return [entry.auth_hash for entry in entries if not entry.verify()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify the log-chain. Only entries appended since the last checkpoint "
+        "are verified, unless --full is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Verify all entries, not only those after the last checkpoint",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            default=os.cpu_count() or 1,
+            type=int,
+            help="Number of processes that verify entries (default: all CPUs)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            default=2000,
+            type=int,
+            help="Number of entries that are read and verified at once",
+        )
+        parser.add_argument(
+            "--no-checkpoint",
+            action="store_true",
+            help="Do not record a checkpoint after a successful verification",
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        # Entries appended while the chain is verified are left for the next run
+        end = LogEntry.objects.get_chain_end()
+        if end is None:
+            self.stdout.write("The log-chain is empty.")
+            return
+        checkpoint = (
+            None if options["full"] else LogChainCheckpoint.objects.get_latest()
+        )
+        if checkpoint is not None:
+            stop = checkpoint.entry_id
+            length = checkpoint.length
+            self.stdout.write(
+                f"Verifying entries after checkpoint {checkpoint.pk} "
+                f"({checkpoint.length} entries, {checkpoint.created:%Y-%m-%d %H:%M:%S})"
+            )
+        else:
+            stop, length = None, 0
+
+        if options["jobs"] > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=options["jobs"], initializer=django.setup
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=1)
+
+        problems = 0
+        verified = 0
+        legacy = 0
+        pending = deque()
+        last = None
+
+        def report(message):
+            nonlocal problems
+            problems += 1
+            self.stdout.write(message)
+
+        def collect():
+            for auth_hash in pending.popleft().result():
+                report(f"Entry {auth_hash}: hash or data MAC mismatch")
+
+        with executor:
+            # The chain is walked from its end back to the checkpoint
+            batches = LogEntry.objects.select_related("content_type").chain(
+                end, stop=stop, batch_size=options["batch_size"]
+            )
+            try:
+                for batch in batches:
+                    to_verify = []
+                    for entry in batch:
+                        if entry.is_legacy:
+                            # Migrated entries from before the log chain
+                            legacy += 1
+                        elif legacy:
+                            report(
+                                f"Entry {entry.auth_hash}: precedes an entry from "
+                                "before the log chain"
+                            )
+                        else:
+                            to_verify.append(entry)
+                        last = entry
+                    verified += len(batch)
+                    pending.append(executor.submit(verify_entries, to_verify))
+                    if len(pending) > 2 * options["jobs"]:
+                        collect()
+            except ValueError as e:
+                report(str(e))
+            while pending:
+                collect()
+
+        # The walk ends at the checkpoint, or at the initial entry
+        if last is not None and last.auth_prev_id != (stop or last.auth_hash):
+            if stop is not None:
+                report(f"Checkpoint entry {stop} is not part of the chain")
+            else:
+                report(f"Entry {last.auth_hash}: the chain does not start here")
+
+        seconds = time.monotonic() - start
+        self.stdout.write(
+            f"Verified {verified} entries in {seconds:.1f}s "
+            f"({verified / seconds if seconds else 0:.0f} entries/s)"
+        )
+        if legacy:
+            self.stdout.write(
+                f"{legacy} entries from before the log chain cannot be verified."
+            )
+        if stop is None:
+            # Left behind by concurrent appends in older versions
+            unlinked = LogEntry.objects.filter(pk__lte=end.pk).count() - verified
+            if unlinked > 0:
+                self.stdout.write(f"{unlinked} entries are not part of the chain.")
+        if problems:
+            raise CommandError(f"The log-chain is broken, {problems} problems found.")
+
+        if verified and not options["no_checkpoint"]:
+            checkpoint = LogChainCheckpoint(
+                entry_id=end.auth_hash, length=length + verified
+            )
+            checkpoint.sign()
+            checkpoint.save()
+            self.stdout.write(
+                f"Recorded checkpoint {checkpoint.pk} at {checkpoint.length} entries."
+            )
@@ -0,0 +1,82 @@
+"""Merkle trees over log chain entries, as specified for Certificate
+Transparency in RFC 9162, section 2.1, with blake2b as the hash function.
+
+The leaves are the ``auth_hash`` strings of the entries. Hashes are passed
+around as bytes and stored as hex strings.
+"""
+
+import nacl.encoding
+import nacl.hash
+
+
+def _hash(data):
+    return nacl.hash.blake2b(data, digest_size=32, encoder=nacl.encoding.RawEncoder)
+
+
+def leaf_hash(auth_hash):
+    return _hash(b"\x00" + auth_hash.encode("us-ascii"))
+
+
+def node_hash(left, right):
+    return _hash(b"\x01" + left + right)
+
+
+def _split(size):
+    """Returns the largest power of two smaller than ``size``."""
+    return 1 << ((size - 1).bit_length() - 1)
+
+
+def root(leaves):
+    """Returns the root hash over a list of leaf hashes."""
+    if not leaves:
+        return _hash(b"")
+    if len(leaves) == 1:
+        return leaves[0]
+    k = _split(len(leaves))
+    return node_hash(root(leaves[:k]), root(leaves[k:]))
+
+
+def inclusion_proof(leaves, index):
+    """Returns the audit path of the leaf at ``index``: the hashes needed to
+    compute the root from that leaf, ``log2(len(leaves))`` at most."""
+    if len(leaves) <= 1:
+        return []
+    k = _split(len(leaves))
+    if index < k:
+        return inclusion_proof(leaves[:k], index) + [root(leaves[k:])]
+    return inclusion_proof(leaves[k:], index - k) + [root(leaves[:k])]
+
+
+def verify_inclusion(leaf, index, size, path, expected_root):
+    """Checks that ``leaf`` is the leaf at ``index`` of the tree of ``size``
+    leaves with the given root, using its audit path."""
+    if index >= size:
+        return False
+    fn, sn = index, size - 1
+    result = leaf
+    for sibling in path:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            result = node_hash(sibling, result)
+            while not fn & 1 and fn:
+                fn >>= 1
+                sn >>= 1
+        else:
+            result = node_hash(result, sibling)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and result == expected_root
+
+
+def verify_proof(proof):
+    """Checks an inclusion proof as returned by
+    ``LogEntry.get_inclusion_proof``. The segment root still has to be
+    compared to a trusted copy."""
+    return verify_inclusion(
+        leaf_hash(proof["hash"]),
+        proof["index"],
+        proof["segment"]["size"],
+        [bytes.fromhex(node) for node in proof["path"]],
+        bytes.fromhex(proof["segment"]["root"]),
+    )
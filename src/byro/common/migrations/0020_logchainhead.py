@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-15 05:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def create_chain_head(apps, schema_editor):
+    LogEntry = apps.get_model("common", "LogEntry")
+    LogChainHead = apps.get_model("common", "LogChainHead")
+    end = (
+        LogEntry.objects.filter(Q(auth_next=None) | Q(auth_prev_id=F("auth_hash")))
+        .order_by("-datetime", "-id")
+        .first()
+    )
+    LogChainHead.objects.create(pk=1, entry_id=end.auth_hash if end else None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0019_auto_20211208_2021"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LogChainHead",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="common.logentry",
+                        to_field="auth_hash",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(create_chain_head, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-15 05:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0020_logchainhead"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LogChainCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("length", models.PositiveIntegerField()),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+                ("signature", models.CharField(max_length=100)),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="common.logentry",
+                        to_field="auth_hash",
+                    ),
+                ),
+            ],
+        ),
+    ]
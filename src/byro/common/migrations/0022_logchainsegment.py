@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-15 05:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0021_logchaincheckpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LogChainSegment",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("size", models.PositiveIntegerField()),
+                ("root", models.CharField(max_length=64)),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "first",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="common.logentry",
+                    ),
+                ),
+                (
+                    "last",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="common.logentry",
+                    ),
+                ),
+            ],
+        ),
+    ]
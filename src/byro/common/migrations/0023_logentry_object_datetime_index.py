@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-15 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0022_logchainsegment"),
+    ]
+
+    operations = [
+        # Add the new index first: MySQL needs an index on the content_type
+        # foreign key at all times
+        migrations.AddIndex(
+            model_name="logentry",
+            index=models.Index(
+                fields=["content_type", "object_id", "datetime"],
+                name="common_loge_content_aa5d22_idx",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="logentry",
+            name="common_loge_content_43b532_idx",
+        ),
+    ]
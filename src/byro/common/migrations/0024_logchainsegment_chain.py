@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-15 06:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def delete_segments(apps, schema_editor):
+    # Segments were built in primary key order, which is not always the chain
+    # order. They are rebuilt by the periodic task.
+    LogChainSegment = apps.get_model("common", "LogChainSegment")
+    LogChainSegment.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0023_logentry_object_datetime_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_segments, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="logchainsegment",
+            name="prev",
+            field=models.OneToOneField(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="next",
+                to="common.logchainsegment",
+            ),
+        ),
+        migrations.AddField(
+            model_name="logchainsegment",
+            name="entries",
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name="logchainsegment",
+            name="min_entry_pk",
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="logchainsegment",
+            name="max_entry_pk",
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="logchainsegment",
+            name="signature",
+            field=models.CharField(default="", max_length=100),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="logchainsegment",
+            index=models.Index(
+                fields=["min_entry_pk", "max_entry_pk"],
+                name="common_logc_min_ent_bfa0e5_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-15 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0024_logchainsegment_chain"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="logentry",
+            index=models.Index(
+                fields=["action_type"],
+                name="common_loge_action_pattern_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="logentry",
+            name="common_loge_action__1810d9_idx",
+        ),
+    ]
@@ -1,4 +1,4 @@
 from .configuration import Configuration
-from .log import LogEntry, LogTargetMixin, log_call
+from .log import LogEntry, LogTargetMixin, log_batch, log_call
 
-__all__ = ["Configuration", "LogEntry", "LogTargetMixin", "log_call"]
+__all__ = ["Configuration", "LogEntry", "LogTargetMixin", "log_batch", "log_call"]
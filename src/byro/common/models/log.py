@@ -1,7 +1,9 @@
 import base64
 import datetime
 import decimal
+import threading
 import uuid
+from contextlib import contextmanager, nullcontext
 from functools import wraps
 
 import canonicaljson
@@ -10,12 +12,16 @@ import nacl.utils
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.core.signing import Signer
+from django.db import connections, models, router, transaction
 from django.db.models import F, Q
 from django.db.models.signals import pre_delete, pre_save
 from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
 from django.utils.timezone import now
 
+from byro.common import merkle
+from byro.common.signals import log_entries_appended, periodic_task
 from byro.common.utils import get_installed_software
 
 
@@ -32,18 +38,323 @@ class ContentObjectManager(models.Manager):
         return super().filter(*args, **kwargs)
 
 
-class LogEntryManager(ContentObjectManager):
-    """Manager that is linking the log chain on .create()"""
-
-    def create(self, *args, **kwargs):
-        kwargs["auth_prev"] = self.get_chain_end()
-        return super().create(*args, **kwargs)
+class LogEntryQuerySet(models.QuerySet):
+    def chain(self, end, stop=None, batch_size=2000):
+        """Yields the entries of the log chain in lists of up to
+        ``batch_size``, newest first: from ``end`` back to the initial entry,
+        or to the entry after the one with the hash ``stop``.
+
+        The chain is followed through ``auth_prev``, so entries that are not
+        part of it are skipped. The entries preceding an entry usually have
+        lower primary keys, so they are fetched in ranges of primary keys
+        below it, and looked up by hash otherwise."""
+        qs = self.order_by("-pk")
+        limit = None
+        count = 0
+        window = {}
+        batch = []
+        auth_hash = end.auth_hash
+        while auth_hash != stop:
+            entry = window.pop(auth_hash, None)
+            if entry is None:
+                entry = qs.get(auth_hash=auth_hash)
+                window = {
+                    e.auth_hash: e for e in qs.filter(pk__lt=entry.pk)[:batch_size]
+                }
+            batch.append(entry)
+            count += 1
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+                if limit is None:
+                    limit = self.count()
+                if count > limit:
+                    raise ValueError("The log chain contains a loop.")
+            if entry.auth_prev_id == entry.auth_hash:
+                break
+            auth_hash = entry.auth_prev_id
+        if batch:
+            yield batch
+
+
+class LogEntryManager(ContentObjectManager.from_queryset(LogEntryQuerySet)):
+    """Manager for log entries. New entries are linked to the end of the log
+    chain when they are saved."""
 
     def get_chain_end(self):
+        head = LogChainHead.objects.select_related("entry").filter(pk=1).first()
+        if head is None:
+            return self.find_chain_end()
+        return head.entry
+
+    def bulk_append(self, entries):
+        """Appends unsaved entries to the log chain, in the given order, with
+        a single insert. The entries are linked and hashed exactly like
+        entries saved one after the other. No ``pre_save``/``post_save``
+        signals are sent, but ``log_entries_appended``."""
+        entries = list(entries)
+        if not entries:
+            return entries
+        if not LogChainHead.objects.table_exists():
+            for entry in entries:
+                entry.save(using=self.db)
+            return entries
+
+        for entry in entries:
+            entry._check_source()
+        with chain_head(self.db) as head:
+            prev = head.entry_id
+            for entry in entries:
+                entry.auth_prev_id = prev
+                entry._compute_logchain()
+                prev = entry.auth_hash
+            self.bulk_create(entries, batch_size=BULK_APPEND_BATCH_SIZE)
+            LogChainHead.objects.filter(pk=head.pk).update(entry_id=prev)
+        log_entries_appended.send(sender=self.model, entries=entries)
+        return entries
+
+    def find_chain_end(self):
+        """Finds the end of the chain by searching all entries, without using
+        the stored chain head."""
         return self.filter(Q(auth_next=None) | Q(auth_prev_id=F("auth_hash"))).first()
 
 
+class LogChainHeadManager(models.Manager):
+    _table_exists = False
+
+    def table_exists(self):
+        """Older migrations already write log entries, before the chain head
+        table has been created."""
+        if not LogChainHeadManager._table_exists:
+            LogChainHeadManager._table_exists = (
+                self.model._meta.db_table
+                in connections[self.db].introspection.table_names()
+            )
+        return LogChainHeadManager._table_exists
+
+    def lock(self):
+        """Returns the chain head, locked until the end of the current
+        transaction. Creates it on first use.
+
+        The row is written to before it is read, which takes the write lock
+        on all backends: SQLite ignores ``select_for_update()``, and would
+        otherwise let two writers read the same head."""
+        if not self.filter(pk=1).update(entry_id=F("entry_id")):
+            end = LogEntry.objects.find_chain_end()
+            self.get_or_create(
+                pk=1, defaults={"entry_id": end.auth_hash if end else None}
+            )
+        return self.select_for_update().get(pk=1)
+
+
+class LogChainHead(models.Model):
+    """The last entry of the log chain, so that appending to the chain does
+    not need to search the log table. A single row, which is locked while an
+    entry is appended."""
+
+    entry = models.ForeignKey(
+        "LogEntry",
+        to_field="auth_hash",
+        # Log entries cannot be deleted, see log_entry_pre_delete
+        on_delete=models.DO_NOTHING,
+        related_name="+",
+        null=True,
+    )
+
+    objects = LogChainHeadManager()
+
+
+class LogChainCheckpointManager(models.Manager):
+    def get_latest(self):
+        """Returns the latest checkpoint, or ``None`` if there is none or its
+        signature is not valid."""
+        checkpoint = self.select_related("entry").order_by("-pk").first()
+        if checkpoint is None or not checkpoint.has_valid_signature():
+            return None
+        return checkpoint
+
+
+class LogChainCheckpoint(models.Model):
+    """An entry up to which the log chain has been verified, see the
+    ``verify_logchain`` command. ``length`` is the number of entries up to and
+    including it. Checkpoints are signed with the secret key, so that they
+    cannot be moved forward without it."""
+
+    entry = models.ForeignKey(
+        "LogEntry",
+        to_field="auth_hash",
+        on_delete=models.DO_NOTHING,
+        related_name="+",
+    )
+    length = models.PositiveIntegerField()
+    created = models.DateTimeField(default=now)
+    signature = models.CharField(max_length=100)
+
+    objects = LogChainCheckpointManager()
+
+    def get_signed_value(self):
+        return f"{self.entry_id}:{self.length}:{self.created.isoformat()}"
+
+    def sign(self):
+        self.signature = Signer(salt=CHECKPOINT_SALT).signature(self.get_signed_value())
+
+    def has_valid_signature(self):
+        return constant_time_compare(
+            self.signature,
+            Signer(salt=CHECKPOINT_SALT).signature(self.get_signed_value()),
+        )
+
+
+class LogChainSegmentManager(models.Manager):
+    SEGMENT_SIZE = 1024
+
+    def close(self):
+        """Creates segments of ``SEGMENT_SIZE`` entries each over the entries
+        of the chain that are not part of a segment yet. Remaining entries
+        are left for a later call. Returns the new segments."""
+        end = LogEntry.objects.get_chain_end()
+        if end is None:
+            return []
+        prev = self.select_related("last").order_by("-pk").first()
+        walk = LogEntry.objects.only("pk", "auth_hash", "auth_prev").chain(
+            end, stop=prev.last.auth_hash if prev else None
+        )
+        entries = [(entry.pk, entry.auth_hash) for batch in walk for entry in batch]
+        entries.reverse()
+
+        segments = []
+        size = self.SEGMENT_SIZE
+        for start in range(0, len(entries) - size + 1, size):
+            pks, hashes = zip(*entries[start : start + size])
+            prev = self.model(
+                prev=prev,
+                first_id=pks[0],
+                last_id=pks[-1],
+                size=size,
+                root=merkle.root([merkle.leaf_hash(h) for h in hashes]).hex(),
+                entries=list(pks),
+                min_entry_pk=min(pks),
+                max_entry_pk=max(pks),
+            )
+            prev.sign()
+            prev.save()
+            segments.append(prev)
+        return segments
+
+    def get_for_entry(self, entry):
+        # Segments usually cover ranges of primary keys that do not overlap,
+        # except for entries from before the log chain
+        candidates = self.select_related("first", "last", "prev").filter(
+            min_entry_pk__lte=entry.pk, max_entry_pk__gte=entry.pk
+        )
+        return next((s for s in candidates if entry.pk in s.entries), None)
+
+
+class LogChainSegment(models.Model):
+    """A Merkle tree over ``size`` consecutive entries of the log chain, from
+    ``first`` to ``last``. ``entries`` holds the primary keys of the entries,
+    in chain order.
+
+    Segments are signed with the secret key, together with the signature of
+    the previous segment, so that a segment cannot be changed, or left out,
+    without it. An entry can be shown to be part of the chain with an
+    inclusion proof against the ``root`` of its segment, see
+    ``LogEntry.get_inclusion_proof``."""
+
+    prev = models.OneToOneField(
+        "self", on_delete=models.PROTECT, related_name="next", null=True
+    )
+    first = models.OneToOneField(
+        "LogEntry", on_delete=models.DO_NOTHING, related_name="+"
+    )
+    last = models.OneToOneField(
+        "LogEntry", on_delete=models.DO_NOTHING, related_name="+"
+    )
+    size = models.PositiveIntegerField()
+    root = models.CharField(max_length=64)
+    entries = models.JSONField(default=list)
+    min_entry_pk = models.PositiveIntegerField()
+    max_entry_pk = models.PositiveIntegerField()
+    created = models.DateTimeField(default=now)
+    signature = models.CharField(max_length=100)
+
+    objects = LogChainSegmentManager()
+
+    class Meta:
+        indexes = [models.Index(fields=["min_entry_pk", "max_entry_pk"])]
+
+    def get_signed_value(self):
+        return ":".join(
+            [
+                self.first.auth_hash,
+                self.last.auth_hash,
+                str(self.size),
+                self.root,
+                self.created.isoformat(),
+                self.prev.signature if self.prev else "",
+            ]
+        )
+
+    def sign(self):
+        self.signature = Signer(salt=SEGMENT_SALT).signature(self.get_signed_value())
+
+    def has_valid_signature(self):
+        return constant_time_compare(
+            self.signature,
+            Signer(salt=SEGMENT_SALT).signature(self.get_signed_value()),
+        )
+
+    def get_entry_hashes(self):
+        hashes = dict(
+            LogEntry.objects.filter(pk__in=self.entries).values_list("pk", "auth_hash")
+        )
+        return [hashes.get(pk) for pk in self.entries]
+
+    def verify(self):
+        """Checks the signature, and recomputes the root from the entries of
+        the segment. Also checks that the entries continue the chain at the
+        end of the previous segment."""
+        if not self.has_valid_signature() or len(self.entries) != self.size:
+            return False
+        entries = LogEntry.objects.only("pk", "auth_hash", "auth_prev").in_bulk(
+            self.entries
+        )
+        if len(entries) != self.size:
+            return False
+        prev = self.prev.last.auth_hash if self.prev else None
+        leaves = []
+        for pk in self.entries:
+            entry = entries[pk]
+            if entry.auth_prev_id != (prev or entry.auth_hash):
+                return False
+            prev = entry.auth_hash
+            leaves.append(merkle.leaf_hash(entry.auth_hash))
+        return merkle.root(leaves).hex() == self.root
+
+
 PERSON_BYTES = b"byro logchain v1"
+CHECKPOINT_SALT = "byro.common.logchain.checkpoint"
+SEGMENT_SALT = "byro.common.logchain.segment"
+BULK_APPEND_BATCH_SIZE = 500
+
+_append_lock = threading.Lock()
+_batch = threading.local()
+
+
+@contextmanager
+def chain_head(using):
+    """Locks the chain head for appending, until the end of the block.
+
+    Appends that start their own transaction are also serialized within the
+    process, so that its threads queue up here instead of on the database
+    lock. Appends within a larger transaction must not wait for this lock
+    while holding the database lock."""
+    if connections[using].in_atomic_block:
+        lock = nullcontext()
+    else:
+        lock = _append_lock
+    with lock, transaction.atomic(using=using):
+        yield LogChainHead.objects.db_manager(using).lock()
 
 
 class LogEntry(models.Model):
@@ -94,8 +405,14 @@ class LogEntry(models.Model):
     class Meta:
         ordering = ("-datetime", "-id")
         indexes = [
-            models.Index(fields=["content_type", "object_id"]),
-            models.Index(fields=["action_type"]),
+            models.Index(fields=["content_type", "object_id", "datetime"]),
+            # The pattern operator class lets PostgreSQL use the index for
+            # prefix searches, other databases ignore it
+            models.Index(
+                fields=["action_type"],
+                name="common_loge_action_pattern_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
         ]
 
     def delete(self, using=None, keep_parents=False):
@@ -115,19 +432,36 @@ class LogEntry(models.Model):
             if getattr(self, "pk", None):
                 raise TypeError("Logs cannot be modified.")
 
-            if not self.data:
-                self.data = {}
-
-            if self.user:
-                self.data.setdefault("source", str(self.user))
+            self._check_source()
 
-            if not self.data.get("source"):
-                raise ValueError("Need to provide at least user or data['source']")
+            if not LogChainHead.objects.table_exists():
+                if not self.auth_prev_id:
+                    end = LogEntry.objects.find_chain_end()
+                    self.auth_prev_id = end.auth_hash if end else None
+                self._compute_logchain()
+                return super().save(*args, **kwargs)
 
-            self._compute_logchain()
+            using = kwargs.get("using") or router.db_for_write(type(self))
+            with chain_head(using) as head:
+                if not self.auth_prev_id:
+                    self.auth_prev_id = head.entry_id
+                self._compute_logchain()
+                result = super().save(*args, **kwargs)
+                LogChainHead.objects.filter(pk=head.pk).update(entry_id=self.auth_hash)
+            return result
 
         return super().save(*args, **kwargs)
 
+    def _check_source(self):
+        if not self.data:
+            self.data = {}
+
+        if self.user:
+            self.data.setdefault("source", str(self.user))
+
+        if not self.data.get("source"):
+            raise ValueError("Need to provide at least user or data['source']")
+
     def _compute_logchain(self):
         hashed_data_dict = dict(self.data)
         hdd_encoded = canonicaljson.encode_canonical_json(hashed_data_dict)
@@ -181,8 +515,42 @@ class LogEntry(models.Model):
             "source": self.data["source"],
         }
 
+    def get_inclusion_proof(self):
+        """Returns the proof that this entry is part of the root of its log
+        chain segment, or ``None`` if it is not part of a segment yet. See
+        ``byro.common.merkle.verify_proof``."""
+        segment = LogChainSegment.objects.get_for_entry(self)
+        if segment is None:
+            return None
+        hashes = segment.get_entry_hashes()
+        index = segment.entries.index(self.pk)
+        leaves = [merkle.leaf_hash(auth_hash) for auth_hash in hashes]
+        return {
+            "hash": self.auth_hash,
+            "index": index,
+            "path": [node.hex() for node in merkle.inclusion_proof(leaves, index)],
+            "segment": {
+                "first": segment.first.auth_hash,
+                "last": segment.last.auth_hash,
+                "size": segment.size,
+                "root": segment.root,
+                "created": segment.created.isoformat(),
+                "signature": segment.signature,
+                "prev_signature": segment.prev.signature if segment.prev else None,
+            },
+        }
+
+    @property
+    def is_legacy(self):
+        """Entries from before the log chain was introduced have a random
+        hash and no authentication data, and cannot be verified."""
+        return self.auth_hash.startswith("random:")
+
     def verify(self):
-        if self.auth_data["hash_ver"] not in (1, 2):
+        if self.auth_data.get("hash_ver") not in (1, 2) or any(
+            key not in self.auth_data
+            for key in ("nonce", "data_mac", "orig_content_type", "orig_user_id")
+        ):
             return False
 
         if (
@@ -234,6 +602,11 @@ def log_entry_pre_save(sender, instance, *args, **kwargs):
         raise TypeError("Logs cannot be modified.")
 
 
+@receiver(periodic_task)
+def close_log_chain_segments(sender, **kwargs):
+    LogChainSegment.objects.close()
+
+
 @receiver(pre_delete, sender=LogEntry)
 def log_entry_pre_delete(sender, instance, *args, **kwargs):
     if instance.pk:
@@ -284,14 +657,75 @@ class LogTargetMixin:
 
         kwargs = flatten_objects(kwargs)
 
-        LogEntry.objects.create(
+        entry = LogEntry(
             content_object=self, user=user, action_type=action, data=dict(kwargs)
         )
+        batch = _current_batch()
+        if batch is not None:
+            batch.append((entry, _rollback_marker()))
+        else:
+            entry.save(force_insert=True)
 
     def log_entries(self):
         return LogEntry.objects.filter(content_object=self)
 
 
+def _current_batch():
+    """Returns the list that entries logged now are collected in, as
+    ``(entry, marker)`` pairs, or ``None`` outside of a ``log_batch``
+    block."""
+    return getattr(_batch, "entries", None)
+
+
+def _rollback_marker():
+    """Returns a callback registered with ``transaction.on_commit`` within the
+    innermost savepoint that was created inside the ``log_batch`` block, or
+    ``None`` if there is none. Django discards the callbacks of a savepoint
+    when it is rolled back, so the marker tells whether entries logged
+    within it are still valid."""
+    connection = transaction.get_connection(router.db_for_write(LogEntry))
+    if len(connection.savepoint_ids) <= _batch.savepoints:
+        return None
+    sid = connection.savepoint_ids[-1]
+    marker = _batch.markers.get(sid)
+    if marker is None:
+        marker = _batch.markers[sid] = lambda: None
+        transaction.on_commit(marker, using=connection.alias)
+    return marker
+
+
+@contextmanager
+def log_batch():
+    """Collects the entries logged with ``LogTargetMixin.log`` within the
+    block, and appends them to the log chain at once at the end of the block,
+    in the order they were logged, see ``LogEntryManager.bulk_append``.
+
+    The block runs in a transaction, so that the logged changes are rolled
+    back together with their entries if it fails. Entries logged within an
+    atomic block inside it are left out if that block is rolled back on its
+    own. Nested blocks join the enclosing one. Entries are not visible in the
+    database before the end of the block."""
+    if _current_batch() is not None:
+        yield
+        return
+    using = router.db_for_write(LogEntry)
+    with transaction.atomic(using=using):
+        connection = transaction.get_connection(using)
+        _batch.entries = []
+        _batch.savepoints = len(connection.savepoint_ids)
+        _batch.markers = {}
+        try:
+            yield
+            entries = _batch.entries
+        finally:
+            del _batch.entries, _batch.savepoints, _batch.markers
+        # Rolling back a savepoint removes its callbacks from this list
+        valid = {func for sids, func, robust in connection.run_on_commit}
+        LogEntry.objects.bulk_append(
+            entry for entry, marker in entries if marker is None or marker in valid
+        )
+
+
 def log_call(action, log_on="retval"):
     def outer_decorator(f):
         @wraps(f)
@@ -36,6 +36,15 @@ CONFIG = {
         "password": {"default": "", "env": os.getenv("BYRO_MAIL_PASSWORD")},
         "tls": {"default": "False", "env": os.getenv("BYRO_MAIL_TLS")},
         "ssl": {"default": "False", "env": os.getenv("BYRO_MAIL_SSL")},
+        "batch_size": {"default": "100", "env": os.getenv("BYRO_MAIL_BATCH_SIZE")},
+        "rate_limit": {"default": "0", "env": os.getenv("BYRO_MAIL_RATE_LIMIT")},
+    },
+    "cache": {
+        "location": {"default": "", "env": os.getenv("BYRO_CACHE_LOCATION")},
+    },
+    "celery": {
+        "broker": {"default": "", "env": os.getenv("BYRO_CELERY_BROKER")},
+        "backend": {"default": "", "env": os.getenv("BYRO_CELERY_BACKEND")},
     },
     "logging": {
         "email": {"default": "", "env": os.getenv("BYRO_LOGGING_EMAIL")},
@@ -25,3 +25,11 @@ log_formatters = django.dispatch.Signal()
 This signal is used to compile a list of log entry formatters.
 The return value must be a mapping of action_type: callable(LogEntry) -> html_fragment: str
 """
+
+log_entries_appended = django.dispatch.Signal()
+"""
+This signal is sent with ``sender=LogEntry`` after a batch of log entries has
+been appended to the log chain with a single insert, see
+``byro.common.models.log.log_batch``. The entries are passed as ``entries``.
+No ``post_save`` signals are sent for these entries.
+"""
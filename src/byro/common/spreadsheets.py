@@ -0,0 +1,178 @@
+"""Writers for spreadsheet files that keep memory usage constant, regardless
+of the number of rows.
+
+Both writers take a file object opened for binary writing, a list of column
+titles, and an iterable of rows (lists of values). Numbers, dates and booleans
+are written as native cells, amounts (``Decimal`` and ``float``) use the same
+two-decimal format with thousands separators as the CSV export.
+"""
+
+import datetime
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape, quoteattr
+
+import xlsxwriter
+from django.utils import timezone
+
+ODS_MIMETYPE = "application/vnd.oasis.opendocument.spreadsheet"
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_illegal_xml_chars = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def cell_value(value):
+    """Converts a value to a type that can be stored in a spreadsheet cell:
+    ``None``, ``bool``, ``int``, ``Decimal``/``float``, naive ``datetime``,
+    ``date`` or ``str``."""
+    if value is None or isinstance(value, (bool, int, float, Decimal)):
+        return value
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        return value
+    if isinstance(value, datetime.date):
+        return value
+    return str(value)
+
+
+def write_xlsx(fp, header, rows, title="Sheet1"):
+    workbook = xlsxwriter.Workbook(fp, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(title)
+    formats = {
+        "header": workbook.add_format({"bold": True}),
+        "amount": workbook.add_format({"num_format": "#,##0.00"}),
+        "date": workbook.add_format({"num_format": "yyyy-mm-dd"}),
+        "datetime": workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"}),
+    }
+
+    for col, column in enumerate(header):
+        worksheet.write_string(0, col, str(column), formats["header"])
+    for row_number, row in enumerate(rows, start=1):
+        for col, value in enumerate(row):
+            value = cell_value(value)
+            if value is None:
+                continue
+            elif isinstance(value, bool):
+                worksheet.write_boolean(row_number, col, value)
+            elif isinstance(value, int):
+                worksheet.write_number(row_number, col, value)
+            elif isinstance(value, (float, Decimal)):
+                worksheet.write_number(row_number, col, float(value), formats["amount"])
+            elif isinstance(value, datetime.datetime):
+                worksheet.write_datetime(row_number, col, value, formats["datetime"])
+            elif isinstance(value, datetime.date):
+                worksheet.write_datetime(row_number, col, value, formats["date"])
+            else:
+                worksheet.write_string(row_number, col, value)
+    workbook.close()
+
+
+ODS_MANIFEST = """<?xml version="1.0" encoding="UTF-8"?>
+<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.2">
+ <manifest:file-entry manifest:full-path="/" manifest:version="1.2" manifest:media-type="{mimetype}"/>
+ <manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>
+</manifest:manifest>
+""".format(mimetype=ODS_MIMETYPE)
+
+ODS_CONTENT_START = """<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content
+ xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+ xmlns:style="urn:oasis:names:tc:opendocument:xmlns:style:1.0"
+ xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+ xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+ xmlns:fo="urn:oasis:names:tc:opendocument:xmlns:xsl-fo-compatible:1.0"
+ xmlns:number="urn:oasis:names:tc:opendocument:xmlns:datastyle:1.0"
+ office:version="1.2">
+ <office:automatic-styles>
+  <number:number-style style:name="N-amount">
+   <number:number number:decimal-places="2" number:min-integer-digits="1" number:grouping="true"/>
+  </number:number-style>
+  <number:date-style style:name="N-date">
+   <number:year number:style="long"/><number:text>-</number:text>
+   <number:month number:style="long"/><number:text>-</number:text>
+   <number:day number:style="long"/>
+  </number:date-style>
+  <number:date-style style:name="N-datetime">
+   <number:year number:style="long"/><number:text>-</number:text>
+   <number:month number:style="long"/><number:text>-</number:text>
+   <number:day number:style="long"/><number:text> </number:text>
+   <number:hours number:style="long"/><number:text>:</number:text>
+   <number:minutes number:style="long"/><number:text>:</number:text>
+   <number:seconds number:style="long"/>
+  </number:date-style>
+  <style:style style:name="header" style:family="table-cell">
+   <style:text-properties fo:font-weight="bold"/>
+  </style:style>
+  <style:style style:name="amount" style:family="table-cell" style:data-style-name="N-amount"/>
+  <style:style style:name="date" style:family="table-cell" style:data-style-name="N-date"/>
+  <style:style style:name="datetime" style:family="table-cell" style:data-style-name="N-datetime"/>
+ </office:automatic-styles>
+ <office:body>
+  <office:spreadsheet>
+   <table:table table:name={title}>
+"""
+
+ODS_CONTENT_END = """   </table:table>
+  </office:spreadsheet>
+ </office:body>
+</office:document-content>
+"""
+
+
+def _ods_text(value):
+    return "".join(
+        f"<text:p>{escape(line)}</text:p>"
+        for line in _illegal_xml_chars.sub("", value).split("\n")
+    )
+
+
+def _ods_cell(value):
+    value = cell_value(value)
+    if value is None:
+        return "<table:table-cell/>"
+    elif isinstance(value, bool):
+        return '<table:table-cell office:value-type="boolean" office:boolean-value="{}">{}</table:table-cell>'.format(
+            "true" if value else "false", _ods_text(str(value))
+        )
+    elif isinstance(value, int):
+        return f'<table:table-cell office:value-type="float" office:value="{value}">{_ods_text(str(value))}</table:table-cell>'
+    elif isinstance(value, (float, Decimal)):
+        return f'<table:table-cell table:style-name="amount" office:value-type="float" office:value="{value}">{_ods_text(f"{value:,.2f}")}</table:table-cell>'
+    elif isinstance(value, datetime.datetime):
+        value = value.replace(microsecond=0)
+        return f'<table:table-cell table:style-name="datetime" office:value-type="date" office:date-value="{value.isoformat()}">{_ods_text(value.isoformat(sep=" "))}</table:table-cell>'
+    elif isinstance(value, datetime.date):
+        return f'<table:table-cell table:style-name="date" office:value-type="date" office:date-value="{value.isoformat()}">{_ods_text(value.isoformat())}</table:table-cell>'
+    return f'<table:table-cell office:value-type="string">{_ods_text(value)}</table:table-cell>'
+
+
+def write_ods(fp, header, rows, title="Sheet1"):
+    with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        # The mimetype must be the first, uncompressed file in the archive
+        archive.writestr("mimetype", ODS_MIMETYPE, compress_type=zipfile.ZIP_STORED)
+        archive.writestr("META-INF/manifest.xml", ODS_MANIFEST)
+        with archive.open("content.xml", "w") as content:
+            content.write(ODS_CONTENT_START.format(title=quoteattr(title)).encode())
+            content.write(
+                (
+                    "<table:table-row>"
+                    + "".join(
+                        '<table:table-cell table:style-name="header" office:value-type="string">{}</table:table-cell>'.format(
+                            _ods_text(str(column))
+                        )
+                        for column in header
+                    )
+                    + "</table:table-row>\n"
+                ).encode()
+            )
+            for row in rows:
+                content.write(
+                    (
+                        "<table:table-row>"
+                        + "".join(_ods_cell(value) for value in row)
+                        + "</table:table-row>\n"
+                    ).encode()
+                )
+            content.write(ODS_CONTENT_END.encode())
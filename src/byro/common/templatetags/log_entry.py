@@ -1,10 +1,17 @@
+import threading
+from collections import defaultdict
 from contextlib import suppress
 
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.signals import setting_changed
+from django.db.models import prefetch_related_objects
+from django.dispatch import receiver
 from django.template.defaultfilters import register
 from django.template.loader import TemplateDoesNotExist, get_template
 from django.urls import reverse
+from django.utils.autoreload import file_changed
 from django.utils.html import escape
 from django.utils.safestring import mark_safe
 
@@ -12,13 +19,70 @@ from byro.common.signals import log_formatters
 from byro.documents.models import get_document_category_names
 
 FORMATTER_REGISTRY = {}
+_registry_loaded = False
+_formatters = {}  # action_type: formatter
 
+# The objects prefetched for the entry that is being formatted
+_rendering = threading.local()
 
-def default_formatter(entry):
-    with suppress(TemplateDoesNotExist):
-        tmpl = get_template(f"log_entry/{entry.action_type}.html")
-        return tmpl.render({"log_entry": entry})
 
+def _object_refs(data):
+    if isinstance(data, dict):
+        if "object" in data and "ref" in data and "value" in data:
+            with suppress(Exception):
+                app_label, model, pk = data["ref"]
+                yield app_label, model, str(pk)
+        for value in data.values():
+            yield from _object_refs(value)
+    elif isinstance(data, (list, tuple)):
+        for value in data:
+            yield from _object_refs(value)
+
+
+def prefetch_log_objects(entries):
+    """Fetches the users, content objects and the objects referenced in the
+    data of the given entries, with one query per model, so that formatting
+    them does not query each object on its own. Returns the entries as a
+    list."""
+    entries = list(entries)
+    prefetch_related_objects(entries, "user", "content_object")
+
+    refs = defaultdict(set)
+    for entry in entries:
+        for app_label, model, pk in _object_refs(entry.data):
+            refs[app_label, model].add(pk)
+
+    objects = {}
+    for (app_label, model), pks in refs.items():
+        with suppress(ContentType.DoesNotExist):
+            model_class = ContentType.objects.get_by_natural_key(
+                app_label, model
+            ).model_class()
+            with suppress(ValueError, ValidationError):
+                found = model_class._base_manager.in_bulk(pks)
+                found = {str(pk): obj for pk, obj in found.items()}
+                for pk in pks:
+                    objects[app_label, model, pk] = found.get(pk)
+
+    for entry in entries:
+        entry._log_objects = objects
+    return entries
+
+
+def get_log_object(ref):
+    app_label, model, pk = ref
+    objects = getattr(_rendering, "objects", None)
+    if objects is not None and (app_label, model, str(pk)) in objects:
+        content_object = objects[app_label, model, str(pk)]
+        if content_object is None:
+            raise ObjectDoesNotExist
+        return content_object
+    return ContentType.objects.get(
+        app_label=app_label, model=model
+    ).get_object_for_this_type(pk=pk)
+
+
+def default_formatter(entry):
     data = dict(entry.data or {})
     data.pop("source", None)
 
@@ -45,14 +109,71 @@ def default_formatter(entry):
     return mark_safe(f"{escape(str(entry.action_type))}{related_object}{extra_data}")
 
 
-@register.filter(name="format_log_entry")
-def format_log_entry(entry):
-    if not FORMATTER_REGISTRY:
+def template_formatter(template):
+    def formatter(entry):
+        return template.render({"log_entry": entry})
+
+    return formatter
+
+
+def get_formatter(action_type):
+    """Returns the formatter of an action type: the one registered with the
+    ``log_formatters`` signal, else the ``log_entry/<action_type>.html``
+    template, else ``default_formatter``. Action types are resolved once per
+    process, see ``clear_formatter_cache``."""
+    global _registry_loaded
+    formatter = _formatters.get(action_type)
+    if formatter is not None:
+        return formatter
+
+    if not _registry_loaded:
         for _receiver, response in log_formatters.send_robust(sender=__name__):
             if response and not isinstance(response, Exception):
                 FORMATTER_REGISTRY.update(response)
+        _registry_loaded = True
 
-    return FORMATTER_REGISTRY.get(entry.action_type, default_formatter)(entry)
+    formatter = FORMATTER_REGISTRY.get(action_type)
+    if formatter is None:
+        try:
+            formatter = template_formatter(
+                get_template(f"log_entry/{action_type}.html")
+            )
+        except TemplateDoesNotExist:
+            formatter = default_formatter
+    _formatters[action_type] = formatter
+    return formatter
+
+
+def clear_formatter_cache():
+    """Forgets all resolved formatters, e.g. after plugins or templates have
+    changed."""
+    global _registry_loaded
+    _formatters.clear()
+    FORMATTER_REGISTRY.clear()
+    _registry_loaded = False
+
+
+@receiver(setting_changed)
+def clear_formatter_cache_on_setting_changed(sender, setting, **kwargs):
+    if setting in ("INSTALLED_APPS", "TEMPLATES"):
+        clear_formatter_cache()
+
+
+@receiver(file_changed)
+def clear_formatter_cache_on_file_changed(sender, file_path, **kwargs):
+    if file_path.suffix == ".html":
+        clear_formatter_cache()
+
+
+@register.filter(name="format_log_entry")
+def format_log_entry(entry):
+    formatter = get_formatter(entry.action_type)
+    previous = getattr(_rendering, "objects", None)
+    _rendering.objects = getattr(entry, "_log_objects", None)
+    try:
+        return formatter(entry)
+    finally:
+        _rendering.objects = previous
 
 
 @register.filter(name="format_log_source")
@@ -79,9 +200,7 @@ def format_log_object(obj, key=None):
     with suppress(Exception):
         if "object" in obj and "ref" in obj and "value" in obj:
             with suppress(Exception):
-                content_object = ContentType.objects.get(
-                    app_label=obj["ref"][0], model=obj["ref"][1]
-                ).get_object_for_this_type(pk=obj["ref"][2])
+                content_object = get_log_object(obj["ref"])
 
                 if obj["value"] == str(content_object):
                     url = content_object.get_absolute_url()
@@ -1,3 +1,4 @@
+import logging
 from copy import deepcopy
 
 from django.db import models, transaction
@@ -13,6 +14,8 @@ from byro.common.models.auditable import Auditable
 from byro.mails.send import SendMailException
 from byro.members.models import Member
 
+logger = logging.getLogger(__name__)
+
 
 class MailTemplate(Auditable, models.Model):
     subject = I18nCharField(max_length=200, verbose_name=_("Subject"))
@@ -155,7 +158,7 @@ class EMail(Auditable, models.Model):
             send_tos = []
 
             if self.to == "special:all":
-                for member in (
+                send_tos = list(
                     Member.objects.filter(
                         Q(memberships__start__lte=now().date())
                         & (
@@ -165,10 +168,10 @@ class EMail(Auditable, models.Model):
                     )
                     .filter(email__isnull=False)
                     .exclude(email="")
-                    .all()
-                ):
-                    send_tos.append(member)
-                    self.members.add(member)
+                    .select_related("profile_memberpage")
+                    .distinct()
+                )
+                self.members.add(*send_tos)
 
             else:
                 to_addrs = self.to.split(",")
@@ -186,29 +189,45 @@ class EMail(Auditable, models.Model):
             if self.reply_to:
                 headers["Reply-To"] = self.reply_to
 
-            from byro.mails.send import mail_send_task
-
-            for addr in send_tos:
-                body = self.text
-                if isinstance(addr, Member):
-                    signature = _(
-                        "You are receiving this email due to your membership in {name}."
-                    ).format(name=config.name)
-                    signature += "\n"
-                    signature += _(
-                        "You can see your member page at this URL: {url}"
-                    ).format(url=addr.profile_memberpage.get_url())
-                    body += "\n\n-- \n" + signature
-                    addr = addr.email
-                mail_send_task(
-                    to=[addr],
-                    subject=self.subject,
-                    body=body,
-                    sender=config.mail_from,
-                    cc=(self.cc or "").split(","),
-                    bcc=(self.bcc or "").split(","),
-                    attachments=self.attachment_ids,
-                    headers=headers,
+            from byro.mails.send import build_message, load_attachments, send_bulk
+
+            attachments = load_attachments(self.attachment_ids)
+            cc = (self.cc or "").split(",")
+            bcc = (self.bcc or "").split(",")
+
+            def messages():
+                for addr in send_tos:
+                    body = self.text
+                    if isinstance(addr, Member):
+                        signature = _(
+                            "You are receiving this email due to your membership in {name}."
+                        ).format(name=config.name)
+                        signature += "\n"
+                        signature += _(
+                            "You can see your member page at this URL: {url}"
+                        ).format(url=addr.profile_memberpage.get_url())
+                        body += "\n\n-- \n" + signature
+                        addr = addr.email
+                    yield build_message(
+                        to=[addr],
+                        subject=self.subject,
+                        body=body,
+                        sender=config.mail_from,
+                        cc=cc,
+                        bcc=bcc,
+                        attachments=attachments,
+                        headers=headers,
+                    )
+
+            sent, refused = send_bulk(messages())
+            if refused:
+                # The mail has reached everybody else, and must not be sent
+                # to them again
+                logger.warning(
+                    "Mail %s was sent to %d recipients, the mail server refused %s",
+                    self.pk,
+                    sent,
+                    ", ".join(sorted(refused)),
                 )
 
         self.sent = now()
@@ -1,7 +1,12 @@
 import logging
+import mimetypes
+import time
+from itertools import islice
+from pathlib import Path
 from smtplib import SMTPRecipientsRefused, SMTPSenderRefused
 from typing import Any, Dict, Union
 
+from django.conf import settings
 from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.mail.backends.smtp import EmailBackend
 from django.utils.translation import override
@@ -70,8 +75,22 @@ def mail(
         )
 
 
-def mail_send_task(
-    to: str,
+def load_attachments(attachment_ids):
+    """Reads the given documents once, as ``(filename, content, mimetype)``,
+    to attach them to any number of emails."""
+    from byro.documents.models import Document
+
+    documents = Document.objects.in_bulk(attachment_ids or [])
+    attachments = []
+    for pk in attachment_ids or []:
+        path = Path(documents[pk].document.path)
+        mimetype, _encoding = mimetypes.guess_type(path.name)
+        attachments.append((path.name, path.read_bytes(), mimetype))
+    return attachments
+
+
+def build_message(
+    to: list,
     subject: str,
     body: str,
     sender: str,
@@ -86,11 +105,33 @@ def mail_send_task(
     )
     if html is not None:
         email.attach_alternative(inline_css(html), "text/html")
-    if attachments:
-        from byro.documents.models import Document
+    for filename, content, mimetype in attachments or []:
+        email.attach(filename, content, mimetype)
+    return email
+
 
-        for attachment in attachments:
-            email.attach_file(Document.objects.get(pk=attachment).document.path)
+def mail_send_task(
+    to: str,
+    subject: str,
+    body: str,
+    sender: str,
+    html: str = None,
+    cc: list = None,
+    bcc: list = None,
+    headers: dict = None,
+    attachments: list = None,
+):
+    email = build_message(
+        to,
+        subject,
+        body,
+        sender,
+        html=html,
+        cc=cc,
+        bcc=bcc,
+        headers=headers,
+        attachments=load_attachments(attachments),
+    )
     backend = get_connection(fail_silently=False)
 
     try:
@@ -98,3 +139,55 @@ def mail_send_task(
     except Exception:
         logger.exception("Error sending email")
         raise SendMailException(f"Failed to send an email to {to}.")
+
+
+def send_bulk(messages, batch_size: int = None, rate_limit: float = None):
+    """Sends many messages, built with ``build_message``.
+
+    Up to ``batch_size`` messages (``MAIL_BATCH_SIZE``) are sent over the same
+    SMTP connection, before it is closed and a new one is opened. At most
+    ``rate_limit`` messages (``MAIL_RATE_LIMIT``, 0 for no limit) are sent per
+    second.
+
+    Messages that the server refuses for all of their recipients are logged
+    and skipped. Returns the number of sent messages, and the refused
+    recipients as ``{address: (code, response)}``.
+    """
+    if batch_size is None:
+        batch_size = settings.MAIL_BATCH_SIZE
+    if batch_size < 1:
+        raise ValueError(f"The mail batch size must be at least 1, not {batch_size}.")
+    if rate_limit is None:
+        rate_limit = settings.MAIL_RATE_LIMIT
+    if rate_limit < 0:
+        raise ValueError(f"The mail rate limit must not be negative, not {rate_limit}.")
+    interval = 1 / rate_limit if rate_limit else 0
+
+    messages = iter(messages)
+    backend = get_connection(fail_silently=False)
+    next_send = time.monotonic()
+    sent = 0
+    refused = {}
+    while batch := list(islice(messages, batch_size)):
+        with backend:
+            for email in batch:
+                if interval:
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_send = max(next_send, time.monotonic()) + interval
+                try:
+                    sent += backend.send_messages([email])
+                except SMTPRecipientsRefused as e:
+                    for recipient, (code, resp) in e.recipients.items():
+                        logger.warning(
+                            "Recipient %s refused, code %d, resp: %s",
+                            recipient,
+                            code,
+                            resp,
+                        )
+                    refused.update(e.recipients)
+                except Exception:
+                    logger.exception("Error sending email")
+                    raise SendMailException(f"Failed to send an email to {email.to}.")
+    return sent, refused
@@ -5,4 +5,4 @@ class MemberConfig(AppConfig):
     name = "byro.members"
 
     def ready(self):
-        from . import signals  # noqa
+        from . import importing, liabilities, signals  # noqa
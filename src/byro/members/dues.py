@@ -0,0 +1,55 @@
+import calendar
+from functools import lru_cache
+
+from dateutil.relativedelta import relativedelta
+
+
+def due_dates(start, end, interval):
+    """Returns the due dates from ``start`` to ``end`` (inclusive), every
+    ``interval`` months.
+
+    This gives the same dates as repeatedly adding
+    ``relativedelta(months=interval)`` to ``start``: if the day does not exist
+    in a month, the last day of that month is used, and for all following
+    dues, too.
+    """
+    if end < start:
+        return ()
+    months = (end.year - start.year) * 12 + end.month - start.month
+    dates = []
+    day = start.day
+    for offset in range(0, months + 1, interval):
+        year, month = divmod(start.month - 1 + offset, 12)
+        year += start.year
+        month += 1
+        day = min(day, calendar.monthrange(year, month)[1])
+        date = start.replace(year=year, month=month, day=day)
+        if date > end:
+            break
+        dates.append(date)
+    return tuple(dates)
+
+
+@lru_cache(maxsize=8192)
+def due_schedule(start, end, interval, amount, accounting_start, month):
+    """Returns the accounted date range and the dues, as a frozenset of
+    ``(date, amount)``, of a membership.
+
+    ``month`` is the ``(year, month)`` up to which the dues of open
+    memberships (``end`` is ``None``) are computed. As all arguments are part
+    of the cache key, memberships with the same parameters share their
+    schedule.
+    """
+    if accounting_start is not None and start < accounting_start:
+        start = accounting_start
+    if not end:
+        year, month = month
+        try:
+            end = start.replace(year=year, month=month)
+        except ValueError:
+            # start.day is not a valid date in this month, use the last day
+            end = start.replace(year=year, month=month, day=1) + relativedelta(
+                months=1, days=-1
+            )
+    dues = frozenset((date, amount) for date in due_dates(start, end, interval))
+    return (start, end), dues
@@ -6,7 +6,12 @@ from django.utils.timezone import now
 
 from byro.common.forms.registration import DefaultDates
 from byro.common.models import Configuration
-from byro.members.models import Member, Membership, get_next_member_number
+from byro.members.models import (
+    Member,
+    Membership,
+    allocate_member_number,
+    get_next_member_number,
+)
 
 MAPPING = {"member": Member, "membership": Membership}
 
@@ -86,6 +91,11 @@ class CreateMemberForm(forms.Form):
             else:
                 obj = profiles[key.split("__")[0]]
             setattr(obj, key.split("__", maxsplit=1)[-1], value)
+        if "member__number" in self.fields and member.number == str(
+            self.fields["member__number"].initial
+        ):
+            # The suggested number may have been taken in the meantime
+            member.number = str(allocate_member_number())
         member.save()
         member.refresh_from_db()
         membership.member = self.instance = member
@@ -0,0 +1,418 @@
+import datetime
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache, partial
+
+import dateparser
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, models, transaction
+from django.dispatch import receiver
+from django.utils.timezone import now
+from django.utils.translation import gettext_lazy as _
+
+from byro.bookkeeping.special_accounts import SpecialAccounts
+from byro.common.models import log_batch
+from byro.common.signals import periodic_task
+from byro.members.models import (
+    ImportJobState,
+    Member,
+    MemberImportJob,
+    MemberNumberSequence,
+    Membership,
+)
+
+STALE_JOB_AGE = datetime.timedelta(minutes=10)
+# MemberImport writes in a single transaction, so a default CSV import that
+# was interrupted has not written anything
+RUNNING_JOB_TIMEOUT = datetime.timedelta(hours=2)
+
+
+class MemberImportError(Exception):
+    """Raised when an import cannot be started at all, e.g. because a column
+    cannot be mapped to a member field."""
+
+
+class MemberImportResult:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []  # (line, message)
+        self.seconds = 0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0
+
+
+class _Row:
+    def __init__(self, line):
+        self.line = line
+        self.member = None
+        self.values = defaultdict(dict)  # target -> {attname: value}
+        self.membership = {}
+        self.balance = None
+        self.balance_timestamp = None
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value):
+    """Parses a date in any format dateparser understands. Import files
+    usually share few distinct dates and mostly use ISO dates, which are
+    parsed directly."""
+    try:
+        return datetime.datetime.fromisoformat(value.strip())
+    except ValueError:
+        return dateparser.parse(value, languages=[settings.LANGUAGE_CODE, "en"])
+
+
+class MemberImport:
+    """Imports members from rows of ``{column name: value}``, as produced by
+    ``csv.DictReader``. Columns are matched to ``Member.get_fields()`` by
+    their name, a ``_internal_id`` column selects existing members to update.
+
+    The rows are read, converted and validated in batches. Rows with errors
+    are skipped and reported. Once all rows have been read, the others are
+    written in bulk, in one transaction: new members with their profiles and
+    memberships, and changed existing members. Until then, these are held in
+    memory. With ``dry_run``, nothing is written or kept, and the result
+    reports what would have changed. ``progress`` is called with the number
+    of rows read so far.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(
+        self, user_or_context, decimal_comma=False, dry_run=False, progress=None
+    ):
+        self.user_or_context = user_or_context
+        self.decimal_comma = decimal_comma
+        self.dry_run = dry_run
+        self.progress = progress
+        self.fields = Member.get_fields()
+
+    def map_columns(self, columns):
+        by_name = {}
+        for field in self.fields.values():
+            by_name.setdefault(str(field.name).strip(), field)
+        mapping = {}
+        for column in columns:
+            if not column or not column.strip():
+                continue
+            if column.strip() not in by_name:
+                raise MemberImportError(
+                    _("Couldn't map input column '{}' to field").format(column.strip())
+                )
+            mapping[column] = by_name[column.strip()]
+        return mapping
+
+    def convert(self, field, value):
+        model_field = field.model_field
+        if value == "" and not isinstance(
+            model_field, (models.CharField, models.TextField)
+        ):
+            return None if model_field.null else model_field.get_default()
+        return model_field.clean(value, None)
+
+    def target(self, field):
+        if field.model is Member:
+            return None
+        return field._steps[0][0]
+
+    def parse_row(self, line, data, mapping):
+        row = _Row(line)
+        member_id = next(
+            (
+                data[column]
+                for column, field in mapping.items()
+                if field.field_id == "_internal_id"
+            ),
+            None,
+        )
+        if member_id and str(member_id).strip().isdigit():
+            row.member = int(member_id)
+
+        for column, field in mapping.items():
+            value = data.get(column)
+            if value is None:
+                continue
+            if field.field_id == "_internal_balance":
+                if value:
+                    if self.decimal_comma:
+                        value = value.replace(".", "").replace(",", ".")
+                    try:
+                        row.balance = Decimal(value)
+                    except InvalidOperation:
+                        raise ValidationError(
+                            _("'{}' is not a valid amount.").format(value)
+                        )
+            elif field.field_id == "_internal_last_transaction":
+                if value:
+                    row.balance_timestamp = parse_date(value)
+                    if not row.balance_timestamp:
+                        raise ValidationError(
+                            _("'{}' is not a valid date.").format(value)
+                        )
+            elif field.read_only:
+                continue
+            elif field.model is Membership:
+                if value:
+                    if field.model_field.name in ("start", "end"):
+                        parsed = parse_date(value)
+                        if not parsed:
+                            raise ValidationError(
+                                _("'{}' is not a valid date.").format(value)
+                            )
+                        value = parsed.date()
+                    row.membership[field.model_field.attname] = self.convert(
+                        field, value
+                    )
+            else:
+                row.values[self.target(field)][field.model_field.attname] = (
+                    self.convert(field, value)
+                )
+
+        if row.balance and not row.balance_timestamp:
+            raise ValidationError(
+                _("Either both or none columns has to be given: '{}' and '{}'").format(
+                    self.fields["_internal_balance"].name,
+                    self.fields["_internal_last_transaction"].name,
+                )
+            )
+        return row
+
+    def read(self, rows, result):
+        """Yields the parsed rows in lists of up to ``BATCH_SIZE``."""
+        mapping = None
+        parsed = []
+        for line, data in enumerate(rows, start=2):
+            if mapping is None:
+                mapping = self.map_columns(data.keys())
+            result.rows += 1
+            try:
+                parsed.append(self.parse_row(line, data, mapping))
+            except ValidationError as e:
+                result.errors.append((line, " ".join(e.messages)))
+            if not result.rows % self.BATCH_SIZE:
+                yield parsed
+                parsed = []
+                if self.progress:
+                    self.progress(result.rows)
+        if parsed:
+            yield parsed
+        if self.progress:
+            self.progress(result.rows)
+
+    def get_profile(self, member, target):
+        """Returns the member's profile, or a new unsaved one if it does not
+        exist yet. Reading a missing profile through ``member.<target>``
+        would create and save it."""
+        related = Member._meta.get_field(target)
+        if related.is_cached(member):
+            profile = related.get_cached_value(member)
+        else:
+            profile = related.related_model.objects.filter(member=member).first()
+        if profile is None:
+            profile = related.related_model(member=member)
+            related.set_cached_value(member, profile)
+        return profile
+
+    def changes(self, member, row):
+        """Applies the row's values to an existing member in memory. Returns
+        the changed objects and their changed attribute names, as a list of
+        ``(object, attnames)``."""
+        changed = []
+        for target, values in row.values.items():
+            obj = member if target is None else self.get_profile(member, target)
+            attnames = set()
+            for attname, value in values.items():
+                old = getattr(obj, attname)
+                if old != value and not (old is None and not value):
+                    setattr(obj, attname, value)
+                    attnames.add(attname)
+            if attnames:
+                changed.append((obj, attnames))
+        return changed
+
+    def plan(self, parsed, result):
+        """Splits parsed rows into rows for new members, and ``(member,
+        changes)`` of existing members."""
+        profile_names = {
+            target for row in parsed for target in row.values if target is not None
+        }
+        existing = Member.all_objects.select_related(*profile_names).in_bulk(
+            [row.member for row in parsed if row.member]
+        )
+        new_rows = []
+        updates = []
+        for row in parsed:
+            member = existing.get(row.member)
+            if member is None:
+                new_rows.append(row)
+                continue
+            changed = self.changes(member, row)
+            if changed:
+                updates.append((member, changed))
+            else:
+                result.unchanged += 1
+        result.created += len(new_rows)
+        result.updated += len(updates)
+        return new_rows, updates
+
+    def run(self, rows):
+        start = time.monotonic()
+        result = MemberImportResult(dry_run=self.dry_run)
+        new_rows = []
+        updates = []
+        for parsed in self.read(rows, result):
+            batch_new_rows, batch_updates = self.plan(parsed, result)
+            if not self.dry_run:
+                new_rows += batch_new_rows
+                updates += batch_updates
+
+        if not self.dry_run:
+            with transaction.atomic(), log_batch():
+                self.create_members(new_rows)
+                self.update_members(updates)
+        result.seconds = time.monotonic() - start
+        return result
+
+    def create_members(self, rows):
+        if not rows:
+            return
+        members = [Member(**row.values[None]) for row in rows]
+        without_number = [member for member in members if not member.number]
+        if without_number:
+            last = MemberNumberSequence.objects.allocate(count=len(without_number))
+            first = last - len(without_number) + 1
+            for number, member in enumerate(without_number, start=first):
+                member.number = str(number)
+        numbers = [int(m.number) for m in members if m.number.isdigit()]
+        if numbers:
+            MemberNumberSequence.objects.seen(max(numbers))
+
+        if connections[Member.objects.db].features.can_return_rows_from_bulk_insert:
+            Member.objects.bulk_create(members, batch_size=self.BATCH_SIZE)
+        else:
+            for member in members:
+                member.save()
+
+        profiles = defaultdict(list)
+        memberships = []
+        for member, row in zip(members, rows):
+            for target, values in row.values.items():
+                if target is not None:
+                    profile_class = Member._meta.get_field(target).related_model
+                    profiles[profile_class].append(
+                        profile_class(member=member, **values)
+                    )
+            if row.membership:
+                memberships.append(Membership(member=member, **row.membership))
+        for profile_class, objs in profiles.items():
+            profile_class.objects.bulk_create(objs, batch_size=self.BATCH_SIZE)
+        Membership.objects.bulk_create(memberships, batch_size=self.BATCH_SIZE)
+
+        for member, row in zip(members, rows):
+            member.log(self.user_or_context, ".created")
+            if row.balance:
+                balance_changed = member.adjust_balance(
+                    self.user_or_context,
+                    "Initial Balance created by CSV Import",
+                    row.balance,
+                    SpecialAccounts.fees_receivable,
+                    SpecialAccounts.opening_balance,
+                    row.balance_timestamp,
+                )
+                if balance_changed:
+                    member.log(
+                        self.user_or_context,
+                        ".finance.initial_balance",
+                        balance=member.balance,
+                    )
+
+    def update_members(self, updates):
+        by_model = defaultdict(dict)  # model -> {id(obj): (obj, attnames)}
+        for _member, changed in updates:
+            for obj, attnames in changed:
+                objs = by_model[type(obj)]
+                objs.setdefault(id(obj), (obj, set()))[1].update(attnames)
+        for model, objs in by_model.items():
+            # Profiles that did not exist yet are created
+            new = [obj for obj, _attnames in objs.values() if obj._state.adding]
+            existing = [
+                (obj, attnames)
+                for obj, attnames in objs.values()
+                if not obj._state.adding
+            ]
+            model.objects.bulk_create(new, batch_size=self.BATCH_SIZE)
+            if existing:
+                attnames = set().union(*(attnames for _obj, attnames in existing))
+                model.objects.bulk_update(
+                    [obj for obj, _attnames in existing],
+                    list(attnames),
+                    batch_size=self.BATCH_SIZE,
+                )
+        for member, _changed in updates:
+            member.log(self.user_or_context, ".updated")
+
+
+_local_worker = None
+
+
+def get_local_worker():
+    global _local_worker
+    if _local_worker is None:
+        _local_worker = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="byro-import"
+        )
+    return _local_worker
+
+
+def run_import_job(job_id):
+    MemberImportJob.objects.get(pk=job_id).run()
+
+
+def _run_import_job_locally(job_id):
+    try:
+        run_import_job(job_id)
+    finally:
+        connections.close_all()
+
+
+def _dispatch_import_job(job_id):
+    if settings.CELERY_BROKER_URL:
+        from byro.members.tasks import run_member_import_job
+
+        run_member_import_job.delay(job_id)
+    else:
+        get_local_worker().submit(_run_import_job_locally, job_id)
+
+
+def enqueue_import_job(job):
+    """Runs the job once the current transaction has been committed: on the
+    celery worker if a broker is configured, otherwise on a background thread
+    of this process."""
+    transaction.on_commit(partial(_dispatch_import_job, job.pk))
+
+
+@receiver(periodic_task)
+def run_stale_import_jobs(sender, **kwargs):
+    """Picks up jobs that have not been started, e.g. because the process
+    that should have run them was restarted, and fails jobs that have been
+    running for too long, e.g. because their process crashed."""
+    stale = MemberImportJob.objects.filter(
+        state=ImportJobState.QUEUED, created__lt=now() - STALE_JOB_AGE
+    )
+    for job in stale:
+        job.run()
+
+    interrupted = MemberImportJob.objects.filter(
+        state=ImportJobState.RUNNING, started__lt=now() - RUNNING_JOB_TIMEOUT
+    )
+    for job in interrupted:
+        job.fail(str(_("The import was interrupted, please upload the file again.")))
@@ -0,0 +1,264 @@
+import datetime
+from collections import defaultdict
+from contextlib import nullcontext
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from byro.bookkeeping.models import Booking, Transaction
+from byro.bookkeeping.special_accounts import SpecialAccounts
+from byro.common.models import Configuration, log_batch
+from byro.common.signals import periodic_task
+from byro.members.models import Member, MemberLedger, Membership
+
+
+class LiabilityEngine:
+    """Brings the membership dues of many members in line with their
+    memberships at once.
+
+    The expected dues of a batch of members are computed from their
+    memberships, and compared to the fee bookings of the same members, which
+    are loaded with a single query. Missing dues are then created, and wrong
+    or stray dues are reversed, in bulk.
+    """
+
+    BATCH_SIZE = 500
+    CONTEXT = "internal: update_liabilites"
+
+    def __init__(self, _now=None):
+        self._now = _now or timezone.now()
+        self._from = Configuration.get_solo().accounting_start
+        self.src_account = SpecialAccounts.fees
+        self.dst_account = SpecialAccounts.fees_receivable
+
+    def _to_datetime(self, date):
+        return timezone.make_aware(
+            datetime.datetime.combine(date, datetime.time()),
+            timezone.get_default_timezone(),
+        )
+
+    def expected_dues(self, member_ids):
+        """Returns the dues, as sets of ``(date, amount)``, the membership date
+        ranges, and the date from which the dues need to be recomputed (or
+        ``None``) of the given members."""
+        dues = defaultdict(set)
+        ranges = defaultdict(list)
+        valid_until = {}
+        for membership in Membership.objects.filter(member_id__in=member_ids):
+            if not membership.amount:
+                continue
+            membership_range, membership_dues = membership.get_dues(
+                _now=self._now, _from=self._from
+            )
+            ranges[membership.member_id].append(membership_range)
+            dues[membership.member_id] |= membership_dues
+            if membership.end is None:
+                # Open memberships only get dues up to the current month
+                if membership_dues:
+                    next_due = max(date for date, _amount in membership_dues)
+                    next_due += relativedelta(months=membership.interval)
+                else:
+                    next_due = membership_range[0]
+                next_change = next_due.replace(day=1)
+                current = valid_until.get(membership.member_id)
+                if current is None or next_change < current:
+                    valid_until[membership.member_id] = next_change
+        return dues, ranges, valid_until
+
+    def booked_dues(self, member_ids):
+        """Returns the fee bookings of the given members that have not been
+        reversed."""
+        qs = Booking.objects.filter(
+            member_id__in=member_ids,
+            credit_account=self.src_account,
+            transaction__reversed_by__isnull=True,
+        )
+        if self._from is not None:
+            qs = qs.filter(
+                transaction__value_datetime__gte=self._to_datetime(self._from)
+            )
+        booked = defaultdict(list)
+        for booking in qs.select_related("transaction").order_by("pk"):
+            booked[booking.member_id].append(booking)
+        return booked
+
+    def diff(self, member_ids, dues, ranges):
+        """Compares the expected dues and membership ranges of the given
+        members with their fee bookings.
+
+        Returns the missing dues as ``(member_id, date, amount)``, the
+        bookings of dues that do not match their membership any more, and the
+        bookings of dues outside of any membership."""
+        booked = self.booked_dues(member_ids)
+        tz = timezone.get_default_timezone()
+
+        missing, wrong, stray = [], [], []
+        for member_id in member_ids:
+            member_ranges = [
+                (self._to_datetime(start), self._to_datetime(end))
+                for start, end in ranges[member_id]
+            ]
+            dues_in_db = {}
+            for booking in booked[member_id]:
+                value_datetime = booking.transaction.value_datetime
+                if any(start <= value_datetime <= end for start, end in member_ranges):
+                    key = (
+                        timezone.localtime(value_datetime, tz).date(),
+                        booking.amount,
+                    )
+                    dues_in_db[key] = booking
+                else:
+                    stray.append(booking)
+            wrong.extend(
+                dues_in_db[key] for key in sorted(dues_in_db.keys() - dues[member_id])
+            )
+            missing.extend(
+                (member_id, date, amount)
+                for date, amount in sorted(dues[member_id] - dues_in_db.keys())
+            )
+        return missing, wrong, stray
+
+    def create_dues(self, missing):
+        """Creates the due transactions for a list of ``(member_id, date,
+        amount)``."""
+        if not missing:
+            return []
+        members = Member.all_objects.in_bulk({member_id for member_id, *_ in missing})
+        transactions = Transaction.objects.bulk_create_with_pks(
+            [
+                Transaction(
+                    value_datetime=self._to_datetime(date),
+                    booking_datetime=self._now,
+                    memo=_("Membership due"),
+                    debit_total=amount,
+                    credit_total=amount,
+                )
+                for _member_id, date, amount in missing
+            ]
+        )
+        bookings = []
+        for t, (member_id, _date, amount) in zip(transactions, missing):
+            bookings.append(
+                Booking(
+                    transaction=t,
+                    credit_account=self.src_account,
+                    amount=amount,
+                    member_id=member_id,
+                )
+            )
+            bookings.append(
+                Booking(
+                    transaction=t,
+                    debit_account=self.dst_account,
+                    amount=amount,
+                    member_id=member_id,
+                )
+            )
+        Booking.objects.bulk_create(bookings)
+
+        context = self.CONTEXT + ", add missing liabilities"
+        for t, (member_id, date, amount) in zip(transactions, missing):
+            member = members[member_id]
+            t.log(
+                context,
+                ".created",
+                value_datetime=date,
+                booking_datetime=self._now,
+                memo=t.memo,
+            )
+            t.log(
+                context,
+                ".credit.created",
+                account=self.src_account,
+                amount=amount,
+                member=member,
+            )
+            t.log(
+                context,
+                ".debit.created",
+                account=self.dst_account,
+                amount=amount,
+                member=member,
+            )
+        return transactions
+
+    @transaction.atomic
+    def update(self, member_ids):
+        """Updates the dues of the given members. Returns the number of
+        created and reversed dues."""
+        dues, ranges, valid_until = self.expected_dues(member_ids)
+        missing, wrong, stray = self.diff(member_ids, dues, ranges)
+        with log_batch():
+            Transaction.objects.bulk_reverse(
+                [booking.transaction for booking in wrong],
+                memo=_("Due amount canceled because of change in membership amount"),
+                user_or_context=self.CONTEXT + ", membership amount changed",
+            )
+            Transaction.objects.bulk_reverse(
+                [booking.transaction for booking in stray],
+                memo=_("Due amount outside of membership canceled"),
+                user_or_context=self.CONTEXT + ", reverse stray liabilities",
+            )
+            self.create_dues(missing)
+
+        # Bulk inserts bypass the signals that maintain the ledgers, and the
+        # ledgers also record that these members are up to date now
+        changed = {member_id for member_id, *_ in missing} | {
+            booking.member_id for booking in wrong + stray
+        }
+        changed |= set(member_ids) - set(
+            MemberLedger.objects.filter(member_id__in=member_ids).values_list(
+                "member_id", flat=True
+            )
+        )
+        if changed:
+            MemberLedger.objects.rebuild(list(changed))
+
+        ledgers = list(MemberLedger.objects.filter(member_id__in=member_ids))
+        for ledger in ledgers:
+            ledger.dues_dirty = False
+            ledger.dues_valid_until = valid_until.get(ledger.member_id)
+        MemberLedger.objects.bulk_update(
+            ledgers, ["dues_dirty", "dues_valid_until"], batch_size=self.BATCH_SIZE
+        )
+        return len(missing), len(wrong) + len(stray)
+
+    def run(self, members=None, batch_size=None, atomic=True, progress=None):
+        """Updates the dues of the given members (or of all members), in
+        batches of ``batch_size`` members.
+
+        With ``atomic=False`` every batch is committed on its own, so that an
+        interrupted run keeps the batches it has finished. ``progress`` is
+        called after each batch with the number of processed members, the
+        total number of members, and the number of created and reversed dues
+        so far. Returns the number of created and reversed dues.
+        """
+        if members is None:
+            members = Member.objects.all()
+        member_ids = sorted(
+            members.values_list("pk", flat=True)
+            if hasattr(members, "values_list")
+            else (member.pk for member in members)
+        )
+        batch_size = batch_size or self.BATCH_SIZE
+
+        with transaction.atomic() if atomic else nullcontext():
+            created = reversed_ = 0
+            for offset in range(0, len(member_ids), batch_size):
+                batch = member_ids[offset : offset + batch_size]
+                batch_created, batch_reversed = self.update(batch)
+                created += batch_created
+                reversed_ += batch_reversed
+                if progress:
+                    progress(offset + len(batch), len(member_ids), created, reversed_)
+        return created, reversed_
+
+
+@receiver(periodic_task)
+def update_dirty_liabilities(sender, **kwargs):
+    members = Member.objects.with_dirty_liabilities()
+    if members.exists():
+        LiabilityEngine().run(members=members)
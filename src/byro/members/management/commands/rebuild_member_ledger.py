@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from byro.members.models import MemberLedger
+
+
+class Command(BaseCommand):
+    help = "Recompute all member ledgers from the bookings and report any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report drift, do not write the recomputed ledgers",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        stored = {ledger.member_id: ledger for ledger in MemberLedger.objects.all()}
+        computed = MemberLedger.objects.build()
+
+        drift = 0
+        for ledger in computed:
+            old = stored.get(ledger.member_id)
+            if old is None:
+                drift += 1
+                self.stdout.write(f"Member {ledger.member_id}: ledger missing")
+                continue
+            changes = [
+                f"{name}: {getattr(old, name)} -> {getattr(ledger, name)}"
+                for name in MemberLedger.objects.LEDGER_FIELDS
+                if getattr(old, name) != getattr(ledger, name)
+            ]
+            if changes:
+                drift += 1
+                self.stdout.write(
+                    "Member {}: {}".format(ledger.member_id, ", ".join(changes))
+                )
+
+        if not options["verify"]:
+            MemberLedger.objects.store(computed)
+
+        self.stdout.write(
+            f"Checked {len(computed)} member ledgers, {drift} with drift"
+            + ("." if options["verify"] else ", all ledgers rebuilt.")
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from byro.members.liabilities import LiabilityEngine
+
+
+class Command(BaseCommand):
+    help = "Create missing membership dues and reverse wrong ones for all members"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=LiabilityEngine.BATCH_SIZE,
+            help="Number of members to process at once",
+        )
+        parser.add_argument(
+            "--commit-batches",
+            action="store_true",
+            help="Commit after every batch instead of once at the end",
+        )
+
+    def handle(self, *args, **options):
+        def progress(done, total, created, reversed_):
+            self.stdout.write(
+                f"{done}/{total} members: {created} dues created, {reversed_} reversed"
+            )
+
+        created, reversed_ = LiabilityEngine().run(
+            batch_size=options["batch_size"],
+            atomic=not options["commit_batches"],
+            progress=progress,
+        )
+        self.stdout.write(
+            f"Done, {created} dues created and {reversed_} dues reversed."
+        )
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:33
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("members", "0013_auto_20200820_2018"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MemberLedger",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "liability",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=12
+                    ),
+                ),
+                (
+                    "asset",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=12
+                    ),
+                ),
+                (
+                    "balance",
+                    models.DecimalField(
+                        db_index=True,
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=12,
+                    ),
+                ),
+                ("last_transaction", models.DateTimeField(null=True)),
+                ("valid_until", models.DateTimeField(db_index=True, null=True)),
+                (
+                    "member",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ledger",
+                        to="members.member",
+                    ),
+                ),
+            ],
+        ),
+    ]
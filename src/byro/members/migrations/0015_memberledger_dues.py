@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("members", "0014_memberledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="memberledger",
+            name="dues_dirty",
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.AddField(
+            model_name="memberledger",
+            name="dues_valid_until",
+            field=models.DateField(db_index=True, null=True),
+        ),
+    ]
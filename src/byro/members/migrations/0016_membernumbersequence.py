@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-15 04:53
+
+from django.db import migrations, models
+
+
+def seed_member_number_sequence(apps, schema_editor):
+    Member = apps.get_model("members", "Member")
+    MemberNumberSequence = apps.get_model("members", "MemberNumberSequence")
+
+    last_number = 0
+    for number in Member.objects.order_by().values_list("number", flat=True).iterator():
+        if number and number.isdigit():
+            last_number = max(last_number, int(number))
+    MemberNumberSequence.objects.update_or_create(
+        pk=1, defaults={"last_number": last_number}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("members", "0015_memberledger_dues"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MemberNumberSequence",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_number", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_member_number_sequence, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,44 @@
+import logging
+import re
 from collections import OrderedDict
+from contextlib import suppress
+from copy import copy
 from decimal import Decimal
-from functools import reduce
 
 from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef, Prefetch, Q, Subquery, Value
 from django.db.models.fields.related import OneToOneRel
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.db.models.signals import (
+    class_prepared,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.functional import classproperty
 from django.utils.safestring import mark_safe
+from django.utils.text import format_lazy
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
 from byro.bookkeeping.models import Booking, Transaction
 from byro.bookkeeping.special_accounts import SpecialAccounts
+from byro.common.cache import ProcessCache
 from byro.common.models import Configuration, LogEntry, LogTargetMixin
 from byro.common.models.auditable import Auditable
 from byro.common.models.choices import Choices
+from byro.common.signals import periodic_task
 from byro.common.templatetags.format_with_currency import format_with_currency
+from byro.members.dues import due_schedule
+
+logger = logging.getLogger(__name__)
 
 
 class Field:
@@ -28,6 +49,8 @@ class Field:
     computed = bool
     read_only = bool
     registration_form = dict
+    model = None
+    model_field = None
 
     def __init__(
         self,
@@ -42,15 +65,21 @@ class Field:
         self.field_id = field_id
         self.base_name = name
         if addition:
-            self.name = f"{name} ({addition})"
+            self.name = format_lazy("{} ({})", name, addition)
         else:
             self.name = name
         self.description = description
         self.path = path
+        self._steps, self._prop = self._compile_path(path)
         self.registration_form = registration_form or {}
         for k, v in kwargs.items():
             setattr(self, k, v)
 
+    def copy(self):
+        result = copy(self)
+        result.registration_form = dict(self.registration_form)
+        return result
+
     @staticmethod
     def _follow_path(start, path):
         """Follow a python.dot.path until its penultimate item, then return the
@@ -62,22 +91,45 @@ class Field:
             _follow_path(m, 'profile_foo.bar')  ->  m.profile_foo, 'bar'
             _follow_path(m, 'memberships.last().start')  ->  m.memberships.last(), 'start'
         """
-        target = start
+        steps, prop = Field._compile_path(path)
+        return Field._follow_steps(start, steps), prop
+
+    @staticmethod
+    def _compile_path(path):
+        """Splits a path into its steps, as ``(name, call)`` tuples, and the
+        name of the last descriptor."""
         path = path.split(".")
-        for p in path[:-1]:
-            target = getattr(target, p.rsplit("(")[0], None)
-            if p.endswith("()") and target is not None:
+        steps = tuple((p.rsplit("(")[0], p.endswith("()")) for p in path[:-1])
+        return steps, path[-1]
+
+    @staticmethod
+    def _follow_steps(start, steps):
+        target = start
+        for name, call in steps:
+            if (
+                call
+                and name in ("first", "last")
+                and isinstance(target, models.Manager)
+            ):
+                # Use prefetched related objects instead of querying again
+                prefetched = target.all()._result_cache
+                if prefetched is not None:
+                    target = (
+                        prefetched[0 if name == "first" else -1] if prefetched else None
+                    )
+                    continue
+            target = getattr(target, name, None)
+            if call and target is not None:
                 target = target()
-        return target, path[-1]
+        return target
 
     def getter(self, member):
-        target, prop = self._follow_path(member, self.path)
-        return getattr(target, prop, None)
+        return getattr(self._follow_steps(member, self._steps), self._prop, None)
 
     def setter(self, member, value):
         if self.read_only:
             raise NotImplementedError(f"Writing to {self.path} is not supported")
-        target, prop = self._follow_path(member, self.path)
+        target, prop = self._follow_steps(member, self._steps), self._prop
         if target is None:
             raise AttributeError(f"Encountered 'None' while following {self.path}")
         setattr(target, prop, value)
@@ -97,6 +149,125 @@ class MemberContactTypes(Choices):
 
 
 class MemberQuerySet(models.QuerySet):
+    def with_balance(self):
+        """Annotates the fee balance (``balance_fees``), the sum of donations
+        (``balance_donations``) and the timestamp of the last fee transaction
+        (``last_fee_transaction``) of each member, computed in the database."""
+        _now = now()
+        fees_receivable = SpecialAccounts.fees_receivable
+        bookings = (
+            Booking.objects.filter(
+                member=OuterRef("pk"), transaction__value_datetime__lte=_now
+            )
+            .order_by()
+            .values("member")
+        )
+        fee_bookings = bookings.filter(
+            Q(debit_account=fees_receivable) | Q(credit_account=fees_receivable)
+        )
+        amount_field = models.DecimalField(max_digits=12, decimal_places=2)
+        fee_balance = fee_bookings.annotate(
+            total=models.Sum(
+                models.Case(
+                    models.When(credit_account=fees_receivable, then=F("amount")),
+                    default=-F("amount"),
+                    output_field=amount_field,
+                )
+            )
+        ).values("total")
+        donations = (
+            bookings.filter(credit_account=SpecialAccounts.donations)
+            .annotate(total=models.Sum("amount"))
+            .values("total")
+        )
+        last_fee_transaction = fee_bookings.annotate(
+            last=models.Max("transaction__value_datetime")
+        ).values("last")
+        return self.annotate(
+            balance_fees=Coalesce(
+                Subquery(fee_balance, output_field=amount_field),
+                Value(Decimal("0.00")),
+                output_field=amount_field,
+            ),
+            balance_donations=Coalesce(
+                Subquery(donations, output_field=amount_field),
+                Value(Decimal("0.00")),
+                output_field=amount_field,
+            ),
+            last_fee_transaction=Subquery(
+                last_fee_transaction, output_field=models.DateTimeField()
+            ),
+        )
+
+    def with_is_active(self):
+        """Annotates whether each member currently has an active membership
+        (``active``)."""
+        today = now().date()
+        return self.annotate(
+            active=Exists(
+                Membership.objects.filter(
+                    member=OuterRef("pk"), start__lte=today
+                ).filter(Q(end__isnull=True) | Q(end__gte=today))
+            )
+        )
+
+    def with_fields(self, fields):
+        """Prepares the queryset for reading the given ``Field`` objects of
+        many members: profiles and related objects are joined, memberships are
+        prefetched and computed values are annotated, so that the number of
+        queries does not depend on the number of members.
+
+        Relies on the default ordering of memberships for
+        ``memberships.last()``, i.e. the primary key.
+        """
+        qs = self
+        paths = {field.path for field in fields}
+        if paths & {"balance", "last_membership_fee_transaction_timestamp"}:
+            if "balance_fees" not in qs.query.annotations:
+                qs = qs.with_balance()
+        if "is_active" in paths and "active" not in qs.query.annotations:
+            qs = qs.with_is_active()
+
+        select_related = set()
+        membership_select_related = set()
+        prefetch_memberships = False
+        for field in fields:
+            names = [name for name, _call in field._steps]
+            if not names:
+                model, prefix, related = Member, "", select_related
+            elif names == ["memberships", "last"]:
+                prefetch_memberships = True
+                model, prefix, related = Membership, "", membership_select_related
+            elif len(names) == 1 and names[0].startswith("profile_"):
+                model = Member._meta.get_field(names[0]).related_model
+                prefix, related = names[0] + "__", select_related
+                select_related.add(names[0])
+            else:
+                continue
+            with suppress(FieldDoesNotExist):
+                model_field = model._meta.get_field(field._prop)
+                if model_field.many_to_one or model_field.one_to_one:
+                    related.add(prefix + field._prop)
+
+        if select_related:
+            qs = qs.select_related(*select_related)
+        if prefetch_memberships:
+            memberships = Membership.objects.select_related(
+                *membership_select_related
+            ).order_by("pk")
+            qs = qs.prefetch_related(Prefetch("memberships", queryset=memberships))
+        return qs
+
+    def with_dirty_liabilities(self):
+        """Filters members whose membership dues need to be recomputed: their
+        memberships or the accounting start changed, a new due date has been
+        reached, or their dues have never been computed."""
+        return self.filter(
+            Q(ledger__isnull=True)
+            | Q(ledger__dues_dirty=True)
+            | Q(ledger__dues_valid_until__lte=now().date())
+        )
+
     def with_active_membership(self):
         return (
             self.filter(
@@ -120,18 +291,84 @@ class MemberManager(models.Manager):
     def with_active_membership(self):
         return self.get_queryset().with_active_membership()
 
+    def with_balance(self):
+        return self.get_queryset().with_balance()
+
+    def with_is_active(self):
+        return self.get_queryset().with_is_active()
+
+    def with_dirty_liabilities(self):
+        return self.get_queryset().with_dirty_liabilities()
+
 
 class AllMemberManager(models.Manager):
-    pass
+    def get_queryset(self):
+        return MemberQuerySet(self.model, using=self._db)
+
+
+# Numbers that fit into MemberNumberSequence.last_number
+SEQUENCE_NUMBER_RE = re.compile(r"[0-9]{1,18}")
+
+
+def sequence_number(number):
+    """Returns the member number as an integer if it counts towards the
+    member number sequence, else ``None``."""
+    if number and SEQUENCE_NUMBER_RE.fullmatch(number):
+        return int(number)
+    return None
+
+
+def highest_member_number(numbers):
+    numeric_numbers = [sequence_number(n) for n in numbers]
+    return max(filter(None, numeric_numbers), default=0)
+
+
+class MemberNumberSequenceManager(models.Manager):
+    def get_sequence(self):
+        sequence = self.filter(pk=1).first()
+        if sequence is None:
+            numbers = Member.all_objects.values_list("number", flat=True)
+            sequence, _ = self.get_or_create(
+                pk=1, defaults={"last_number": highest_member_number(numbers)}
+            )
+        return sequence
+
+    def current(self):
+        return self.get_sequence().last_number
+
+    @transaction.atomic
+    def allocate(self, count=1):
+        """Reserves the next ``count`` free numbers and returns the last one.
+        The counter row stays locked until the surrounding transaction
+        ends."""
+        if not self.filter(pk=1).update(last_number=F("last_number") + count):
+            self.get_sequence()
+            self.filter(pk=1).update(last_number=F("last_number") + count)
+        return self.get(pk=1).last_number
+
+    def seen(self, number):
+        """Makes sure that a number is never handed out again after it has
+        been used."""
+        self.filter(pk=1, last_number__lt=number).update(last_number=number)
+
+
+class MemberNumberSequence(models.Model):
+    """Single row holding the highest numeric membership number that has
+    been used or handed out so far."""
+
+    last_number = models.PositiveBigIntegerField(default=0)
+
+    objects = MemberNumberSequenceManager()
 
 
 def get_next_member_number():
-    all_numbers = Member.all_objects.all().values_list("number", flat=True)
-    numeric_numbers = [n for n in all_numbers if n is not None and n.isdigit()]
-    try:
-        return max(int(n) for n in numeric_numbers) + 1
-    except Exception:
-        return 1
+    """Returns the number the next member will most likely get, without
+    reserving it. Use ``allocate_member_number`` to actually assign one."""
+    return MemberNumberSequence.objects.current() + 1
+
+
+def allocate_member_number():
+    return MemberNumberSequence.objects.allocate()
 
 
 def get_member_data(obj):
@@ -182,6 +419,8 @@ class Member(Auditable, models.Model, LogTargetMixin):
     objects = MemberManager()
     all_objects = AllMemberManager()
 
+    _fields_cache = ProcessCache("byro.members.fields.version")
+
     class Meta:
         ordering = ("direct_address_name", "name")
 
@@ -213,6 +452,32 @@ class Member(Auditable, models.Model, LogTargetMixin):
 
     @classmethod
     def get_fields(cls):
+        """Returns all fields of a member, including the profile fields, as an
+        ordered mapping of field ids to ``Field`` objects.
+
+        The fields are cached per process, see ``ProcessCache``. The cache is
+        cleared when the configuration changes. Each call returns copies of
+        the cached fields, which callers may change.
+        """
+        fields = cls._fields_cache.get("fields")
+        if fields is None:
+            fields = cls._build_fields()
+            # Only cache fields built from committed configuration
+            cls._fields_cache.set_on_commit("fields", fields)
+        return OrderedDict(
+            (field_id, field.copy()) for field_id, field in fields.items()
+        )
+
+    @classmethod
+    def clear_fields_cache(cls):
+        cls._fields_cache.clear()
+
+    @classmethod
+    def validate_fields_cache(cls):
+        cls._fields_cache.validate()
+
+    @classmethod
+    def _build_fields(cls):
         result = []
 
         result.append(
@@ -297,6 +562,8 @@ class Member(Auditable, models.Model, LogTargetMixin):
                         registration_form=form_config.get(f_id, None),
                         computed=False,
                         read_only=False,
+                        model=model,
+                        model_field=field,
                     )
                 )
 
@@ -332,9 +599,27 @@ class Member(Auditable, models.Model, LogTargetMixin):
         )
         return asset - liability
 
+    def get_ledger(self):
+        """Returns the current ``MemberLedger`` of this member. If it does not
+        exist yet, or a future booking has become due since it was last
+        computed, an unsaved, freshly computed ledger is returned instead."""
+        ledger = None
+        if Member.ledger.is_cached(self):
+            with suppress(MemberLedger.DoesNotExist):
+                ledger = self.ledger
+        if ledger is None:
+            ledger = MemberLedger.objects.filter(member=self).first()
+        if ledger is None or ledger.is_stale:
+            # Reading does not write: missing and stale ledgers are stored by
+            # the periodic task, see MemberLedgerManager.refresh_stale
+            ledger = MemberLedger.objects.build([self.pk])[0]
+        return ledger
+
     @property
     def balance(self) -> Decimal:
-        return self._calc_balance()
+        if hasattr(self, "balance_fees"):
+            return self.balance_fees
+        return self.get_ledger().balance
 
     def _calc_last_membership_fee_transaction_timestamp(self):
         _now = now()
@@ -351,7 +636,9 @@ class Member(Auditable, models.Model, LogTargetMixin):
 
     @property
     def last_membership_fee_transaction_timestamp(self):
-        return self._calc_last_membership_fee_transaction_timestamp()
+        if hasattr(self, "last_fee_transaction"):
+            return self.last_fee_transaction
+        return self.get_ledger().last_transaction
 
     def create_balance(self, start, end, commit=True, create_if_zero=True):
         if self.balances.exists():
@@ -394,6 +681,8 @@ class Member(Auditable, models.Model, LogTargetMixin):
 
     @property
     def donation_balance(self) -> Decimal:
+        if hasattr(self, "balance_donations"):
+            return self.balance_donations
         return self.donations.aggregate(donations=models.Sum("amount"))[
             "donations"
         ] or Decimal("0.00")
@@ -416,6 +705,8 @@ class Member(Auditable, models.Model, LogTargetMixin):
 
     @property
     def is_active(self):
+        if hasattr(self, "active"):
+            return self.active
         if not self.memberships.count():
             return False
         for membership in self.memberships.all():
@@ -459,112 +750,11 @@ class Member(Auditable, models.Model, LogTargetMixin):
 
     @transaction.atomic
     def update_liabilites(self):
-        src_account = SpecialAccounts.fees
-        dst_account = SpecialAccounts.fees_receivable
-
-        config = Configuration.get_solo()
+        """Creates missing membership dues, and reverses dues that do not
+        match a membership (any more)."""
+        from byro.members.liabilities import LiabilityEngine
 
-        # Step 1: Identify all dates and amounts that should be due at those dates
-        #  (in python, store as a list; hits database once to get list of memberships)
-        # Step 2: Find all due amounts within the data ranges, ignore reversed liabilities
-        #  (hits database)
-        # Step 3: Compare due date and amounts with list from step 1
-        #  (in Python)
-        # Step 4: Cancel all liabilities that didn't match in step 3
-        #  (hits database, once per mismatch)
-        # Step 5: Add all missing liabilities
-        #  (hits database, once per new due)
-        # Step 6: Find and cancel all liabilities outside of membership dates, replaces remove_future_liabilites_on_leave()
-        #  (hits database, once for search, once per stray liability)
-
-        dues = set()
-        membership_ranges = []
-        _now = now()
-        _from = config.accounting_start
-
-        # Step 1
-        for membership in self.memberships.all():
-            if not membership.amount:
-                continue
-            membership_range, membership_dues = membership.get_dues(
-                _now=_now, _from=_from
-            )
-            membership_ranges.append(membership_range)
-            dues |= membership_dues
-
-        # Step 2
-        dues_qs = Booking.objects.filter(
-            member=self,
-            credit_account=src_account,
-            transaction__reversed_by__isnull=True,
-        )
-        if _from is not None:
-            dues_qs = dues_qs.filter(transaction__value_datetime__gte=_from)
-        if membership_ranges:
-            date_range_q = reduce(
-                lambda a, b: a | b,
-                [
-                    models.Q(transaction__value_datetime__gte=start)
-                    & models.Q(transaction__value_datetime__lte=end)
-                    for start, end in membership_ranges
-                ],
-            )
-            dues_qs = dues_qs.filter(date_range_q)
-        dues_in_db = {  # Must be a dictionary instead of set, to retrieve b later on
-            (b.transaction.value_datetime.date(), b.amount): b for b in dues_qs.all()
-        }
-
-        # Step 3
-        dues_in_db_as_set = set(dues_in_db.keys())
-        wrong_dues_in_db = dues_in_db_as_set - dues
-        missing_dues = dues - dues_in_db_as_set
-
-        # Step 4
-        for wrong_due in sorted(wrong_dues_in_db):
-            booking = dues_in_db[wrong_due]
-            booking.transaction.reverse(
-                memo=_("Due amount canceled because of change in membership amount"),
-                user_or_context="internal: update_liabilites, membership amount changed",
-            )
-
-        # Step 5:
-        for date, amount in sorted(missing_dues):
-            t = Transaction.objects.create(
-                value_datetime=date,
-                booking_datetime=_now,
-                memo=_("Membership due"),
-                user_or_context="internal: update_liabilites, add missing liabilities",
-            )
-            t.credit(
-                account=src_account,
-                amount=amount,
-                member=self,
-                user_or_context="internal: update_liabilites, add missing liabilities",
-            )
-            t.debit(
-                account=dst_account,
-                amount=amount,
-                member=self,
-                user_or_context="internal: update_liabilites, add missing liabilities",
-            )
-            t.save()
-
-        # Step 6:
-        stray_liabilities_qs = Booking.objects.filter(
-            member=self,
-            credit_account=src_account,
-            transaction__reversed_by__isnull=True,
-        )
-        if _from is not None:
-            stray_liabilities_qs = stray_liabilities_qs.filter(transaction__value_datetime__gte=_from)
-        if membership_ranges:
-            stray_liabilities_qs = stray_liabilities_qs.exclude(date_range_q)
-        stray_liabilities_qs = stray_liabilities_qs.prefetch_related("transaction")
-        for stray_liability in stray_liabilities_qs.all():
-            stray_liability.transaction.reverse(
-                memo=_("Due amount outside of membership canceled"),
-                user_or_context="internal: update_liabilites, reverse stray liabilities",
-            )
+        LiabilityEngine().update([self.pk])
 
     @transaction.atomic
     def adjust_balance(self, user_or_context, memo, amount, from_, to_, value_datetime):
@@ -639,9 +829,14 @@ class Member(Auditable, models.Model, LogTargetMixin):
         return mark_safe('<i class="fa fa-user"></i> ')
 
     def log_entries(self):
-        own_entries = [e.pk for e in super().log_entries()]
-        ms_entries = [e.pk for m in self.memberships.all() for e in m.log_entries()]
-        return LogEntry.objects.filter(pk__in=own_entries + ms_entries)
+        """The log entries of the member and of its memberships."""
+        return LogEntry.objects.filter(
+            Q(content_type=ContentType.objects.get_for_model(Member), object_id=self.pk)
+            | Q(
+                content_type=ContentType.objects.get_for_model(Membership),
+                object_id__in=self.memberships.values("pk"),
+            )
+        )
 
 
 class FeeIntervals:
@@ -696,24 +891,18 @@ class Membership(Auditable, models.Model, LogTargetMixin):
         return reverse("office:members.data", kwargs={"pk": self.member.pk})
 
     def get_dues(self, _now=None, _from=None):
+        """Returns the accounted date range and the set of ``(date, amount)``
+        that are due for this membership, see ``due_schedule``."""
         _now = _now or now()
-        dues = set()
-        end = self.end
-        start = self.start
-        if _from is not None and start < _from:
-            start = _from
-        if not end:
-            try:
-                end = _now.replace(day=start.day).date()
-            except (
-                ValueError
-            ):  # membership.start.day is not a valid date in our month, we'll use the last date instead
-                end = (_now + relativedelta(day=1, months=1, days=-1)).date()
-        date = start
-        while date <= end:
-            dues.add((date, self.amount))
-            date += relativedelta(months=self.interval)
-        return (start, end), dues
+        date_range, dues = due_schedule(
+            self.start,
+            self.end,
+            self.interval,
+            self.amount,
+            _from,
+            (_now.year, _now.month),
+        )
+        return date_range, set(dues)
 
 
 SPECIAL_NAMES = {Member: "member", Membership: "membership"}
@@ -763,3 +952,408 @@ class MemberBalance(models.Model):
         default="unpaid",
         max_length=7,
     )
+
+
+class MemberLedgerManager(models.Manager):
+    LEDGER_FIELDS = ("liability", "asset", "balance", "last_transaction", "valid_until")
+    BATCH_SIZE = 500
+
+    def compute(self, member_ids=None, _now=None) -> dict:
+        """Aggregates all fee bookings per member, straight from ``Booking``.
+
+        Returns a dictionary ``{member_id: {field: value}}``. Members without
+        any fee bookings are not contained in the result.
+        """
+        _now = _now or now()
+        account = SpecialAccounts.fees_receivable
+        due = Q(transaction__value_datetime__lte=_now)
+        qs = Booking.objects.filter(
+            Q(debit_account=account) | Q(credit_account=account),
+            member__isnull=False,
+        )
+        if member_ids is not None:
+            qs = qs.filter(member_id__in=member_ids)
+        qs = qs.values("member").annotate(
+            liability=models.Sum("amount", filter=Q(debit_account=account) & due),
+            asset=models.Sum("amount", filter=Q(credit_account=account) & due),
+            last_transaction=models.Max("transaction__value_datetime", filter=due),
+            valid_until=models.Min("transaction__value_datetime", filter=~due),
+        )
+        result = {}
+        for row in qs.order_by():
+            liability = row["liability"] or Decimal("0.00")
+            asset = row["asset"] or Decimal("0.00")
+            result[row["member"]] = {
+                "liability": liability,
+                "asset": asset,
+                "balance": asset - liability,
+                "last_transaction": row["last_transaction"],
+                "valid_until": row["valid_until"],
+            }
+        return result
+
+    def build(self, member_ids=None, _now=None) -> list:
+        """Returns freshly computed, unsaved ledgers for the given members (or
+        for all members)."""
+        if member_ids is None:
+            member_ids = list(Member.all_objects.values_list("pk", flat=True))
+        empty = {
+            "liability": Decimal("0.00"),
+            "asset": Decimal("0.00"),
+            "balance": Decimal("0.00"),
+            "last_transaction": None,
+            "valid_until": None,
+        }
+        result = []
+        for start in range(0, len(member_ids), self.BATCH_SIZE):
+            batch = member_ids[start : start + self.BATCH_SIZE]
+            values = self.compute(batch, _now=_now)
+            result += [
+                self.model(member_id=pk, **values.get(pk, empty)) for pk in batch
+            ]
+        return result
+
+    def store(self, ledgers) -> list:
+        """Saves the given ledgers, replacing existing ledgers of the same
+        members."""
+        self.bulk_create(
+            ledgers,
+            batch_size=self.BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["member"],
+            update_fields=self.LEDGER_FIELDS,
+        )
+        return ledgers
+
+    def rebuild(self, member_ids=None) -> list:
+        """Recomputes and stores the ledgers of the given members (or of all
+        members)."""
+        return self.store(self.build(member_ids))
+
+    def refresh_stale(self):
+        """Rebuilds all missing ledgers, and all ledgers that contain a booking
+        which has become due since they were computed."""
+        member_ids = list(
+            Member.all_objects.filter(
+                Q(ledger__isnull=True) | Q(ledger__valid_until__lte=now())
+            ).values_list("pk", flat=True)
+        )
+        if member_ids:
+            self.rebuild(member_ids)
+
+
+class MemberLedger(models.Model):
+    """Denormalized sums of a member's fee bookings, used to read the member
+    balance without aggregating all bookings.
+
+    The ledger is kept up to date by signal handlers on ``Booking`` and
+    ``Transaction`` (bulk updates bypass them), and contains all bookings up
+    to the time it was computed. ``valid_until`` is the date of the earliest
+    booking in the future at that time: once it is reached, the ledger is
+    stale. The ``periodic_task`` rebuilds stale and missing ledgers. Use the
+    ``rebuild_member_ledger`` management command to verify and repair all
+    ledgers.
+
+    The ledger also tracks whether the member's membership dues are up to
+    date: ``dues_dirty`` is set whenever a membership or the accounting start
+    changes, and ``dues_valid_until`` is the date from which the next due
+    has to be created. The ``periodic_task`` only recomputes the dues of
+    these members.
+    """
+
+    member = models.OneToOneField(
+        to="members.Member", related_name="ledger", on_delete=models.CASCADE
+    )
+    liability = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+    asset = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+    balance = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00"), db_index=True
+    )
+    last_transaction = models.DateTimeField(null=True)
+    valid_until = models.DateTimeField(null=True, db_index=True)
+    dues_dirty = models.BooleanField(default=True, db_index=True)
+    dues_valid_until = models.DateField(null=True, db_index=True)
+
+    objects = MemberLedgerManager()
+
+    @property
+    def is_stale(self):
+        return self.valid_until is not None and self.valid_until <= now()
+
+
+class ImportJobState(Choices):
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+
+class MemberImportJob(models.Model):
+    """A member list import, run in the background by the importer with the
+    id ``importer``.
+
+    The job records the progress, the number of created, updated and
+    unchanged members, and the errors of individual rows. ``sha256`` is the
+    hash of the uploaded file, and is used to reject importing the same file
+    twice. The uploaded file contains personal data, and is deleted once the
+    job has finished or failed.
+    """
+
+    importer = models.CharField(max_length=255)
+    upload_file = models.FileField(upload_to="member_imports/", max_length=1000)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    dry_run = models.BooleanField(default=False)
+    state = models.CharField(
+        default=ImportJobState.QUEUED,
+        choices=ImportJobState.choices,
+        max_length=ImportJobState.max_length,
+    )
+    user = models.ForeignKey(
+        get_user_model(), null=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    rows = models.PositiveIntegerField(default=0)
+    members_created = models.PositiveIntegerField(default=0)
+    members_updated = models.PositiveIntegerField(default=0)
+    members_unchanged = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)
+    message = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ("-created",)
+
+    def get_absolute_url(self):
+        return reverse("office:members.list.import.job", kwargs={"pk": self.pk})
+
+    @property
+    def is_done(self):
+        return self.state in (ImportJobState.FINISHED, ImportJobState.FAILED)
+
+    @property
+    def seconds(self):
+        if self.started and self.finished:
+            return (self.finished - self.started).total_seconds()
+
+    def set_progress(self, rows):
+        """Records the number of rows read so far. This is written outside
+        of the importer's transaction, so that it can be polled."""
+        self.rows = rows
+        MemberImportJob.objects.filter(pk=self.pk).update(rows=rows)
+
+    def run(self):
+        """Runs the job, unless it has already been started elsewhere.
+
+        The importer's ``run`` callback is called with the job, and has to
+        return an object with the attributes ``rows``, ``created``,
+        ``updated``, ``unchanged`` and ``errors`` (a list of ``(line,
+        message)``), like ``byro.members.importing.MemberImportResult``.
+        """
+        from byro.office.views.members import get_member_list_importers
+
+        started = now()
+        if not MemberImportJob.objects.filter(
+            pk=self.pk, state=ImportJobState.QUEUED
+        ).update(state=ImportJobState.RUNNING, started=started):
+            return
+        self.state = ImportJobState.RUNNING
+        self.started = started
+
+        importers = {i["id"]: i for i in get_member_list_importers()}
+        try:
+            importer = importers.get(self.importer)
+            if not importer or "run" not in importer:
+                raise Exception(f"Importer {self.importer} cannot run in background.")
+            result = importer["run"](self)
+        except Exception as e:
+            logger.exception("Member import job %s failed", self.pk)
+            self.state = ImportJobState.FAILED
+            self.message = str(e)
+        else:
+            self.state = ImportJobState.FINISHED
+            self.rows = result.rows
+            self.members_created = result.created
+            self.members_updated = result.updated
+            self.members_unchanged = result.unchanged
+            self.errors = [list(error) for error in result.errors]
+        self.finished = now()
+        self.upload_file.delete(save=False)
+        self.save()
+
+    def fail(self, message):
+        """Marks a job that has not finished as failed."""
+        self.state = ImportJobState.FAILED
+        self.message = message
+        self.finished = now()
+        self.upload_file.delete(save=False)
+        self.save()
+
+
+def changed_values(instance, fields, update_fields=None):
+    """Returns the values of ``fields`` that ``instance`` had in the database
+    before it was changed, if any of them have changed. The values it was
+    loaded with are used, if available."""
+    names = {instance._meta.get_field(field).name for field in fields}
+    if update_fields is not None and not names & set(update_fields):
+        return None
+    old = getattr(instance, "_loaded_values", {})
+    if not all(field in old for field in fields):
+        old = type(instance).objects.filter(pk=instance.pk).values(*fields).first()
+    if old is None or all(old[field] == getattr(instance, field) for field in fields):
+        return None
+    return old
+
+
+BOOKING_LEDGER_FIELDS = (
+    "transaction_id",
+    "member_id",
+    "debit_account_id",
+    "credit_account_id",
+    "amount",
+)
+
+
+@receiver(pre_save, sender=Booking)
+def booking_remember_member(sender, instance, raw=False, update_fields=None, **kwargs):
+    # The booking may be moved to another member, whose ledger changes too
+    instance._ledger_member_ids = set()
+    if not raw and not instance._state.adding:
+        old = changed_values(instance, BOOKING_LEDGER_FIELDS, update_fields)
+        if old is not None:
+            instance._ledger_member_ids = {old["member_id"], instance.member_id}
+
+
+@receiver(post_save, sender=Booking)
+def booking_update_member_ledger(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if hasattr(instance, "_loaded_values"):
+        instance._loaded_values.update(
+            (field, getattr(instance, field)) for field in BOOKING_LEDGER_FIELDS
+        )
+    if not created:
+        member_ids = getattr(instance, "_ledger_member_ids", set()) - {None}
+        instance._ledger_member_ids = set()
+        if member_ids:
+            MemberLedger.objects.rebuild(sorted(member_ids))
+        return
+    if not instance.member_id:
+        return
+
+    account = SpecialAccounts.fees_receivable
+    if account.pk not in (instance.debit_account_id, instance.credit_account_id):
+        return
+
+    amount = Booking._meta.get_field("amount").to_python(instance.amount)
+    value_datetime = Transaction._meta.get_field("value_datetime").get_prep_value(
+        instance.transaction.value_datetime
+    )
+    date_value = Value(value_datetime, output_field=models.DateTimeField())
+    ledger = MemberLedger.objects.filter(member_id=instance.member_id)
+    if value_datetime > now():
+        updated = ledger.update(
+            valid_until=Least(Coalesce("valid_until", date_value), date_value)
+        )
+        if not updated:
+            MemberLedger.objects.rebuild([instance.member_id])
+        return
+
+    if instance.debit_account_id == account.pk:
+        changes = {
+            "liability": F("liability") + amount,
+            "balance": F("balance") - amount,
+        }
+    else:
+        changes = {"asset": F("asset") + amount, "balance": F("balance") + amount}
+    updated = ledger.update(
+        last_transaction=Greatest(Coalesce("last_transaction", date_value), date_value),
+        **changes,
+    )
+    if not updated:
+        MemberLedger.objects.rebuild([instance.member_id])
+
+
+@receiver(pre_save, sender=Transaction)
+def transaction_remember_value_datetime(
+    sender, instance, raw=False, update_fields=None, **kwargs
+):
+    instance._value_datetime_changed = (
+        not raw
+        and not instance._state.adding
+        and changed_values(instance, ["value_datetime"], update_fields) is not None
+    )
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_update_member_ledger(sender, instance, created, raw=False, **kwargs):
+    if hasattr(instance, "_loaded_values"):
+        instance._loaded_values["value_datetime"] = instance.value_datetime
+    changed = getattr(instance, "_value_datetime_changed", False)
+    instance._value_datetime_changed = False
+    if raw or created or not changed:
+        return
+    member_ids = list(
+        Booking.objects.filter(transaction=instance, member__isnull=False)
+        .values_list("member_id", flat=True)
+        .distinct()
+        .order_by()
+    )
+    if member_ids:
+        MemberLedger.objects.rebuild(member_ids)
+
+
+@receiver(periodic_task)
+def refresh_member_ledgers(sender, **kwargs):
+    MemberLedger.objects.refresh_stale()
+
+
+@receiver(post_delete, sender=Booking)
+def booking_delete_member_ledger(sender, instance, **kwargs):
+    if (
+        instance.member_id
+        and MemberLedger.objects.filter(member_id=instance.member_id).exists()
+    ):
+        MemberLedger.objects.rebuild([instance.member_id])
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def membership_mark_dues_dirty(sender, instance, raw=False, **kwargs):
+    if not raw:
+        MemberLedger.objects.filter(member_id=instance.member_id).update(
+            dues_dirty=True
+        )
+
+
+@receiver(pre_save, sender=Configuration)
+def configuration_mark_dues_dirty(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        return
+    old = Configuration.objects.filter(pk=instance.pk).values("accounting_start")
+    if old and old[0]["accounting_start"] != instance.accounting_start:
+        MemberLedger.objects.update(dues_dirty=True)
+
+
+@receiver(post_save, sender=Member)
+def member_update_number_sequence(sender, instance, raw=False, **kwargs):
+    number = None if raw else sequence_number(instance.number)
+    if number:
+        MemberNumberSequence.objects.seen(number)
+
+
+@receiver(post_save, sender=Configuration)
+@receiver(post_migrate)
+def clear_member_fields_cache(sender, **kwargs):
+    Member.clear_fields_cache()
+
+
+@receiver(class_prepared)
+def reset_member_fields_cache(sender, **kwargs):
+    # A new profile model may have been registered
+    Member._fields_cache.values.clear()
@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from byro.members.importing import run_import_job
+
+
+@shared_task
+def run_member_import_job(job_id):
+    run_import_job(job_id)
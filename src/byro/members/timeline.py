@@ -50,6 +50,8 @@ def get_mail_timeline(member):
 
 
 def get_base_finance_timeline(member):
+    fees = SpecialAccounts.fees
+    fees_receivable = SpecialAccounts.fees_receivable
     last_transaction_pk = None
     for instance in (
         Booking.objects.with_transaction_data()
@@ -66,16 +68,16 @@ def get_base_finance_timeline(member):
             "instance": instance,
             "deleted": instance.transaction.reversed_by.first(),
         }
-        b = list(instance.transaction.bookings.all())
+        b = instance.transaction.cached_bookings
         if any(
-            e.member == member and e.debit_account == SpecialAccounts.fees_receivable
+            e.member_id == member.pk and e.debit_account_id == fees_receivable.pk
             for e in b
         ) and any(
-            e.member == member and e.credit_account == SpecialAccounts.fees for e in b
+            e.member_id == member.pk and e.credit_account_id == fees.pk for e in b
         ):
             yield dict(subtype="membership-due", value=instance.amount, **base_data)
         elif any(
-            e.member == member and e.credit_account == SpecialAccounts.fees_receivable
+            e.member_id == member.pk and e.credit_account_id == fees_receivable.pk
             for e in b
         ):
             yield dict(subtype="membership-paid", value=instance.amount, **base_data)
@@ -84,8 +86,10 @@ def get_base_finance_timeline(member):
 
 
 def get_misc_finance_timeline(member):
-    for entry in member.log_entries().filter(
-        action_type__startswith="byro.members.finance."
+    for entry in (
+        member.log_entries()
+        .select_related("user")
+        .filter(action_type__startswith="byro.members.finance.")
     ):
         base_data = {
             "type": "finance",
@@ -111,8 +115,10 @@ def get_finance_timeline(member):
 
 
 def get_misc_ops_timeline(member):
-    for entry in member.log_entries().exclude(
-        action_type__startswith="byro.members.finance."
+    for entry in (
+        member.log_entries()
+        .select_related("user")
+        .exclude(action_type__startswith="byro.members.finance.")
     ):
         base_data = {
             "type": "ops",
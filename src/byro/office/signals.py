@@ -45,6 +45,24 @@ where `form_valid_callback` should accept two arguments: view (the View object
 handling the request), and form (the form object that was submitted, the file
 to import is in the `upload_file` form field) and should return a Response
 object.
+
+Instead of `form_valid`, importers should provide a `run` callback, which is
+run in the background (by the celery worker, or on a background thread)::
+
+    {
+        "id": "dot.scoped.importer.id",
+        "label": _("My super importer"),
+        "run": run_callback,
+    }
+
+where `run_callback` receives the `MemberImportJob`, with the uploaded file in
+its `upload_file` field. It may report the number of rows read so far with
+`job.set_progress(rows)`, should not write anything if `job.dry_run` is set,
+and must return an object with the attributes `rows`, `created`, `updated`,
+`unchanged` and `errors` (a list of `(line, message)`), such as a
+`byro.members.importing.MemberImportResult`. Files that have already been
+imported with a `run` importer are rejected. The uploaded file is deleted once
+the job has finished or failed.
 """
 member_dashboard_tile = django.dispatch.Signal()
 """
@@ -55,6 +55,11 @@ urlpatterns = [
         members.MemberListImportView.as_view(),
         name="members.list.import",
     ),
+    path(
+        "members/list/import/<int:pk>/",
+        members.MemberImportJobView.as_view(),
+        name="members.list.import.job",
+    ),
     path(
         "members/list/disclosure",
         members.MemberDisclosureView.as_view(),
@@ -1,6 +1,5 @@
 from django import forms
 from django.contrib import messages
-from django.db import models
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils.timezone import now
@@ -61,9 +60,7 @@ class AccountDetailView(ListView):
     def get_queryset(self):
         qs = self.get_object().bookings_with_transaction_data
         if self.request.GET.get("filter") == "unbalanced":
-            qs = qs.exclude(
-                transaction_balances_debit=models.F("transaction_balances_credit")
-            )
+            qs = qs.filter(transaction__is_balanced=False)
         qs = qs.filter(transaction__value_datetime__lte=now()).order_by(
             "-transaction__value_datetime"
         )
@@ -2,25 +2,25 @@ import collections
 import collections.abc
 import csv
 import hashlib
+import tempfile
 from datetime import datetime, time
 from decimal import Decimal
 from functools import partial
 from itertools import chain
 
-import dateparser
 import unicodecsv
 from chardet import UniversalDetector
 from dateutil.relativedelta import relativedelta
 from django import forms
-from django.conf import settings
 from django.contrib import messages
 from django.db import transaction
 from django.db.models import Q
 from django.dispatch import receiver
-from django.http import JsonResponse, StreamingHttpResponse
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse
-from django.utils.timezone import now
+from django.utils.formats import date_format
+from django.utils.timezone import localtime, now
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import DetailView, FormView, ListView, TemplateView, View
 from django.views.generic.list import (
@@ -31,9 +31,13 @@ from django.views.generic.list import (
 from byro.bookkeeping.models import Booking
 from byro.bookkeeping.special_accounts import SpecialAccounts
 from byro.common.models import Configuration, LogEntry
+from byro.common.spreadsheets import ODS_MIMETYPE, XLSX_MIMETYPE, write_ods, write_xlsx
+from byro.common.templatetags.log_entry import prefetch_log_objects
 from byro.mails.models import EMail
 from byro.members.forms import CreateMemberForm
-from byro.members.models import Member, Membership
+from byro.members.importing import MemberImport, MemberImportError, enqueue_import_job
+from byro.members.liabilities import LiabilityEngine
+from byro.members.models import ImportJobState, Member, MemberImportJob, Membership
 from byro.members.signals import (
     leave_member,
     leave_member_mail_information,
@@ -82,26 +86,35 @@ class MemberView(DetailView):
 
 
 class MemberListMixin:
-    def get_members_queryset(self, search=None, _filter="active"):
-        qs = Member.objects.all()
+    ORDERINGS = {
+        "number": ("number", "-id"),
+        "name": ("name", "-id"),
+        "balance": ("ledger__balance", "-id"),
+    }
+
+    def get_members_queryset(self, search=None, _filter="active", ordering=None):
+        qs = Member.objects.with_is_active()
         if search:
             qs = qs.filter(Member.get_query_for_search(search))
 
         # Logic:
         #  + Active members have membership with start <= today and (end is null or end >= today)
-        active_q = Q(memberships__start__lte=now().date()) & (
-            Q(memberships__end__isnull=True) | Q(memberships__end__gte=now().date())
-        )
-        inactive_q = ~active_q
+        #    (see MemberQuerySet.with_is_active())
         if _filter == "all":
             pass
         elif _filter == "negbalance":
-            return [m for m in qs.order_by("-id").distinct() if m.balance < 0]
+            qs = qs.filter(ledger__balance__lt=0)
         elif _filter == "inactive":
-            qs = qs.filter(inactive_q)
+            qs = qs.filter(active=False)
         else:  # Default to 'active'
-            qs = qs.filter(active_q)
-        return qs.order_by("-id").distinct()
+            qs = qs.filter(active=True)
+
+        order_by = ("-id",)
+        if ordering and ordering.lstrip("-") in self.ORDERINGS:
+            order_by = self.ORDERINGS[ordering.lstrip("-")]
+            if ordering.startswith("-"):
+                order_by = ("-" + order_by[0],) + order_by[1:]
+        return qs.select_related("ledger").order_by(*order_by)
 
 
 class MemberListView(MemberListMixin, ListView):
@@ -113,11 +126,11 @@ class MemberListView(MemberListMixin, ListView):
     def get_queryset(self):
         search = self.request.GET.get("q")
         _filter = self.request.GET.get("filter", "active")
-        return self.get_members_queryset(search, _filter)
+        ordering = self.request.GET.get("sort")
+        return self.get_members_queryset(search, _filter, ordering=ordering)
 
     def post(self, request, *args, **kwargs):
-        for member in Member.objects.all():
-            member.update_liabilites()
+        LiabilityEngine().run()
         return redirect(request.path)
 
 
@@ -260,7 +273,8 @@ class MemberListExportForm(forms.Form):
         choices=[
             ("csv", _("CSV (Comma Separated Values)")),
             ("csv_de", _("CSV (Semicolon Separated Values, German Windows versions)")),
-            # ('xlsx', _("XLSX (Excel)")),
+            ("xlsx", _("XLSX (Excel)")),
+            ("ods", _("ODS (LibreOffice)")),
         ]
     )
 
@@ -300,6 +314,7 @@ class MemberListExportView(
     context_object_name = "members"
     model = Member
     form_class = MemberListExportForm
+    chunk_size = 500
 
     def dispatch(self, *args, **kwargs):
         self.object_list = self.get_queryset()
@@ -317,12 +332,7 @@ class MemberListExportView(
             ]
         )
         data = self.get_data(
-            form,
-            [
-                (f.field_id, f.getter)
-                for f in fields.values()
-                if f.field_id in selected_fields
-            ],
+            form, [f for f in fields.values() if f.field_id in selected_fields]
         )
 
         LogEntry.objects.create(
@@ -343,6 +353,10 @@ class MemberListExportView(
             return self.export_csv(
                 header, data, csv_format=form.cleaned_data["export_format"]
             )
+        if form.cleaned_data["export_format"] in ("xlsx", "ods"):
+            return self.export_spreadsheet(
+                header, data, file_format=form.cleaned_data["export_format"]
+            )
 
         return redirect(self.request.get_full_path())
 
@@ -381,10 +395,34 @@ class MemberListExportView(
         )
         return response
 
-    def get_data(self, form, field_mapping):
-        qs = self.get_members_queryset(_filter=form.cleaned_data["member_filter"])
-        for m in qs.all():
-            yield {f_id: f_getter(m) for (f_id, f_getter) in field_mapping}
+    def export_spreadsheet(self, header, data, file_format="xlsx"):
+        writer, content_type = {
+            "xlsx": (write_xlsx, XLSX_MIMETYPE),
+            "ods": (write_ods, ODS_MIMETYPE),
+        }[file_format]
+        # Spreadsheets are zip files that can only be sent once complete, so
+        # they are written to a temporary file instead of memory.
+        fp = tempfile.TemporaryFile()
+        writer(
+            fp,
+            header.values(),
+            ([row[key] for key in header] for row in data),
+            title=str(_("Members")),
+        )
+        fp.seek(0)
+        return FileResponse(
+            fp,
+            as_attachment=True,
+            filename=f"members_{now().date()}.{file_format}",
+            content_type=content_type,
+        )
+
+    def get_data(self, form, fields):
+        qs = self.get_members_queryset(
+            _filter=form.cleaned_data["member_filter"]
+        ).with_fields(fields)
+        for m in qs.iterator(chunk_size=self.chunk_size):
+            yield {f.field_id: f.getter(m) for f in fields}
 
 
 def get_member_list_importers():
@@ -398,6 +436,11 @@ class MemberListImportForm(forms.Form):
         )
     )
     upload_file = forms.FileField()
+    dry_run = forms.BooleanField(
+        label=_("Dry run"),
+        help_text=_("Only report what would change, without importing anything."),
+        required=False,
+    )
 
 
 class MemberListImportView(FormView):
@@ -406,8 +449,10 @@ class MemberListImportView(FormView):
     model = Member
     form_class = MemberListImportForm
 
-    def get(self, *args, **kwargs):
-        return super().get(*args, **kwargs)
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["jobs"] = MemberImportJob.objects.all()[:10]
+        return context
 
     def form_invalid(self, form):
         print(form.errors.as_json())
@@ -418,9 +463,27 @@ class MemberListImportView(FormView):
         importers = {i["id"]: i for i in get_member_list_importers()}
 
         importer = importers[form.cleaned_data["importer"]]
+        upload_file = form.cleaned_data["upload_file"]
+        dry_run = form.cleaned_data.get("dry_run", False)
         sha256sum = hashlib.sha256()
-        for chunk in form.cleaned_data["upload_file"].chunks():
+        for chunk in upload_file.chunks():
             sha256sum.update(chunk)
+        sha256 = sha256sum.hexdigest()
+
+        if "run" in importer and not dry_run:
+            previous = (
+                MemberImportJob.objects.filter(sha256=sha256, dry_run=False)
+                .exclude(state=ImportJobState.FAILED)
+                .first()
+            )
+            if previous:
+                messages.error(
+                    self.request,
+                    _(
+                        "This file has already been imported on {date}, it was not imported again."
+                    ).format(date=date_format(localtime(previous.created))),
+                )
+                return redirect(previous.get_absolute_url())
 
         LogEntry.objects.create(
             content_type=None,
@@ -429,16 +492,50 @@ class MemberListImportView(FormView):
             action_type="byro.members.import",
             data={
                 "importer": form.cleaned_data["importer"],
-                "sha256": sha256sum.hexdigest(),
+                "sha256": sha256,
             },
         )
 
-        return importer["form_valid"](self, form)
+        if "run" not in importer:
+            return importer["form_valid"](self, form)
 
+        job = MemberImportJob.objects.create(
+            importer=form.cleaned_data["importer"],
+            upload_file=upload_file,
+            sha256=sha256,
+            dry_run=dry_run,
+            user=self.request.user,
+        )
+        enqueue_import_job(job)
+        return redirect(job.get_absolute_url())
+
+
+class MemberImportJobView(DetailView):
+    template_name = "office/member/import_job.html"
+    context_object_name = "job"
+    model = MemberImportJob
 
-def get_encoding(form):
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if request.GET.get("format") == "json":
+            job = self.object
+            return JsonResponse(
+                {
+                    "state": job.state,
+                    "rows": job.rows,
+                    "created": job.members_created,
+                    "updated": job.members_updated,
+                    "unchanged": job.members_unchanged,
+                    "errors": job.errors,
+                    "message": job.message,
+                }
+            )
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+
+def get_encoding(upload_file):
     detector = UniversalDetector()
-    for chunk in form.cleaned_data["upload_file"].chunks():
+    for chunk in upload_file.chunks():
         detector.feed(chunk)
         if detector.done:
             break
@@ -446,134 +543,43 @@ def get_encoding(form):
     return detector.result["encoding"]
 
 
-def create_membership(membership_parms, member):
-    if membership_parms:
-        for k in "start", "end":
-            #  FIXME Also, we should find a way to handle dates in a generic way
-            if membership_parms.get(k, None):
-                membership_parms[k] = dateparser.parse(
-                    membership_parms[k], languages=[settings.LANGUAGE_CODE, "en"]
-                )
-        Membership.objects.create(member=member, **membership_parms)
+def default_csv_run(job, dialect="excel"):
+    importer = MemberImport(
+        job,
+        decimal_comma=dialect == csv_excel_de,
+        dry_run=job.dry_run,
+        progress=job.set_progress,
+    )
+    with job.upload_file.open("rb") as fp:
+        encoding = get_encoding(fp)
+        fp.seek(0)
+        instream = unicodecsv.DictReader(fp, dialect=dialect, encoding=encoding)
+        return importer.run(instream)
 
 
-@transaction.atomic  # noqa
 def default_csv_form_valid(view, form, dialect="excel"):
-    mapping = None
-    fields = Member.get_fields()
-    encoding = get_encoding(form)
-
-    with form.cleaned_data["upload_file"].open() as fp:
+    """Imports the uploaded file within the request. byro's own importers run
+    in the background instead, see ``default_csv_run``. This is kept for
+    plugin importers that call it from their ``form_valid`` callback."""
+    upload_file = form.cleaned_data["upload_file"]
+    importer = MemberImport(
+        view,
+        decimal_comma=dialect == csv_excel_de,
+        dry_run=form.cleaned_data.get("dry_run", False),
+    )
+    encoding = get_encoding(upload_file)
+    with upload_file.open("rb") as fp:
         instream = unicodecsv.DictReader(fp, dialect=dialect, encoding=encoding)
-
-        for indict in instream:
-            if mapping is None:
-                mapping = {}
-                for k in indict.keys():
-                    if not k.strip():
-                        continue
-                    for field in fields.values():
-                        if str(field.name).strip() == k.strip():
-                            mapping[k.strip()] = field
-                            break
-                    else:
-                        messages.error(
-                            view.request,
-                            _("Couldn't map input column '{}' to field").format(
-                                k.strip()
-                            ),
-                        )
-                        return redirect(view.request.get_full_path())
-
-            do_update = False
-            have_changes = False
-            create_initial_balance = False
-            initial_balance = None
-            initial_balance_timestamp = None
-            for verb_name, field in mapping.items():
-                if field.field_id == "_internal_id":
-                    member = Member.all_objects.filter(
-                        pk=indict[verb_name.strip()]
-                    ).first()
-                    if member:
-                        do_update = True
-                        del indict[verb_name]
-
-            if not do_update:
-                member = Member.objects.create()
-
-            membership_parms = {}
-            for k, v in indict.items():
-                if k.strip() not in mapping:
-                    continue
-                field = mapping[k.strip()]
-                #  FIXME We're special casing the Membership here, but really Field.setter should handle that
-                #  (In the case of 'member.memberships.last()' for the getter it should create a new Membership
-                #  if no Membership exists.)
-                if field.field_id.startswith("membership__"):
-                    if v:
-                        membership_parms[field.field_id.split("__", 1)[1]] = v
-                else:
-                    if do_update:
-                        old_v = field.getter(member)
-                        if old_v != v and not (old_v is None and not v):
-                            field.setter(member, v)
-                            have_changes = True
-                    else:
-                        if field.field_id == "_internal_balance":
-                            if dialect == csv_excel_de:
-                                v = v.replace(".", "").replace(",", ".")
-                            initial_balance = Decimal(v)
-                            if initial_balance != 0:
-                                create_initial_balance = True
-                        elif field.field_id == "_internal_last_transaction":
-                            if v != "" and v is not None:
-                                initial_balance_timestamp = dateparser.parse(
-                                    v, languages=[settings.LANGUAGE_CODE, "en"]
-                                )
-                                create_initial_balance = True
-                        else:
-                            field.setter(member, v)
-
-            if do_update:
-                if have_changes:
-                    member.log(view, ".updated")
-                    member.save()
-            else:
-                if create_initial_balance and not initial_balance_timestamp:
-                    messages.error(
-                        view.request,
-                        _(
-                            "Either both or none columns has to be given: '{}' and '{}'"
-                        ).format(
-                            fields["_internal_balance"].name,
-                            fields["_internal_last_transaction"].name,
-                        ),
-                    )
-                    return redirect(view.request.get_full_path())
-
-                member.log(view, ".created")
-                member.save()
-
-                # FIXME Changing membership when do_update is not implemented
-                if membership_parms:
-                    create_membership(membership_parms, member)
-
-                if create_initial_balance:
-                    balance_changed = member.adjust_balance(
-                        view,
-                        "Initial Balance created by CSV Import",
-                        initial_balance,
-                        SpecialAccounts.fees_receivable,
-                        SpecialAccounts.opening_balance,
-                        initial_balance_timestamp,
-                    )
-
-                    if balance_changed:
-                        member.log(
-                            view, ".finance.initial_balance", balance=member.balance
-                        )
-
+        try:
+            result = importer.run(instream)
+        except MemberImportError as e:
+            messages.error(view.request, str(e))
+            return redirect(view.request.get_full_path())
+
+    for line, error in result.errors:
+        messages.error(
+            view.request, _("Line {line}: {error}").format(line=line, error=error)
+        )
     return redirect(reverse("office:members.list"))
 
 
@@ -582,7 +588,7 @@ def default_csv_importer(sender, **kwargs):
     return {
         "id": "byro.office.members.import.default_csv",
         "label": _("Generic CSV import (Comma Separated Values)"),
-        "form_valid": default_csv_form_valid,
+        "run": default_csv_run,
     }
 
 
@@ -593,7 +599,7 @@ def default_csv_importer_german(sender, **kwargs):
         "label": _(
             "Generic CSV import (Semicolon Separated Values, German Windows versions)"
         ),
-        "form_valid": partial(default_csv_form_valid, dialect=csv_excel_de),
+        "run": partial(default_csv_run, dialect=csv_excel_de),
     }
 
 
@@ -1206,7 +1212,7 @@ class MemberLogView(MemberView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx["log_entries"] = self.get_member().log_entries()
+        ctx["log_entries"] = prefetch_log_objects(self.get_member().log_entries())
         return ctx
 
 
@@ -1,8 +1,14 @@
+import datetime
+
 from django import forms
 from django.apps import apps
 from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
+from django.db.models import Q
 from django.urls import reverse
+from django.utils.timezone import make_aware
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import FormView, ListView, TemplateView
 
@@ -10,6 +16,7 @@ from byro.bookkeeping.models import Account
 from byro.common.forms import ConfigurationForm, InitialForm, RegistrationConfigForm
 from byro.common.models import LogEntry
 from byro.common.models.configuration import ByroConfiguration, Configuration
+from byro.common.templatetags.log_entry import prefetch_log_objects
 
 
 class InitialSettings(FormView):
@@ -134,8 +141,134 @@ class AboutByroView(TemplateView):
         return context
 
 
-class LogView(ListView):
+class LogFilterForm(forms.Form):
+    action_type = forms.CharField(
+        required=False,
+        label=_("Action"),
+        help_text=_("Beginning of the action, e.g. byro.members"),
+    )
+    user = forms.ModelChoiceField(
+        queryset=get_user_model().objects.order_by("username"),
+        required=False,
+        label=_("User"),
+    )
+    content_type = forms.ModelChoiceField(
+        queryset=ContentType.objects.order_by("app_label", "model"),
+        required=False,
+        label=_("Object type"),
+    )
+    start = forms.DateField(required=False, label=_("From"))
+    end = forms.DateField(required=False, label=_("Until"))
+    at = forms.DateField(
+        required=False,
+        label=_("Go to date"),
+        help_text=_("Show the entries up to this date first"),
+    )
+
+    def filter(self, qs):
+        data = self.cleaned_data
+        if data.get("action_type"):
+            qs = qs.filter(action_type__startswith=data["action_type"])
+        if data.get("user"):
+            qs = qs.filter(user=data["user"])
+        if data.get("content_type"):
+            qs = qs.filter(content_type=data["content_type"])
+        if data.get("start"):
+            qs = qs.filter(datetime__gte=start_of_day(data["start"]))
+        if data.get("end"):
+            qs = qs.filter(datetime__lt=start_of_day(data["end"], days=1))
+        return qs
+
+
+def start_of_day(date, days=0):
+    return make_aware(datetime.datetime.combine(date, datetime.time())) + (
+        datetime.timedelta(days=days)
+    )
+
+
+class LogView(TemplateView):
+    """The log, newest entries first. Pages are selected by the position of
+    the last entry of the previous page (``older``) or of the first entry of
+    the next page (``newer``), not by their number, so that every page is a
+    single index range scan. The ``datetime`` bound repeats the condition on
+    the pair, so that the database can use it as the start of the scan."""
+
     template_name = "office/settings/log.html"
-    context_object_name = "log_entries"
-    model = LogEntry
     paginate_by = 50
+    CURSOR_PARAMETERS = ("older", "newer", "at")
+
+    @staticmethod
+    def get_cursor(entry):
+        return f"{entry.datetime.isoformat()}_{entry.pk}"
+
+    @staticmethod
+    def parse_cursor(value):
+        try:
+            timestamp, pk = value.rsplit("_", 1)
+            return datetime.datetime.fromisoformat(timestamp), int(pk)
+        except (AttributeError, ValueError):
+            return None
+
+    def get_page_url(self, parameter, entry):
+        params = self.request.GET.copy()
+        for key in self.CURSOR_PARAMETERS:
+            params.pop(key, None)
+        params[parameter] = self.get_cursor(entry)
+        return "?" + params.urlencode()
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        form = LogFilterForm(self.request.GET or None)
+        qs = LogEntry.objects.select_related("user", "content_type")
+        at = None
+        if form.is_valid():
+            qs = form.filter(qs)
+            at = form.cleaned_data["at"]
+
+        older = self.parse_cursor(self.request.GET.get("older"))
+        newer = self.parse_cursor(self.request.GET.get("newer"))
+        if newer:
+            timestamp, pk = newer
+            entries = list(
+                qs.filter(
+                    Q(datetime__gt=timestamp) | Q(datetime=timestamp, pk__gt=pk),
+                    datetime__gte=timestamp,
+                ).order_by("datetime", "pk")[: self.paginate_by + 1]
+            )
+            has_newer = len(entries) > self.paginate_by
+            entries = entries[: self.paginate_by][::-1]
+            has_older = True
+        else:
+            page_qs = qs
+            if older:
+                timestamp, pk = older
+                page_qs = qs.filter(
+                    Q(datetime__lt=timestamp) | Q(datetime=timestamp, pk__lt=pk),
+                    datetime__lte=timestamp,
+                )
+            elif at:
+                page_qs = qs.filter(datetime__lt=start_of_day(at, days=1))
+            entries = list(page_qs.order_by("-datetime", "-pk")[: self.paginate_by + 1])
+            has_older = len(entries) > self.paginate_by
+            entries = entries[: self.paginate_by]
+            if older:
+                has_newer = True
+            elif at and entries:
+                first = entries[0]
+                has_newer = qs.filter(
+                    Q(datetime__gt=first.datetime)
+                    | Q(datetime=first.datetime, pk__gt=first.pk),
+                    datetime__gte=first.datetime,
+                ).exists()
+            else:
+                has_newer = False
+
+        ctx["form"] = form
+        ctx["log_entries"] = prefetch_log_objects(entries)
+        ctx["newer_url"] = (
+            self.get_page_url("newer", entries[0]) if has_newer and entries else None
+        )
+        ctx["older_url"] = (
+            self.get_page_url("older", entries[-1]) if has_older and entries else None
+        )
+        return ctx
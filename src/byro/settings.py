@@ -20,7 +20,7 @@ CONFIG = config
 ##
 # This settings file is rather lengthy. It follows this structure:
 # Directories, Apps, Url, Security, Databases, Logging, Email, Caching (and Sessions)
-# I18n, Auth, Middleware, Templates and Staticfiles, External Apps
+# Celery, I18n, Auth, Middleware, Templates and Staticfiles, External Apps
 #
 # Search for "## {AREA} SETTINGS" to navigate this file
 ##
@@ -203,6 +203,33 @@ else:
     EMAIL_HOST_PASSWORD = config.get("mail", "password")
     EMAIL_USE_TLS = config.getboolean("mail", "tls")
     EMAIL_USE_SSL = config.getboolean("mail", "ssl")
+MAIL_BATCH_SIZE = config.getint("mail", "batch_size", fallback=100)
+MAIL_RATE_LIMIT = config.getfloat("mail", "rate_limit", fallback=0)
+
+
+## CACHE SETTINGS
+cache_location = config.get("cache", "location", fallback="")
+if cache_location.startswith(("redis://", "rediss://", "unix://")):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": cache_location,
+        }
+    }
+elif cache_location:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": cache_location,
+        }
+    }
+
+
+## CELERY SETTINGS
+CELERY_BROKER_URL = config.get("celery", "broker", fallback="")
+CELERY_RESULT_BACKEND = config.get("celery", "backend", fallback="") or None
+CELERY_TASK_SERIALIZER = CELERY_RESULT_SERIALIZER = "json"
+CELERY_ACCEPT_CONTENT = ["json"]
 
 
 ## I18N SETTINGS
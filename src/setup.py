@@ -93,9 +93,11 @@ setup(
         "schwifty==2026.3.0",
         "unicodecsv~=0.14.0",
         "whitenoise>=6.4,<6.13",
+        "XlsxWriter>=3.0,<3.3",  # https://github.com/jmcnamara/XlsxWriter/blob/main/Changes
     ],
     extras_require={
         "dev": [
+            "aiosmtpd",
             "black",
             "check-manifest",
             "djhtml",
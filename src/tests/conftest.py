@@ -3,6 +3,7 @@ import os.path
 import pytest
 from dateutil.relativedelta import relativedelta
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.management import call_command
 from django.shortcuts import reverse
@@ -20,6 +21,36 @@ from byro.mails.models import EMail, MailTemplate
 from byro.members.models import FeeIntervals, Member, Membership
 from byro.plugins.sepa.models import MemberSepa
 
+_benchmarks = []
+
+
+def pytest_terminal_summary(terminalreporter):
+    if _benchmarks:
+        terminalreporter.section("benchmarks")
+        for line in _benchmarks:
+            terminalreporter.write_line(line)
+
+
+@pytest.fixture
+def report_rate(request):
+    """Reports how many operations per second a benchmark test managed, in
+    the summary at the end of the test run."""
+
+    def report(name, count, seconds):
+        _benchmarks.append(
+            f"{request.node.name}: {name}: {count} in {seconds:.2f}s "
+            f"({count / seconds:.0f}/s)"
+        )
+
+    return report
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    yield
+    # The database is rolled back after each test, the cache has to follow
+    cache.clear()
+
 
 @pytest.fixture
 def configuration():
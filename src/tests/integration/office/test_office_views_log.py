@@ -0,0 +1,105 @@
+import datetime
+
+import pytest
+from django.shortcuts import reverse
+from django.utils.timezone import now
+
+from byro.common.models import LogEntry
+
+
+def get_page(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.context
+
+
+@pytest.mark.django_db
+def test_log_view_keyset_pagination(logged_in_client, member, configuration):
+    for i in range(120):
+        member.log("test", f".page.{i}")
+    url = reverse("office:settings.log") + "?action_type=byro.members.page."
+
+    context = get_page(logged_in_client, url)
+    assert [e.action_type for e in context["log_entries"]] == [
+        f"byro.members.page.{i}" for i in range(119, 69, -1)
+    ]
+    assert context["newer_url"] is None
+
+    seen = list(context["log_entries"])
+    while context["older_url"]:
+        assert "action_type=byro.members.page." in context["older_url"]
+        context = get_page(
+            logged_in_client, reverse("office:settings.log") + context["older_url"]
+        )
+        seen.extend(context["log_entries"])
+    assert len(seen) == 120
+    assert len({e.pk for e in seen}) == 120
+
+    context = get_page(
+        logged_in_client, reverse("office:settings.log") + context["newer_url"]
+    )
+    assert [e.action_type for e in context["log_entries"]] == [
+        f"byro.members.page.{i}" for i in range(69, 19, -1)
+    ]
+    assert context["newer_url"] and context["older_url"]
+
+
+@pytest.mark.django_db
+def test_log_view_keyset_pagination_same_datetime(
+    logged_in_client, member, configuration
+):
+    timestamp = now() - datetime.timedelta(days=1)
+    for i in range(60):
+        LogEntry.objects.create(
+            content_object=member,
+            action_type=f"byro.members.same.{i}",
+            data={"source": "test"},
+            datetime=timestamp,
+        )
+    url = reverse("office:settings.log") + "?action_type=byro.members.same."
+
+    context = get_page(logged_in_client, url)
+    seen = list(context["log_entries"])
+    context = get_page(
+        logged_in_client, reverse("office:settings.log") + context["older_url"]
+    )
+    assert context["older_url"] is None
+    seen.extend(context["log_entries"])
+    assert [e.action_type for e in seen] == [
+        f"byro.members.same.{i}" for i in range(59, -1, -1)
+    ]
+
+    context = get_page(
+        logged_in_client, reverse("office:settings.log") + context["newer_url"]
+    )
+    assert [e.action_type for e in context["log_entries"]] == [
+        e.action_type for e in seen[:50]
+    ]
+
+
+@pytest.mark.django_db
+def test_log_view_filters(logged_in_client, member, user, configuration):
+    member.log("test", ".filtered", user=user)
+    LogEntry.objects.create(
+        content_object=member,
+        action_type="byro.members.old",
+        data={"source": "test"},
+        datetime=now() - datetime.timedelta(days=10),
+    )
+    url = reverse("office:settings.log")
+
+    context = get_page(logged_in_client, f"{url}?user={user.pk}")
+    assert {e.user for e in context["log_entries"]} == {user}
+
+    yesterday = (now() - datetime.timedelta(days=1)).date()
+    context = get_page(logged_in_client, f"{url}?end={yesterday}")
+    assert [e.action_type for e in context["log_entries"]] == ["byro.members.old"]
+
+    context = get_page(logged_in_client, f"{url}?at={yesterday}")
+    assert context["log_entries"][0].action_type == "byro.members.old"
+    assert context["newer_url"]
+
+    context = get_page(
+        logged_in_client, f"{url}?start={yesterday}&action_type=byro.members"
+    )
+    assert "byro.members.old" not in {e.action_type for e in context["log_entries"]}
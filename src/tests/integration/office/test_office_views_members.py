@@ -1,10 +1,20 @@
+import io
+import os
+import zipfile
+from unittest import mock
+
 import pytest
 from dateutil.relativedelta import relativedelta
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.timezone import now
 
-from byro.members.models import Member
+from byro.members.importing import MemberImport, run_stale_import_jobs
+from byro.members.models import ImportJobState, Member, MemberImportJob, Membership
+from byro.office.views.members import default_csv_form_valid
+from byro.plugins.sepa.models import MemberSepa
 
 pytestmark = pytest.mark.usefixtures("configuration")
 
@@ -92,6 +102,63 @@ def test_members_export_list_csv(member, membership, inactive_member, logged_in_
     )
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "export_format,content_file",
+    [("xlsx", "xl/worksheets/sheet1.xml"), ("ods", "content.xml")],
+)
+def test_members_export_spreadsheet(
+    member, membership, logged_in_client, export_format, content_file
+):
+    member.update_liabilites()
+    response = logged_in_client.post(
+        reverse("office:members.list.export"),
+        {
+            "member_filter": "all",
+            "export_format": export_format,
+            "field_list": ["member__name", "_internal_balance", "membership__start"],
+        },
+    )
+    assert response.status_code == 200
+    assert response["Content-Disposition"].endswith(f'.{export_format}"')
+    with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+        content = archive.read(content_file).decode()
+    assert member.name in content
+    if export_format == "ods":
+        assert 'office:value-type="float"' in content
+        assert f"<text:p>{member.balance:,.2f}</text:p>" in content
+        assert f'office:date-value="{membership.start.date().isoformat()}"' in content
+
+
+@pytest.mark.django_db
+def test_members_export_query_count(member, membership, logged_in_client):
+    fields = list(Member.get_fields())
+
+    def export():
+        response = logged_in_client.post(
+            reverse("office:members.list.export"),
+            {"member_filter": "all", "export_format": "csv", "field_list": fields},
+        )
+        with CaptureQueriesContext(connection) as queries:
+            content = b"".join(response.streaming_content).decode()
+        return content, len(queries)
+
+    export()  # Creates missing profiles
+    content, few_members_queries = export()
+    assert member.name in content
+
+    for number in range(10):
+        new_member = Member.objects.create(number=f"x{number}", name=f"Member {number}")
+        Membership.objects.create(
+            member=new_member, start=membership.start, amount=number, interval=1
+        )
+        new_member.update_liabilites()
+    export()
+    content, many_members_queries = export()
+    assert "Member 9" in content
+    assert many_members_queries == few_members_queries
+
+
 @pytest.mark.django_db
 def test_members_adjust_account_initial(member, logged_in_client):
     assert member.balance == 0
@@ -177,7 +244,162 @@ def test_member_download_and_edit(member, membership, logged_in_client):
     )
 
     assert new_response.status_code == 302
+    MemberImportJob.objects.get().run()
 
     new_member = Member.objects.filter(pk=member.pk).first()
     assert new_member.name == "Fnord!"
     assert new_member.profile_sepa.iban == "DE11520513735120710131"
+
+
+@pytest.mark.django_db
+def test_member_import(logged_in_client, django_capture_on_commit_callbacks):
+    fields = Member.get_fields()
+    header = [
+        str(fields[f].name)
+        for f in (
+            "member__number",
+            "member__name",
+            "member__email",
+            "MemberSepa__iban",
+            "membership__start",
+            "membership__amount",
+            "membership__interval",
+        )
+    ]
+    rows = [
+        [
+            "",
+            "Ada",
+            "ada@example.com",
+            "DE11520513735120710131",
+            "2020-01-01",
+            "10",
+            "1",
+        ],
+        ["", "Grace", "grace@example.com", "", "2020-02-01", "20", "12"],
+        ["", "Broken", "not an e-mail", "", "2020-02-01", "20", "12"],
+    ]
+    body = "\n".join(",".join(row) for row in [header] + rows).encode()
+
+    def post(dry_run):
+        data = {
+            "importer": "byro.office.members.import.default_csv",
+            "upload_file": SimpleUploadedFile(
+                "members.csv", body, content_type="text/csv"
+            ),
+        }
+        if dry_run:
+            data["dry_run"] = "on"
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = logged_in_client.post(
+                reverse("office:members.list.import"), data
+            )
+        return response, callbacks
+
+    response, callbacks = post(dry_run=True)
+    job = MemberImportJob.objects.get()
+    assert response.status_code == 302
+    assert response.url == job.get_absolute_url()
+    assert len(callbacks) == 1
+    assert job.state == ImportJobState.QUEUED
+    job.run()
+    job.refresh_from_db()
+    assert job.state == ImportJobState.FINISHED
+    assert not job.upload_file
+    assert job.rows == 3
+    assert job.members_created == 2
+    assert job.errors[0][0] == 4
+    assert Member.objects.count() == 0
+
+    response = logged_in_client.get(job.get_absolute_url() + "?format=json")
+    assert response.json()["created"] == 2
+
+    response, _callbacks = post(dry_run=False)
+    job = MemberImportJob.objects.get(dry_run=False)
+    job.run()
+    content = logged_in_client.get(response.url).content.decode()
+    assert "1 row was skipped" in content
+    assert Member.objects.count() == 2
+    ada = Member.objects.get(name="Ada")
+    assert ada.number
+    assert ada.profile_sepa.iban == "DE11520513735120710131"
+    assert ada.memberships.get().amount == 10
+    grace = Member.objects.get(name="Grace")
+    assert grace.memberships.get().interval == 12
+    assert grace.number != ada.number
+
+    # Importing the same file again is rejected
+    response, callbacks = post(dry_run=False)
+    assert response.url == job.get_absolute_url()
+    assert not callbacks
+    assert MemberImportJob.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_negative_balance_members_list(
+    member, membership, inactive_member, logged_in_client
+):
+    member.update_liabilites()
+    response = logged_in_client.get(
+        reverse("office:members.list") + "?filter=negbalance&sort=-balance"
+    )
+    content = response.content.decode()
+    assert response.status_code == 200, content
+    assert member.name in content
+    assert inactive_member.name not in content
+
+
+@pytest.mark.django_db
+def test_member_import_dry_run_writes_nothing(member):
+    MemberSepa.objects.filter(member=member).delete()
+    fields = Member.get_fields()
+    rows = [
+        {
+            str(fields["_internal_id"].name): str(member.pk),
+            str(fields["MemberSepa__iban"].name): "DE11520513735120710131",
+        }
+    ]
+
+    result = MemberImport("test", dry_run=True).run(iter(rows))
+    assert result.updated == 1
+    assert not MemberSepa.objects.filter(member=member).exists()
+
+    result = MemberImport("test").run(iter(rows))
+    assert result.updated == 1
+    assert MemberSepa.objects.get(member=member).iban == "DE11520513735120710131"
+
+
+@pytest.mark.django_db
+def test_default_csv_form_valid(rf, user):
+    fields = Member.get_fields()
+    body = f"{fields['member__name'].name}\nAda\n".encode()
+    view = mock.Mock(request=rf.post("/"))
+    view.request.user = user
+    form = mock.Mock(
+        cleaned_data={
+            "upload_file": SimpleUploadedFile("members.csv", body),
+            "dry_run": False,
+        }
+    )
+
+    response = default_csv_form_valid(view, form)
+    assert response.url == reverse("office:members.list")
+    assert Member.objects.get().name == "Ada"
+
+
+@pytest.mark.django_db
+def test_member_import_job_timeout():
+    job = MemberImportJob.objects.create(
+        importer="byro.office.members.import.default_csv",
+        upload_file=SimpleUploadedFile("members.csv", b"Name\nAda\n"),
+        state=ImportJobState.RUNNING,
+        started=now() - relativedelta(hours=3),
+    )
+    path = job.upload_file.path
+
+    run_stale_import_jobs(sender=None)
+    job.refresh_from_db()
+    assert job.state == ImportJobState.FAILED
+    assert job.message
+    assert not job.upload_file
+    assert not os.path.exists(path)
@@ -1,6 +1,9 @@
+import time
 from contextlib import suppress
+from unittest import mock
 
 import pytest
+from django.core.cache import cache
 from django.utils.timezone import now
 
 from byro.bookkeeping.models import (
@@ -11,6 +14,7 @@ from byro.bookkeeping.models import (
     Transaction,
 )
 from byro.bookkeeping.special_accounts import SpecialAccounts
+from byro.common.cache import ProcessCache
 
 
 @pytest.mark.django_db
@@ -56,6 +60,86 @@ def test_special_accounts():
     assert bank in Account.objects.filter(tags__name="bank").all()
 
 
+@pytest.mark.django_db
+def test_special_accounts_cache(
+    django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    try:
+        with django_capture_on_commit_callbacks(execute=True):
+            bank = SpecialAccounts.bank
+        with django_assert_num_queries(0):
+            assert SpecialAccounts.bank == bank
+
+        bank.name = "Bank account"
+        bank.save()
+        with django_capture_on_commit_callbacks(execute=True):
+            assert SpecialAccounts.bank.name == "Bank account"
+
+        new_bank = Account.objects.create(account_category=AccountCategory.ASSET)
+        new_bank.tags.add(AccountTag.objects.get(name="bank"))
+        bank.tags.clear()
+        with django_capture_on_commit_callbacks(execute=True):
+            assert SpecialAccounts.bank == new_bank
+    finally:
+        # The cached accounts are rolled back after this test
+        SpecialAccounts.clear_cache()
+
+
+@pytest.mark.django_db
+def test_special_accounts_cache_expires_without_shared_cache(
+    django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    try:
+        with mock.patch("byro.common.cache.time.monotonic", return_value=0):
+            with django_capture_on_commit_callbacks(execute=True):
+                bank = SpecialAccounts.bank
+            with django_assert_num_queries(0):
+                assert SpecialAccounts.bank == bank
+
+        # Another process retags the account, which is not noticed here
+        Account.objects.filter(pk=bank.pk).update(name="Retagged")
+        with mock.patch("byro.common.cache.time.monotonic", return_value=3600):
+            assert SpecialAccounts.bank.name == "Retagged"
+    finally:
+        SpecialAccounts.clear_cache()
+
+
+@pytest.mark.django_db
+def test_special_accounts_cache_outside_requests(django_capture_on_commit_callbacks):
+    version_key = SpecialAccounts._cache.version_key
+    start = time.monotonic()
+    try:
+        with mock.patch.object(ProcessCache, "is_shared", return_value=True):
+            with mock.patch("byro.common.cache.time.monotonic", return_value=start):
+                with django_capture_on_commit_callbacks(execute=True):
+                    bank = SpecialAccounts.bank
+                bank.name = "Changed here"
+                assert SpecialAccounts.bank.name != "Changed here"
+
+                # Another process renames the account, and clears the cache
+                Account.objects.filter(pk=bank.pk).update(name="Renamed")
+                cache.set(version_key, "other")
+                assert SpecialAccounts.bank.name != "Renamed"
+
+            # Without a request, the version is checked again after a while
+            later = start + 3600
+            with mock.patch("byro.common.cache.time.monotonic", return_value=later):
+                assert SpecialAccounts.bank.name == "Renamed"
+    finally:
+        SpecialAccounts.clear_cache()
+
+
+@pytest.mark.django_db
+def test_special_accounts_cache_cleared_on_commit(django_capture_on_commit_callbacks):
+    version_key = SpecialAccounts._cache.version_key
+    version = cache.get(version_key)
+    with django_capture_on_commit_callbacks(execute=True):
+        SpecialAccounts.clear_cache()
+        # Other processes still see the old rows until the commit
+        assert cache.get(version_key) == version
+    assert cache.get(version_key) != version
+
+
 @pytest.mark.django_db
 def test_transaction_balances(receivable_account, income_account):
     t = Transaction.objects.create(
@@ -107,6 +191,52 @@ def test_transaction_balance_accesses(bank_account):
     assert t1.balances["debit"] == 10
 
 
+@pytest.mark.django_db
+def test_transaction_totals(bank_account, receivable_account):
+    t = Transaction.objects.create(value_datetime=now(), user_or_context="test")
+    assert t.is_balanced
+    stale = Transaction.objects.get(pk=t.pk)
+
+    debit = t.debit(amount=10, account=bank_account, user_or_context="test")
+    assert (t.debit_total, t.credit_total, t.is_balanced) == (10, 0, False)
+    assert list(Transaction.objects.unbalanced_transactions()) == [t]
+    assert list(bank_account.unbalanced_transactions) == [t]
+
+    t.credit(amount=10, account=receivable_account, user_or_context="test")
+    assert t.is_balanced
+    stale.memo = "Saving a stale instance keeps the totals"
+    stale.save()
+    t.refresh_from_db()
+    assert (t.debit_total, t.credit_total, t.is_balanced) == (10, 10, True)
+    assert not Transaction.objects.unbalanced_transactions().exists()
+
+    debit.amount = 5
+    debit.save()
+    t.refresh_from_db()
+    assert (t.debit_total, t.is_balanced) == (5, False)
+
+    debit.delete()
+    t.refresh_from_db()
+    assert (t.debit_total, t.credit_total, t.is_balanced) == (0, 10, False)
+
+    Transaction.objects.filter(pk=t.pk).update(credit_total=0, is_balanced=True)
+    Transaction.objects.update_totals()
+    t.refresh_from_db()
+    assert (t.debit_total, t.credit_total, t.is_balanced) == (0, 10, False)
+
+
+@pytest.mark.django_db
+def test_bulk_reverse_totals(bank_account, receivable_account):
+    t = Transaction.objects.create(value_datetime=now(), user_or_context="test")
+    t.debit(amount=10, account=bank_account, user_or_context="test")
+    t.credit(amount=7, account=receivable_account, user_or_context="test")
+
+    (reversal,) = Transaction.objects.bulk_reverse([t], user_or_context="test")
+    reversal.refresh_from_db()
+    assert (reversal.debit_total, reversal.credit_total) == (7, 10)
+    assert not reversal.is_balanced
+
+
 @pytest.mark.django_db
 def test_account_balances(bank_account, receivable_account, income_account):
     t1 = Transaction.objects.create(
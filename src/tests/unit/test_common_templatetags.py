@@ -2,8 +2,17 @@ import pytest
 from django.http.request import QueryDict
 
 from byro.common.models.log import LogEntry
-from byro.common.templatetags.log_entry import format_log_entry, format_log_source
+from byro.common.templatetags import log_entry
+from byro.common.templatetags.log_entry import (
+    clear_formatter_cache,
+    default_formatter,
+    format_log_entry,
+    format_log_source,
+    get_formatter,
+    prefetch_log_objects,
+)
 from byro.common.templatetags.url_replace import url_replace
+from byro.members.models import Member
 
 
 class request:
@@ -70,3 +79,53 @@ def test_log_entry_source_formatting(mail_template, user):
         )
         == 'value (via <span class="fa fa-user"></span> regular_user)'
     )
+
+
+@pytest.mark.django_db
+def test_prefetch_log_objects(member, user, django_assert_num_queries):
+    others = [
+        Member.objects.create(number=f"prefetch-{i}", name=f"Prefetch {i}")
+        for i in range(3)
+    ]
+    for other in others:
+        member.log("test", ".updated", user=user, other=other)
+    member.log("test", ".updated", user=user, other=others[0])
+    others[2].delete()
+
+    entries = prefetch_log_objects(
+        LogEntry.objects.filter(
+            content_object=member, action_type="byro.members.updated"
+        )
+    )
+    with django_assert_num_queries(0):
+        html = "".join(format_log_entry(entry) for entry in entries)
+        assert all(format_log_source(entry) for entry in entries)
+
+    for other in others[:2]:
+        assert f'<a href="{other.get_absolute_url()}">{other}</a>' in html
+    assert "<i>member object</i>: 'Member prefetch-2 (Prefetch 2)'" in html
+
+
+def test_log_formatter_resolution_is_cached(monkeypatch):
+    clear_formatter_cache()
+    lookups = []
+    original = log_entry.get_template
+
+    def get_template(name):
+        lookups.append(name)
+        return original(name)
+
+    monkeypatch.setattr(log_entry, "get_template", get_template)
+    for _ in range(3):
+        assert get_formatter("action.without.template") is default_formatter
+        assert get_formatter("byro.members.created") is get_formatter(
+            "byro.members.created"
+        )
+    assert lookups == [
+        "log_entry/action.without.template.html",
+        "log_entry/byro.members.created.html",
+    ]
+
+    clear_formatter_cache()
+    get_formatter("action.without.template")
+    assert len(lookups) == 3
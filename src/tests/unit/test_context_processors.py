@@ -0,0 +1,68 @@
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.test import RequestFactory
+
+from byro.common.cache import ProcessCache
+from byro.common.context_processors import PENDING_MAILS_KEY, byro_information
+from byro.mails.models import EMail
+
+
+@pytest.fixture
+def shared_cache():
+    with mock.patch.object(ProcessCache, "is_shared", return_value=True):
+        yield
+
+
+@pytest.mark.django_db
+def test_byro_information_counters(shared_cache, django_assert_num_queries):
+    request = RequestFactory().get("/")
+
+    ctx = byro_information(request)
+    with django_assert_num_queries(1):
+        assert ctx["pending_mails"]() == 0
+        assert ctx["pending_mails"]() == 0
+    ctx = byro_information(request)
+    with django_assert_num_queries(0):
+        assert ctx["pending_mails"]() == 0
+
+    EMail.objects.create(to="test@localhost", subject="Test", text="Hi!")
+    ctx = byro_information(request)
+    with django_assert_num_queries(1):
+        assert ctx["pending_mails"]() == 1
+
+    ctx = byro_information(request)
+    with django_assert_num_queries(1):
+        assert ctx["pending_transactions"]() == 0
+    ctx = byro_information(request)
+    with django_assert_num_queries(0):
+        assert ctx["pending_transactions"]() == 0
+
+
+@pytest.mark.django_db
+def test_byro_information_counters_invalidated_on_commit(
+    shared_cache, django_capture_on_commit_callbacks
+):
+    request = RequestFactory().get("/")
+    assert byro_information(request)["pending_mails"]() == 0
+
+    with django_capture_on_commit_callbacks(execute=True):
+        EMail.objects.create(to="test@localhost", subject="Test", text="Hi!")
+        # A concurrent request still counts the mails before the commit
+        cache.set(PENDING_MAILS_KEY, 0)
+    assert byro_information(request)["pending_mails"]() == 1
+
+
+@pytest.mark.django_db
+def test_byro_information_counters_without_shared_cache(django_assert_num_queries):
+    request = RequestFactory().get("/")
+    for count in range(2):
+        ctx = byro_information(request)
+        with django_assert_num_queries(1):
+            assert ctx["pending_mails"]() == count
+            assert ctx["pending_mails"]() == count
+        # Not noticed by other processes with their own cache
+        EMail.objects.bulk_create(
+            [EMail(to="test@localhost", subject="Test", text="Hi!")]
+        )
@@ -1,7 +1,68 @@
+import gzip
+import json
+import multiprocessing
+import threading
+import time
+from contextlib import nullcontext, suppress
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from uuid import uuid4
+
 import pytest
-from django.db import transaction
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.utils.timezone import now
+
+from byro.common import merkle
+from byro.common.models import LogEntry, log_batch
+from byro.common.models.log import LogChainCheckpoint, LogChainHead, LogChainSegment
+
 
-from byro.common.models import LogEntry
+@pytest.fixture
+def migrated_chain():
+    """A log chain as left by older versions: entries from before the log
+    chain, linked by migration 0013 in the order of their timestamps, and a
+    fork from a race between two appends. Returns the entries of the chain,
+    oldest first, and the forked entry."""
+    LogChainHead.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {LogEntry._meta.db_table}")
+
+    def legacy(prev, **kwargs):
+        auth_hash = f"random:{uuid4().hex}"
+        return LogEntry(
+            object_id=0,
+            action_type="test.legacy",
+            data={"source": "test"},
+            auth_hash=auth_hash,
+            auth_prev_id=prev.auth_hash if prev else auth_hash,
+            auth_data={},
+            **kwargs,
+        )
+
+    def append(action_type):
+        return LogEntry.objects.create(
+            object_id=0, action_type=action_type, data={"source": "test"}
+        )
+
+    later = legacy(None, datetime=now())
+    earlier = legacy(None, datetime=now() - timedelta(days=1))
+    later.auth_prev_id = earlier.auth_hash
+    LogEntry.objects.bulk_create([later, earlier])
+
+    first = append("test.first")
+    fork = LogEntry(
+        object_id=0,
+        action_type="test.fork",
+        data={"source": "test"},
+        auth_prev_id=first.auth_hash,
+    )
+    fork._compute_logchain()
+    LogEntry.objects.bulk_create([fork])
+    chain = [earlier, later, first] + [append(f"test.{i}") for i in range(3)]
+    return chain, fork
 
 
 @pytest.mark.django_db
@@ -93,3 +154,346 @@ def test_log_user(user, member):
         LogEntry.objects.create(content_object=member, action_type="test.test_log_user")
 
     assert LogEntry.objects.filter(user=user).first().data["source"] == str(user)
+
+
+@pytest.mark.django_db
+def test_log_chain_head(member, django_assert_num_queries):
+    first = LogEntry.objects.create(
+        content_object=member, action_type="test.first", data={"source": "test"}
+    )
+    second = LogEntry.objects.create(
+        content_object=member, action_type="test.second", data={"source": "test"}
+    )
+
+    assert second.auth_prev_id == first.auth_hash
+    assert LogEntry.objects.find_chain_end() == second
+    with django_assert_num_queries(1):
+        assert LogEntry.objects.get_chain_end() == second
+
+
+def assert_single_chain():
+    prev = dict(LogEntry.objects.values_list("auth_hash", "auth_prev_id"))
+    links = [p for h, p in prev.items() if h != p]
+    assert len(set(links)) == len(links) == len(prev) - 1
+
+    chain = [LogEntry.objects.get_chain_end().auth_hash]
+    while prev[chain[-1]] != chain[-1]:
+        chain.append(prev[chain[-1]])
+    assert len(chain) == len(prev)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_log_chain_concurrent_appends(member, monkeypatch, report_rate):
+    if connection.vendor != "sqlite":
+        # Without the lock within the process, the threads race for the chain
+        # head like separate processes would, and only the lock on the chain
+        # head row keeps them apart. The in-memory SQLite test database fails
+        # instead of waiting for locks held by other connections.
+        monkeypatch.setattr("byro.common.models.log._append_lock", nullcontext())
+    threads, appends = 8, 25
+    errors = []
+
+    def append(number):
+        try:
+            for _ in range(appends):
+                member.log(f"test thread {number}", ".test")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=append, args=(n,)) for n in range(threads)]
+    start = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    report_rate("appends", threads * appends, time.monotonic() - start)
+    assert not errors
+    assert_single_chain()
+
+
+def append_in_process(member, number, appends):
+    try:
+        for _ in range(appends):
+            member.log(f"test process {number}", ".test")
+    finally:
+        connection.close()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_log_chain_concurrent_appends_processes(member, report_rate):
+    if connection.vendor == "sqlite":
+        pytest.skip("The SQLite test database is not shared between processes")
+    processes, appends = 4, 25
+    # The processes open their own connections, and only share the lock on
+    # the chain head row
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=append_in_process, args=(member, n, appends))
+        for n in range(processes)
+    ]
+    start = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    report_rate("appends", processes * appends, time.monotonic() - start)
+    assert [worker.exitcode for worker in workers] == [0] * processes
+    assert_single_chain()
+
+
+@pytest.mark.django_db
+def test_log_batch(member, django_assert_max_num_queries):
+    before = LogEntry.objects.get_chain_end()
+    with django_assert_max_num_queries(12):
+        with log_batch():
+            for i in range(20):
+                member.log("test", f".batch.{i}")
+            assert not LogEntry.objects.filter(action_type__contains=".batch.").exists()
+
+    entries = list(
+        LogEntry.objects.filter(action_type__contains=".batch.").order_by("pk")
+    )
+    assert [e.action_type for e in entries] == [
+        f"byro.members.batch.{i}" for i in range(20)
+    ]
+    assert entries[0].auth_prev_id == before.auth_hash
+    for prev, entry in zip(entries, entries[1:]):
+        assert entry.auth_prev_id == prev.auth_hash
+    assert all(entry.verify() for entry in entries)
+    assert LogEntry.objects.get_chain_end() == entries[-1]
+
+
+@pytest.mark.django_db
+def test_log_batch_savepoint_rollback(member):
+    with log_batch():
+        member.log("test", ".batch.before")
+        with suppress(ValueError), transaction.atomic():
+            member.log("test", ".batch.rolled_back")
+            with log_batch():
+                member.log("test", ".batch.rolled_back_nested")
+            raise ValueError()
+        with transaction.atomic():
+            member.log("test", ".batch.inner")
+            with log_batch():
+                member.log("test", ".batch.inner_nested")
+        member.log("test", ".batch.after")
+
+    end = LogEntry.objects.get_chain_end()
+    assert end == LogEntry.objects.find_chain_end()
+    actions = [
+        entry.action_type
+        for batch in LogEntry.objects.chain(end)
+        for entry in batch
+        if ".batch." in entry.action_type
+    ]
+    assert actions[::-1] == [
+        "byro.members.batch.before",
+        "byro.members.batch.inner",
+        "byro.members.batch.inner_nested",
+        "byro.members.batch.after",
+    ]
+
+
+@pytest.mark.django_db
+def test_log_batch_matches_sequential_appends(member):
+    timestamp = now()
+
+    def make_entries():
+        return [
+            LogEntry(
+                content_object=member,
+                action_type=f"test.{i}",
+                datetime=timestamp,
+                data={"source": "test", "i": i},
+            )
+            for i in range(3)
+        ]
+
+    with mock.patch("nacl.utils.random", return_value=bytes(12)):
+        with transaction.atomic():
+            sequential = make_entries()
+            for entry in sequential:
+                entry.save()
+            transaction.set_rollback(True)
+        batch = LogEntry.objects.bulk_append(make_entries())
+
+    assert [e.auth_hash for e in batch] == [e.auth_hash for e in sequential]
+    assert [e.auth_prev_id for e in batch] == [e.auth_prev_id for e in sequential]
+
+
+@pytest.mark.django_db
+def test_verify_logchain_command(member):
+    for i in range(5):
+        member.log("test", f".verify.{i}")
+    count = LogEntry.objects.count()
+
+    out = StringIO()
+    call_command("verify_logchain", "--jobs=1", "--batch-size=2", stdout=out)
+    assert f"Verified {count} entries" in out.getvalue()
+    checkpoint = LogChainCheckpoint.objects.get_latest()
+    assert checkpoint.length == count
+    assert checkpoint.entry == LogEntry.objects.get_chain_end()
+
+    member.log("test", ".verify.after")
+    out = StringIO()
+    call_command("verify_logchain", "--jobs=1", stdout=out)
+    assert "Verified 1 entries" in out.getvalue()
+    assert LogChainCheckpoint.objects.get_latest().length == count + 1
+
+    LogChainCheckpoint.objects.filter(pk=checkpoint.pk).update(length=1)
+    LogChainCheckpoint.objects.exclude(pk=checkpoint.pk).delete()
+    assert LogChainCheckpoint.objects.get_latest() is None
+
+    LogEntry.objects.filter(action_type="byro.members.verify.2").update(
+        data={"source": "someone else"}
+    )
+    out = StringIO()
+    with pytest.raises(CommandError):
+        call_command("verify_logchain", "--jobs=2", "--no-checkpoint", stdout=out)
+    assert "hash or data MAC mismatch" in out.getvalue()
+    assert LogChainCheckpoint.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_verify_logchain_migrated_chain(migrated_chain):
+    chain, fork = migrated_chain
+    assert not chain[0].verify()
+
+    out = StringIO()
+    call_command("verify_logchain", "--jobs=1", "--batch-size=2", stdout=out)
+    assert f"Verified {len(chain)} entries" in out.getvalue()
+    assert "2 entries from before the log chain" in out.getvalue()
+    assert "1 entries are not part of the chain" in out.getvalue()
+    checkpoint = LogChainCheckpoint.objects.get_latest()
+    assert checkpoint.entry == chain[-1]
+    assert checkpoint.length == len(chain)
+
+    LogEntry.objects.create(
+        object_id=0, action_type="test.after", data={"source": "test"}
+    )
+    out = StringIO()
+    call_command("verify_logchain", "--jobs=1", stdout=out)
+    assert "Verified 1 entries" in out.getvalue()
+
+    LogEntry.objects.filter(pk=chain[3].pk).update(auth_data={})
+    out = StringIO()
+    with pytest.raises(CommandError):
+        call_command("verify_logchain", "--jobs=1", "--full", stdout=out)
+    assert f"Entry {chain[3].auth_hash}: hash or data MAC mismatch" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_export_logchain_ndjson_since(member, tmp_path):
+    member.log("test", ".export.first")
+    since = LogEntry.objects.get_chain_end()
+    for i in range(5):
+        member.log("test", f".export.{i}")
+
+    output = tmp_path / "log.ndjson.gz"
+    call_command(
+        "export_logchain",
+        "--format=ndjson",
+        "--batch-size=2",
+        "--compress",
+        f"--since={since.auth_hash}",
+        f"--output={output}",
+    )
+    with gzip.open(output, "rt") as f:
+        lines = [json.loads(line) for line in f]
+
+    assert [line["entry"]["action_type"] for line in lines] == [
+        f"byro.members.export.{i}" for i in range(5)
+    ]
+    assert lines[0]["entry"]["prev_hash"] == since.auth_hash
+    assert lines[-1]["hash"] == LogEntry.objects.get_chain_end().auth_hash
+
+    with pytest.raises(CommandError):
+        call_command("export_logchain", "--since=blake2b:unknown")
+
+
+@pytest.mark.django_db
+def test_export_logchain_migrated_chain(migrated_chain, tmp_path):
+    chain, fork = migrated_chain
+    output = tmp_path / "log.json"
+    call_command("export_logchain", "--batch-size=2", f"--output={output}")
+    exported = json.loads(output.read_text())
+    assert [e["hash"] for e in exported] == [e.auth_hash for e in reversed(chain)]
+    for entry, prev in zip(exported, exported[1:]):
+        assert entry["entry"]["prev_hash"] == prev["hash"]
+
+    output = tmp_path / "log.ndjson"
+    call_command(
+        "export_logchain",
+        "--format=ndjson",
+        "--batch-size=2",
+        f"--since={chain[2].auth_hash}",
+        f"--output={output}",
+    )
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [line["hash"] for line in lines] == [e.auth_hash for e in chain[3:]]
+    assert lines[0]["entry"]["prev_hash"] == chain[2].auth_hash
+
+    with pytest.raises(CommandError):
+        call_command("export_logchain", f"--since={fork.auth_hash}")
+
+
+@pytest.mark.django_db
+def test_log_chain_segments(member, monkeypatch):
+    monkeypatch.setattr(LogChainSegment.objects, "SEGMENT_SIZE", 4)
+    for i in range(6):
+        member.log("test", f".segment.{i}")
+    count = LogEntry.objects.count()
+
+    segments = LogChainSegment.objects.close()
+    assert len(segments) == count // 4
+    assert all(segment.size == 4 for segment in segments)
+    assert all(segment.verify() for segment in segments)
+    assert segments[0].prev is None
+    assert all(b.prev == a for a, b in zip(segments, segments[1:]))
+    assert LogChainSegment.objects.close() == []
+
+    entry = LogEntry.objects.get(action_type="byro.members.segment.3")
+    proof = entry.get_inclusion_proof()
+    assert proof["hash"] == entry.auth_hash
+    assert len(proof["path"]) == 2
+    assert merkle.verify_proof(proof)
+
+    proof["index"] = (proof["index"] + 1) % proof["segment"]["size"]
+    assert not merkle.verify_proof(proof)
+
+    out = StringIO()
+    call_command(
+        "logchain_proof", entry.auth_hash, "--verify", stdout=out, stderr=StringIO()
+    )
+    assert merkle.verify_proof(json.loads(out.getvalue()))
+
+    # Entries after the last full segment are left for a later segment
+    with pytest.raises(CommandError):
+        call_command("logchain_proof", LogEntry.objects.get_chain_end().auth_hash)
+    for i in range(4):
+        member.log("test", f".segment.later.{i}")
+    (segment,) = LogChainSegment.objects.close()
+    assert segment.prev == segments[-1]
+    assert segment.verify()
+
+    segment.created += timedelta(seconds=1)
+    assert not segment.verify()
+
+
+@pytest.mark.django_db
+def test_log_chain_segments_migrated_chain(migrated_chain, monkeypatch):
+    chain, fork = migrated_chain
+    monkeypatch.setattr(LogChainSegment.objects, "SEGMENT_SIZE", 3)
+
+    segments = LogChainSegment.objects.close()
+    assert [segment.entries for segment in segments] == [
+        [entry.pk for entry in chain[:3]],
+        [entry.pk for entry in chain[3:]],
+    ]
+    assert all(segment.verify() for segment in segments)
+    assert LogChainSegment.objects.get_for_entry(fork) is None
+    assert fork.get_inclusion_proof() is None
+    assert merkle.verify_proof(chain[0].get_inclusion_proof())
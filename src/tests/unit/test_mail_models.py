@@ -1,3 +1,6 @@
+import socket
+import time
+
 import pytest
 
 from byro.mails.models import EMail
@@ -56,3 +59,169 @@ def test_mail_can_send_regular_mail(email):
 @pytest.mark.django_db
 def test_attachment_ids(email):
     assert email.attachment_ids == []
+
+
+@pytest.mark.django_db
+def test_mail_send_to_all_members_in_batches(settings, monkeypatch, membership):
+    from django.core import mail
+    from django.core.mail.backends.locmem import EmailBackend
+
+    from byro.members.models import Member, Membership
+
+    for i in range(4):
+        other = Member.objects.create(email=f"member{i}@localhost", name=f"Member {i}")
+        Membership.objects.create(
+            member=other, start=membership.start, amount=10, interval=1
+        )
+    Membership.objects.create(
+        member=membership.member, start=membership.start, amount=10, interval=1
+    )
+
+    connections = []
+
+    class CountingBackend(EmailBackend):
+        def open(self):
+            connections.append(self)
+            return True
+
+    monkeypatch.setattr(
+        "byro.mails.send.get_connection", lambda **kwargs: CountingBackend(**kwargs)
+    )
+    settings.MAIL_BATCH_SIZE = 2
+
+    email = EMail.objects.create(to="special:all", subject="Hi all", text="Hi!")
+    email.send()
+
+    recipients = sorted(message.to[0] for message in mail.outbox)
+    assert recipients == sorted(
+        [membership.member.email] + [f"member{i}@localhost" for i in range(4)]
+    )
+    assert len(connections) == 3
+    assert email.members.count() == 5
+    assert "-- \n" in mail.outbox[0].body
+
+
+def test_send_bulk_rate_limit(monkeypatch):
+    from django.core import mail
+
+    from byro.mails.send import build_message, send_bulk
+
+    clock = [0.0]
+    sleeps = []
+
+    def sleep(delay):
+        sleeps.append(delay)
+        clock[0] += delay
+
+    monkeypatch.setattr("byro.mails.send.time.sleep", sleep)
+    monkeypatch.setattr("byro.mails.send.time.monotonic", lambda: clock[0])
+    messages = [
+        build_message([f"{i}@localhost"], "Subject", "Body", "byro@localhost")
+        for i in range(5)
+    ]
+    assert send_bulk(messages, batch_size=2, rate_limit=10) == (5, {})
+    assert len(mail.outbox) == 5
+    assert len(sleeps) == 4
+    assert sleeps == pytest.approx([0.1] * 4)
+
+
+@pytest.mark.django_db
+def test_send_bulk_refused_recipients(monkeypatch):
+    from smtplib import SMTPRecipientsRefused
+
+    from django.core import mail
+    from django.core.mail.backends.locmem import EmailBackend
+
+    from byro.mails.send import build_message, send_bulk
+
+    class RefusingBackend(EmailBackend):
+        def send_messages(self, messages):
+            for message in messages:
+                if message.to[0].startswith("refused"):
+                    raise SMTPRecipientsRefused({message.to[0]: (550, b"No such user")})
+            return super().send_messages(messages)
+
+    monkeypatch.setattr(
+        "byro.mails.send.get_connection", lambda **kwargs: RefusingBackend(**kwargs)
+    )
+    messages = [
+        build_message([address], "Subject", "Body", "byro@localhost")
+        for address in ["a@localhost", "refused@localhost", "b@localhost"]
+    ]
+    sent, refused = send_bulk(messages, batch_size=2)
+    assert sent == 2
+    assert refused == {"refused@localhost": (550, b"No such user")}
+    assert [message.to[0] for message in mail.outbox] == ["a@localhost", "b@localhost"]
+
+
+@pytest.mark.django_db
+def test_mail_send_refused_recipient(monkeypatch, email):
+    from smtplib import SMTPRecipientsRefused
+
+    def send_messages(self, messages):
+        raise SMTPRecipientsRefused({messages[0].to[0]: (550, b"No such user")})
+
+    monkeypatch.setattr(
+        "django.core.mail.backends.locmem.EmailBackend.send_messages", send_messages
+    )
+    email.send()
+    email.refresh_from_db()
+    # Retrying would send the mail again to those who got it
+    assert email.sent is not None
+
+
+@pytest.mark.django_db
+def test_mail_send_invalid_batch_size(settings, email):
+    settings.MAIL_BATCH_SIZE = 0
+    with pytest.raises(ValueError):
+        email.send()
+    email.refresh_from_db()
+    assert email.sent is None
+
+
+@pytest.fixture
+def smtp_sink(settings):
+    controller = pytest.importorskip("aiosmtpd.controller")
+
+    class Sink:
+        received = 0
+
+        async def handle_DATA(self, server, session, envelope):
+            self.received += 1
+            return "250 OK"
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    handler = Sink()
+    server = controller.Controller(handler, hostname="127.0.0.1", port=port)
+    server.start()
+    settings.EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+    settings.EMAIL_HOST = "127.0.0.1"
+    settings.EMAIL_PORT = port
+    settings.EMAIL_HOST_USER = settings.EMAIL_HOST_PASSWORD = ""
+    settings.EMAIL_USE_TLS = settings.EMAIL_USE_SSL = False
+    try:
+        yield handler
+    finally:
+        server.stop()
+
+
+def test_send_bulk_benchmark(smtp_sink, report_rate):
+    from byro.mails.send import build_message, mail_send_task, send_bulk
+
+    count = 200
+    body = "Dear member,\n" + "x" * 10000
+    start = time.monotonic()
+    for i in range(count):
+        mail_send_task([f"{i}@localhost"], "Subject", body, "byro@localhost")
+    report_rate("mail_send_task per recipient", count, time.monotonic() - start)
+
+    messages = (
+        build_message([f"{i}@localhost"], "Subject", body, "byro@localhost")
+        for i in range(count)
+    )
+    start = time.monotonic()
+    assert send_bulk(messages, batch_size=100, rate_limit=0) == (count, {})
+    report_rate("send_bulk", count, time.monotonic() - start)
+    assert smtp_sink.received == 2 * count
@@ -1,6 +1,6 @@
 import pytest
 
-from byro.members.models import Member, get_next_member_number
+from byro.members.models import Member, allocate_member_number, get_next_member_number
 
 
 @pytest.mark.django_db
@@ -23,6 +23,23 @@ def test_next_member_number_without_member():
     assert get_next_member_number() == 1
 
 
+@pytest.mark.django_db
+def test_allocate_member_number(member):
+    assert allocate_member_number() == 2
+    assert allocate_member_number() == 3
+    assert get_next_member_number() == 4
+
+    other = Member.objects.create(number="42")
+    assert get_next_member_number() == 43
+    Member.objects.create(number="A-7")
+    other.delete()
+    assert allocate_member_number() == 43
+
+    Member.objects.create(number="²")
+    Member.objects.create(number="9" * 30)
+    assert get_next_member_number() == 44
+
+
 @pytest.mark.django_db
 def test_member_model_methods(member):
     assert member.balance == 0
@@ -39,3 +56,34 @@ def test_member_record_disclosure_email(member_with_sepa_profile):
     assert member.number in email.subject
     assert member.profile_sepa.iban in email.text
     assert member.name in email.text
+
+
+@pytest.mark.django_db
+def test_member_queryset_annotations(member, membership, inactive_member):
+    member.update_liabilites()
+    inactive_member.update_liabilites()
+
+    annotated = {m.pk: m for m in Member.objects.all().with_balance().with_is_active()}
+    for m in (member, inactive_member):
+        assert annotated[m.pk].balance_fees == m._calc_balance()
+        assert annotated[m.pk].balance_donations == m.donation_balance
+        assert (
+            annotated[m.pk].last_fee_transaction
+            == m._calc_last_membership_fee_transaction_timestamp()
+        )
+        assert annotated[m.pk].active == m.is_active
+    assert annotated[member.pk].active
+    assert not annotated[inactive_member.pk].active
+
+
+@pytest.mark.django_db
+def test_member_log_entries(member, membership, django_assert_num_queries):
+    member.log("test", ".test_member_log_entries")
+    membership.log("test", ".test_member_log_entries")
+    other = Member.objects.create(number="other")
+    other.log("test", ".test_member_log_entries")
+
+    with django_assert_num_queries(1):
+        entries = list(member.log_entries())
+    assert {entry.content_object for entry in entries} >= {member, membership}
+    assert other not in {entry.content_object for entry in entries}
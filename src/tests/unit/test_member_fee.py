@@ -1,14 +1,18 @@
+from io import StringIO
 from itertools import repeat
+from unittest import mock
 
 import pytest
 from dateutil.relativedelta import relativedelta
+from django.core.management import call_command
 from django.utils import timezone
 from freezegun import freeze_time
 
 from byro.bookkeeping.models import Transaction
 from byro.bookkeeping.special_accounts import SpecialAccounts
 from byro.common.models import Configuration
-from byro.members.models import FeeIntervals, Member, Membership
+from byro.members.dues import due_dates
+from byro.members.models import FeeIntervals, Member, MemberLedger, Membership
 
 # Apply django_db to all tests in this module (pytest>=9 compatibility)
 pytestmark = pytest.mark.django_db
@@ -157,6 +161,43 @@ def test_liabilities_complicated_example(member_membership, member_membership_se
         assert sum(i.amount for i in correction_bookings) == 20
 
 
+@pytest.mark.parametrize("interval", [1, 3, 6, 12])
+@pytest.mark.parametrize("start_day", [1, 15, 28, 29, 30, 31])
+def test_due_dates(interval, start_day):
+    start = timezone.datetime(2019, 1, start_day).date()
+    end = timezone.datetime(2024, 3, 30).date()
+    expected = []
+    date = start
+    while date <= end:
+        expected.append(date)
+        date += relativedelta(months=interval)
+    assert list(due_dates(start, end, interval)) == expected
+
+
+@pytest.mark.django_db
+def test_get_dues_open_membership(new_member):
+    membership = Membership.objects.create(
+        member=new_member,
+        start=timezone.datetime(2020, 1, 31).date(),
+        amount=10,
+        interval=FeeIntervals.QUARTERLY,
+    )
+    _now = timezone.make_aware(timezone.datetime(2020, 11, 5))
+    date_range, dues = membership.get_dues(_now=_now)
+    assert date_range == (membership.start, timezone.datetime(2020, 11, 30).date())
+    assert sorted(date for date, amount in dues) == [
+        timezone.datetime(2020, 1, 31).date(),
+        timezone.datetime(2020, 4, 30).date(),
+        timezone.datetime(2020, 7, 30).date(),
+        timezone.datetime(2020, 10, 30).date(),
+    ]
+
+    _from = timezone.datetime(2020, 6, 1).date()
+    date_range, dues = membership.get_dues(_now=_now, _from=_from)
+    assert date_range[0] == _from
+    assert len(dues) == 2
+
+
 @pytest.mark.django_db
 def test_liabilities_limit(member):
     config = Configuration.get_solo()
@@ -229,3 +270,209 @@ def test_liabilities_limit(member):
         assert member.statute_barred_debt() == 0
 
         assert member.statute_barred_debt(relativedelta(years=1)) == 239.0
+
+
+@pytest.mark.django_db
+def test_ledger_follows_bookings(member_membership):
+    member = member_membership.member
+    member.update_liabilites()
+    assert member.balance == member._calc_balance() == -40
+    assert (
+        member.last_membership_fee_transaction_timestamp
+        == member._calc_last_membership_fee_transaction_timestamp()
+    )
+
+    t = Transaction.objects.create(
+        value_datetime=timezone.now(), user_or_context="test"
+    )
+    t.debit(account=SpecialAccounts.bank, amount=15, user_or_context="test")
+    t.credit(
+        account=SpecialAccounts.fees_receivable,
+        amount=15,
+        member=member,
+        user_or_context="test",
+    )
+    assert member.balance == member._calc_balance() == -25
+
+    t.reverse(user_or_context="test")
+    assert member.balance == member._calc_balance() == -40
+
+
+@pytest.mark.django_db
+def test_ledger_follows_moved_bookings(member_membership):
+    member = member_membership.member
+    other = Member.objects.create(number="008")
+    t = Transaction.objects.create(
+        value_datetime=timezone.now(), user_or_context="test"
+    )
+    t.debit(account=SpecialAccounts.bank, amount=15, user_or_context="test")
+    booking = t.credit(
+        account=SpecialAccounts.fees_receivable,
+        amount=15,
+        member=member,
+        user_or_context="test",
+    )
+    assert member.balance == 15
+    assert other.balance == 0
+
+    booking.member = other
+    booking.save()
+    member.refresh_from_db()
+    other.refresh_from_db()
+    assert member.balance == member._calc_balance() == 0
+    assert other.balance == other._calc_balance() == 15
+
+    t.value_datetime = timezone.now() + relativedelta(days=+10)
+    t.save()
+    other.refresh_from_db()
+    assert other.balance == other._calc_balance() == 0
+    assert other.last_membership_fee_transaction_timestamp is None
+
+
+@pytest.mark.django_db
+def test_ledger_ignores_unrelated_changes(member_membership):
+    member = member_membership.member
+    member.update_liabilites()
+    booking = (
+        member.bookings.select_related("transaction")
+        .filter(
+            debit_account=SpecialAccounts.fees_receivable,
+            transaction__value_datetime__lte=timezone.now(),
+        )
+        .first()
+    )
+    t = booking.transaction
+
+    with mock.patch.object(MemberLedger.objects, "rebuild") as rebuild:
+        booking.memo = "Changed memo"
+        booking.save()
+        t.memo = "Changed memo"
+        t.save()
+        booking.amount = booking.amount
+        booking.save(update_fields=["memo"])
+    rebuild.assert_not_called()
+
+    booking.amount += 5
+    booking.save()
+    member.refresh_from_db()
+    assert member.balance == member._calc_balance() == -45
+
+
+@pytest.mark.django_db
+def test_ledger_is_not_written_on_read(member_membership):
+    member = member_membership.member
+    member.update_liabilites()
+    MemberLedger.objects.filter(member=member).delete()
+
+    member.refresh_from_db()
+    assert member.balance == -40
+    assert not MemberLedger.objects.filter(member=member).exists()
+
+    call_command("runperiodic")
+    assert MemberLedger.objects.get(member=member).balance == -40
+
+
+@pytest.mark.django_db
+def test_ledger_future_booking_becomes_due(member_membership):
+    member = member_membership.member
+    member_membership.end = member_membership.end + relativedelta(months=+1)
+    member_membership.save()
+    member.update_liabilites()
+    assert member.balance == -40
+
+    with freeze_time(member_membership.end):
+        assert member.balance == member._calc_balance() == -60
+
+
+@pytest.mark.django_db
+def test_rebuild_member_ledger_command(member_membership):
+    member = member_membership.member
+    member.update_liabilites()
+    assert member.balance == -40
+    MemberLedger.objects.filter(member=member).update(balance=0)
+
+    out = StringIO()
+    call_command("rebuild_member_ledger", "--verify", stdout=out)
+    assert "balance: 0.00 -> -40" in out.getvalue()
+    assert MemberLedger.objects.get(member=member).balance == 0
+
+    call_command("rebuild_member_ledger", stdout=out)
+    assert MemberLedger.objects.get(member=member).balance == -40
+
+
+@pytest.mark.django_db
+def test_update_liabilities_command(member_membership):
+    other = Member.objects.create(number="008")
+    Membership.objects.create(
+        member=other,
+        start=member_membership.start,
+        amount=10,
+        interval=FeeIntervals.MONTHLY,
+    )
+    member_membership.member.update_liabilites()
+    member_membership.amount = 30
+    member_membership.save()
+
+    out = StringIO()
+    call_command(
+        "update_liabilities", "--batch-size", "1", "--commit-batches", stdout=out
+    )
+    assert "1/2 members" in out.getvalue()
+    assert "Done, 4 dues created and 2 dues reversed." in out.getvalue()
+    assert member_membership.member.balance == -60
+    assert other.balance == -20
+
+    due = Transaction.objects.filter(bookings__member=other).first()
+    assert [entry.action_type for entry in due.log_entries().order_by("pk")] == [
+        "byro.bookkeeping.transaction.created",
+        "byro.bookkeeping.transaction.credit.created",
+        "byro.bookkeeping.transaction.debit.created",
+    ]
+    reversed_due = Transaction.objects.filter(reversed_by__isnull=False).first()
+    assert reversed_due.log_entries().filter(
+        action_type="byro.bookkeeping.transaction.reversed"
+    )
+
+    call_command("update_liabilities", stdout=out)
+    assert "Done, 0 dues created and 0 dues reversed." in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_periodic_task_updates_dirty_liabilities(new_member):
+    other = Member.objects.create(number="008")
+    with freeze_time("2020-01-15"):
+        membership = Membership.objects.create(
+            member=new_member,
+            start=timezone.now().date().replace(month=1, day=1),
+            end=timezone.now().date().replace(month=12, day=31),
+            amount=20,
+            interval=FeeIntervals.ANNUALLY,
+        )
+        Membership.objects.create(
+            member=other,
+            start=timezone.now().date().replace(day=1),
+            amount=10,
+            interval=FeeIntervals.MONTHLY,
+        )
+        call_command("runperiodic")
+        assert new_member.balance == -20
+        assert other.balance == -10
+        assert not Member.objects.with_dirty_liabilities().exists()
+
+        membership.amount = 30
+        membership.save()
+        assert list(Member.objects.with_dirty_liabilities()) == [new_member]
+        call_command("runperiodic")
+        assert new_member.balance == -30
+        assert not Member.objects.with_dirty_liabilities().exists()
+
+    with freeze_time("2020-02-01"):
+        assert list(Member.objects.with_dirty_liabilities()) == [other]
+        call_command("runperiodic")
+        assert other.balance == -20
+        assert not Member.objects.with_dirty_liabilities().exists()
+
+        config = Configuration.get_solo()
+        config.accounting_start = timezone.now().date()
+        config.save()
+        assert Member.objects.with_dirty_liabilities().count() == 2
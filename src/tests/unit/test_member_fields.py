@@ -1,5 +1,6 @@
 import pytest
 
+from byro.common.models import Configuration
 from byro.members.models import Field, Member
 
 
@@ -61,3 +62,31 @@ def test_member_field_writing_sepa_iban(member):
 
     f["MemberSepa__iban"].setter(member, "DE491234567890")
     assert member.profile_sepa.iban == "DE491234567890"
+
+
+@pytest.mark.django_db
+def test_member_fields_cache(
+    django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    try:
+        with django_capture_on_commit_callbacks(execute=True):
+            fields = Member.get_fields()
+        with django_assert_num_queries(0):
+            assert Member.get_fields().keys() == fields.keys()
+        assert not fields["member__name"].registration_form
+
+        # Changes to the returned fields do not leak into the cache
+        fields["member__name"].registration_form["position"] = 2
+        fields["member__name"].read_only = True
+        assert not Member.get_fields()["member__name"].registration_form
+        assert not Member.get_fields()["member__name"].read_only
+
+        config = Configuration.get_solo()
+        config.registration_form = [{"name": "member__name", "position": 1}]
+        config.save()
+        with django_capture_on_commit_callbacks(execute=True):
+            fields = Member.get_fields()
+        assert fields["member__name"].registration_form["position"] == 1
+    finally:
+        # The cached configuration is rolled back after this test
+        Member.clear_fields_cache()